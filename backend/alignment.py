@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import LoadedVolume, LoadCancelled, voxel_array
+
+def _to_numpy(matrix):
+    if matrix is None: return np.eye(4)
+    return np.array([[matrix.GetElement(i, j) for j in range(4)] for i in range(4)])
+
+def world_matrix(loaded):
+    # Giong nibabel: uu tien sform, khong co thi qform, khong co ca hai thi coi nhu don vi
+    return _to_numpy(loaded.sform if loaded.sform is not None else loaded.qform)
+
+def index_matrix(image):
+    # Chi so voxel (i, j, k) -> toa do du lieu VTK (origin + i * spacing)
+    matrix = np.eye(4)
+    matrix[:3, :3] = np.diag(image.GetSpacing())
+    matrix[:3, 3] = image.GetOrigin()
+    return matrix
+
+def ct_to_seg_index(ct_loaded, seg_loaded):
+    # Ma tran 4x4: chi so voxel CT -> chi so voxel (so thuc) trong segmentation
+    ct_to_world = world_matrix(ct_loaded) @ index_matrix(ct_loaded.image)
+    seg_to_world = world_matrix(seg_loaded) @ index_matrix(seg_loaded.image)
+    return np.linalg.inv(seg_to_world) @ ct_to_world
+
+def _axis_indices(scale, offset, count, limit):
+    idx = np.rint(scale * np.arange(count) + offset).astype(np.int64)
+    valid = (idx >= 0) & (idx < limit)
+    return idx, valid
+
+def resample_labels(seg_loaded, ct_loaded, threads=None, cancel_event=None, tolerance=1e-4):
+    # Dua nhan ve dung luoi CT mot lan (lang gieng gan nhat). Ngoai vung seg -> nhan 0.
+    # Sau buoc nay voxel (i, j, k) cua seg trung voxel (i, j, k) cua CT.
+    transform = ct_to_seg_index(ct_loaded, seg_loaded)
+    ct_image = ct_loaded.image
+    nx, ny, nz = ct_image.GetDimensions()
+    source = voxel_array(seg_loaded.image)
+    snz, sny, snx = source.shape
+    if np.allclose(transform, np.eye(4), atol=tolerance) and (snx, sny, snz) == (nx, ny, nz):
+        return seg_loaded # Da cung luoi
+    out = np.zeros((nz, ny, nx), dtype=source.dtype)
+    rotation = transform[:3, :3]
+    if np.allclose(rotation, np.diag(np.diag(rotation)), atol=tolerance):
+        # Chi co ti le + tinh tien: chi so tach rieng tung truc, gom bang np.ix_
+        ix, vx = _axis_indices(transform[0, 0], transform[0, 3], nx, snx)
+        iy, vy = _axis_indices(transform[1, 1], transform[1, 3], ny, sny)
+        iz, vz = _axis_indices(transform[2, 2], transform[2, 3], nz, snz)
+        if vx.any() and vy.any() and vz.any():
+            out[np.ix_(vz, vy, vx)] = source[np.ix_(iz[vz], iy[vy], ix[vx])]
+    else:
+        # Truong hop tong quat (xoay, doi truc): tinh tung lat Z, chia cho nhieu thread
+        jj, ii = np.mgrid[0:ny, 0:nx].astype(np.float64)
+        base = [transform[r, 0] * ii + transform[r, 1] * jj + transform[r, 3] for r in range(3)]
+        limits = (snx, sny, snz)
+
+        def fill(k):
+            if cancel_event is not None and cancel_event.is_set(): return
+            coords = [np.rint(base[r] + transform[r, 2] * k).astype(np.int64) for r in range(3)]
+            valid = np.ones((ny, nx), dtype=bool)
+            for r in range(3):
+                valid &= (coords[r] >= 0) & (coords[r] < limits[r])
+            out[k][valid] = source[coords[2][valid], coords[1][valid], coords[0][valid]]
+
+        with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+            list(pool.map(fill, range(nz)))
+    if cancel_event is not None and cancel_event.is_set():
+        raise LoadCancelled(seg_loaded.file_path)
+    image = vtk.vtkImageData()
+    image.SetDimensions(nx, ny, nz)
+    image.SetSpacing(ct_image.GetSpacing())
+    image.SetOrigin(ct_image.GetOrigin())
+    scalars = numpy_support.numpy_to_vtk(out.ravel(), deep=False)
+    scalars.SetName("NIFTI")
+    image.GetPointData().SetScalars(scalars)
+    return LoadedVolume(seg_loaded.file_path, image, qform=ct_loaded.qform, sform=ct_loaded.sform,
+                        slope=seg_loaded.slope, intercept=seg_loaded.intercept)
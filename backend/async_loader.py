@@ -0,0 +1,114 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backend.volume_io import LoadCancelled
+
+class LoadJob:
+    def __init__(self, name, file_path):
+        self.name = name
+        self.file_path = file_path
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+class AsyncVolumeLoader:
+    # Giai nen volume tren thread phu, callback duoc goi lai tren thread Tk qua after()
+    POLL_MS = 50
+
+    def __init__(self, tk_root, max_workers=2, on_status=None):
+        self.root = tk_root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medview-load")
+        self.messages = queue.Queue()
+        self.callbacks = {} # job -> (on_done, on_progress, on_error, on_cancel)
+        self.on_status = on_status # on_status(message) tren thread Tk, cho canh bao khong lam hong viec doc
+        self._poll_id = None
+
+    def submit(self, name, load_fn, file_path, on_done, on_progress=None, on_error=None, on_cancel=None):
+        job = LoadJob(name, file_path)
+        self.callbacks[job] = (on_done, on_progress, on_error, on_cancel)
+
+        def report(done, total):
+            self.messages.put(("progress", job, (done, total)))
+
+        def run():
+            if job.is_cancelled(): # Bi huy truoc khi kip chay
+                self.messages.put(("cancelled", job, None))
+                return
+            try:
+                result = load_fn(file_path, progress_callback=report, cancel_event=job.cancel_event)
+            except LoadCancelled:
+                self.messages.put(("cancelled", job, None))
+            except Exception as e:
+                self.messages.put(("error", job, e))
+            else:
+                kind = "cancelled" if job.is_cancelled() else "done"
+                self.messages.put((kind, job, result))
+
+        job.future = self.executor.submit(run)
+        self._schedule_poll()
+        return job
+
+    def post_status(self, message):
+        # Goi duoc tu bat ky thread nao; hien ra o lan poll ke tiep
+        self.messages.put(("status", None, message))
+
+    def cancel_all(self):
+        for job in list(self.callbacks):
+            job.cancel()
+
+    def busy(self):
+        return bool(self.callbacks)
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        latest_progress = {}
+        finished = []
+        statuses = []
+        while True:
+            try:
+                kind, job, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                latest_progress[job] = payload # Gop nhieu tin progress thanh 1 lan cap nhat
+            elif kind == "status":
+                statuses.append(payload)
+            else:
+                finished.append((kind, job, payload))
+        for job, (done, total) in latest_progress.items():
+            callbacks = self.callbacks.get(job)
+            if callbacks and callbacks[1] and not job.is_cancelled():
+                callbacks[1](job, done, total)
+        for kind, job, payload in finished:
+            callbacks = self.callbacks.pop(job, None)
+            if not callbacks: continue
+            on_done, _, on_error, on_cancel = callbacks
+            if kind == "done":
+                on_done(job, payload)
+            elif kind == "error" and on_error:
+                on_error(job, payload)
+            elif kind == "cancelled" and on_cancel:
+                on_cancel(job)
+        for message in statuses: # Sau on_done de thong bao khong bi "Loaded: ..." ghi de
+            if self.on_status: self.on_status(message)
+        if self.callbacks:
+            self._schedule_poll()
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
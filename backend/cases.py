@@ -0,0 +1,72 @@
+import csv
+import os
+
+NIFTI_SUFFIXES = (".nii.gz", ".nii")
+SEG_SUFFIXES = ("_seg", "_segmentation", "_label", "_labels", "_mask", "-seg", "-label")
+CT_SUFFIXES = ("_ct", "_image", "_img", "_0000", "-ct")
+SEG_PREFIXES = {"segmentation-": "volume-", "seg_": "", "label_": "", "mask_": ""} # Quy uoc kieu LiTS
+IMAGE_DIRS = ("imagesTr", "imagesTs", "images") # Quy uoc kieu nnU-Net / MSD: cung ten file
+LABEL_DIRS = ("labelsTr", "labelsTs", "labels")
+
+def case_name(path):
+    name = os.path.basename(path)
+    for suffix in NIFTI_SUFFIXES:
+        if name.endswith(suffix): return name[:-len(suffix)]
+    return name
+
+def _is_nifti(name):
+    return name.endswith(NIFTI_SUFFIXES)
+
+def _seg_stem(stem):
+    # Ten segmentation -> ten CT tuong ung (None neu khong giong ten segmentation)
+    for suffix in SEG_SUFFIXES:
+        if stem.endswith(suffix): return stem[:-len(suffix)]
+    for prefix, replacement in SEG_PREFIXES.items():
+        if stem.startswith(prefix): return replacement + stem[len(prefix):]
+    return None
+
+def _ct_keys(stem):
+    # Cac ten co the cua segmentation di kem CT: chinh ten do, hoac bo hau to _ct / _0000 (nnU-Net)...
+    return [stem] + [stem[:-len(suffix)] for suffix in CT_SUFFIXES if stem.endswith(suffix)]
+
+def _match(segs, ct_file):
+    for key in _ct_keys(case_name(ct_file)):
+        if key in segs: return segs[key]
+    return None
+
+def find_pairs(directory):
+    # Tim cac cap (CT, segmentation hoac None) trong thu muc, sap xep theo ten ca
+    for images, labels in zip(IMAGE_DIRS, LABEL_DIRS):
+        image_dir, label_dir = os.path.join(directory, images), os.path.join(directory, labels)
+        if os.path.isdir(image_dir):
+            segs = {}
+            if os.path.isdir(label_dir):
+                segs = {case_name(n): os.path.join(label_dir, n) for n in os.listdir(label_dir) if _is_nifti(n)}
+            return [(os.path.join(image_dir, n), _match(segs, n))
+                    for n in sorted(os.listdir(image_dir)) if _is_nifti(n)]
+    files = sorted(n for n in os.listdir(directory) if _is_nifti(n))
+    segs, cts = {}, []
+    for name in files:
+        ct_stem = _seg_stem(case_name(name))
+        if ct_stem is not None:
+            segs[ct_stem] = os.path.join(directory, name)
+        else:
+            cts.append(name)
+    return [(os.path.join(directory, n), _match(segs, n)) for n in cts]
+
+def read_pairs_csv(path):
+    # CSV: cot 1 = CT, cot 2 = segmentation (co the trong). Dong dau la tieu de neu cot 1 khong phai file NIfTI
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith("#") or not _is_nifti(row[0]): continue
+            ct = os.path.join(base, row[0])
+            seg = os.path.join(base, row[1]) if len(row) > 1 and row[1] else None
+            pairs.append((ct, seg))
+    return pairs
+
+def load_pairs(source):
+    # Thu muc hoac file CSV
+    return read_pairs_csv(source) if os.path.isfile(source) else find_pairs(source)
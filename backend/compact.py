@@ -0,0 +1,76 @@
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import LoadedVolume, voxel_array
+from backend.roi import bounding_extent
+
+LABEL_DTYPES = (np.uint8, np.uint16, np.uint32)
+
+def smallest_label_dtype(max_label):
+    # Kieu so nguyen khong dau nho nhat chua duoc nhan lon nhat (thuong la uint8)
+    for dtype in LABEL_DTYPES:
+        if max_label <= np.iinfo(dtype).max: return dtype
+    return np.int64
+
+def compact_labels(loaded, margin=1):
+    # Nhan luu gon: ep ve kieu nguyen nho nhat va chi giu hop bao cac voxel > 0 (+ le margin voxel).
+    # Hop bao giu nguyen chi so voxel cua luoi goc qua extent cua vtkImageData (origin khong doi)
+    # -> voxel (i, j, k) cua nhan van nam dung cho voxel (i, j, k) cua CT, ca 2D lan 3D.
+    image = loaded.image
+    full = image.GetExtent()
+    extent = bounding_extent(image, 0)
+    if extent is None:
+        extent = (full[0], full[0], full[2], full[2], full[4], full[4]) # Khong co nhan: giu 1 voxel
+    else:
+        extent = tuple(max(extent[i] - margin, full[i]) if i % 2 == 0 else min(extent[i] + margin, full[i])
+                       for i in range(6))
+    voxels = voxel_array(image)
+    block = voxels[extent[4] - full[4]:extent[5] - full[4] + 1,
+                   extent[2] - full[2]:extent[3] - full[2] + 1,
+                   extent[0] - full[0]:extent[1] - full[0] + 1]
+    if block.dtype.kind == "f":
+        block = np.rint(block) # Nhan luu dang float (0.0, 1.0, 2.0...)
+    block = np.clip(block, 0, None)
+    dtype = smallest_label_dtype(int(block.max()) if block.size else 0)
+    compact = np.ascontiguousarray(block, dtype=dtype)
+    result = vtk.vtkImageData()
+    result.SetExtent(extent)
+    result.SetSpacing(image.GetSpacing())
+    result.SetOrigin(image.GetOrigin())
+    scalars = numpy_support.numpy_to_vtk(compact.ravel(), deep=False) # VTK giu tham chieu toi mang
+    scalars.SetName("NIFTI")
+    result.GetPointData().SetScalars(scalars)
+    out = LoadedVolume(loaded.file_path, result, qform=loaded.qform, sform=loaded.sform,
+                       slope=loaded.slope, intercept=loaded.intercept)
+    out.derived["compaction"] = {"before": int(voxels.nbytes), "after": int(compact.nbytes),
+                                 "dtype": np.dtype(dtype).name, "extent": extent}
+    return out
+
+def compaction_saved_bytes(loaded):
+    info = loaded.derived.get("compaction") if loaded else None
+    return info["before"] - info["after"] if info else 0
+
+def compact_hu(loaded, chunk_slices=32):
+    # CT luu dang int16 theo HU: ap slope/intercept mot lan luc tai, sau do coi slope = 1, intercept = 0.
+    # Duyet theo khoi lat cat de ban float tam thoi khong chiem ca volume.
+    image = loaded.image
+    voxels = voxel_array(image)
+    if voxels.dtype == np.int16 and loaded.slope in (0.0, 1.0) and loaded.intercept == 0.0:
+        return loaded # Da gon san
+    slope = loaded.slope or 1.0
+    limits = np.iinfo(np.int16)
+    out = np.empty(voxels.shape, dtype=np.int16)
+    for z0 in range(0, voxels.shape[0], chunk_slices):
+        block = voxels[z0:z0 + chunk_slices].astype(np.float32) * slope + loaded.intercept
+        out[z0:z0 + chunk_slices] = np.clip(np.rint(block), limits.min, limits.max)
+    result = vtk.vtkImageData()
+    result.SetExtent(image.GetExtent())
+    result.SetSpacing(image.GetSpacing())
+    result.SetOrigin(image.GetOrigin())
+    scalars = numpy_support.numpy_to_vtk(out.ravel(), deep=False)
+    scalars.SetName("NIFTI")
+    result.GetPointData().SetScalars(scalars)
+    compact = LoadedVolume(loaded.file_path, result, qform=loaded.qform, sform=loaded.sform)
+    compact.derived["compaction"] = {"before": int(voxels.nbytes), "after": int(out.nbytes),
+                                     "dtype": "int16", "extent": tuple(image.GetExtent())}
+    return compact
@@ -1,197 +1,252 @@
 import vtk
+from backend.label_tf import LabelTable, count_labels, LIVER_LABEL
+from backend.slice_view import FusedSliceView
+from backend.slice_cache import SlicePrefetcher
+from backend.instrument import timed
+from backend.probe import VoxelProbe, display_to_slice, distance_mm
+
 class MPRInteractorStyle(vtk.vtkInteractorStyleTrackballCamera):
     def __init__(self, parent=None):
         self.parent = parent
+        self.wl_view = None # Khung 2D dang keo chuot phai de chinh window/level
+        self.wl_start = None
         self.AddObserver("MouseWheelForwardEvent", self.OnMouseWheelForward)
         self.AddObserver("MouseWheelBackwardEvent", self.OnMouseWheelBackward)
         self.AddObserver("LeftButtonPressEvent", self.OnLeftButtonDown)
+        self.AddObserver("RightButtonPressEvent", self.OnRightButtonDown)
+        self.AddObserver("RightButtonReleaseEvent", self.OnRightButtonUp)
+        self.AddObserver("MouseMoveEvent", self.OnMouseMove)
 
     def _get_target(self):
-        if not self.parent: return None, None, None
+        if not self.parent: return None, None
         x, y = self.GetInteractor().GetEventPosition()
         renderer = self.GetInteractor().FindPokedRenderer(x, y)
         if renderer in self.parent.renderer_map:
-            data = self.parent.renderer_map[renderer]
-            return renderer, data["ct"], data["seg"]
-        return None, None, None
+            return renderer, self.parent.renderer_map[renderer]
+        return None, None
 
     def OnMouseWheelForward(self, obj, event):
-        renderer, ct_widget, seg_widget = self._get_target()
-        if ct_widget:
-            self._update_slice(renderer, ct_widget, seg_widget, 1)
+        renderer, view = self._get_target()
+        if view:
+            self._update_slice(renderer, view, 1)
             return 
         super().OnMouseWheelForward()
 
     def OnMouseWheelBackward(self, obj, event):
-        renderer, ct_widget, seg_widget = self._get_target()
-        if ct_widget:
-            self._update_slice(renderer, ct_widget, seg_widget, -1)
+        renderer, view = self._get_target()
+        if view:
+            self._update_slice(renderer, view, -1)
             return 
         super().OnMouseWheelBackward()
 
-    def _update_slice(self, renderer, ct_widget, seg_widget, direction):
-        current = ct_widget.GetSliceIndex()
-        axis = ct_widget.GetPlaneOrientation()
-        max_slice = ct_widget.GetInput().GetDimensions()[axis] - 1
+    @timed("mpr.scroll")
+    def _update_slice(self, renderer, view, direction):
         step = 10 if self.GetInteractor().GetShiftKey() else 1
-        if direction > 0:
-            new_slice = min(current + step, max_slice)
-        else:
-            new_slice = max(current - step, 0)
-        ct_widget.SetSliceIndex(new_slice)
-        if seg_widget:
-            seg_widget.SetSliceIndex(new_slice)
-            ct_widget.InvokeEvent("InteractionEvent")
-        renderer.ResetCameraClippingRange()
-        self.GetInteractor().Render()
+        # Lat cat thuc su duoc cat/hien o lan ve ke tiep -> cuon nhanh hon toc do ve chi ve lat cuoi
+        if not view.set_slice(view.slice_index + step * direction, step): return # Da o lat dau/cuoi
+        self.parent.request_render(interactive=True)
 
+    # Click trai tren khung 2D: lay diem do khoang cach (2 diem -> khoang cach, click thu 3 bat dau lai)
     def OnLeftButtonDown(self, obj, event):
-        renderer, ct_widget, _ = self._get_target()
-        if ct_widget:
-            pass 
+        renderer, view = self._get_target()
+        if view:
+            x, y = self.GetInteractor().GetEventPosition()
+            self.parent.add_measure_point(renderer, view, x, y)
         else:
             super().OnLeftButtonDown()
 
+    # Chuot phai tren khung 2D: keo ngang = window, keo doc = level (nhu vtkImagePlaneWidget cu)
+    def OnRightButtonDown(self, obj, event):
+        renderer, view = self._get_target()
+        if view:
+            self.wl_view = view
+            self.wl_start = (self.GetInteractor().GetEventPosition(), view.window, view.level)
+            return
+        super().OnRightButtonDown()
+
+    def OnMouseMove(self, obj, event):
+        if self.wl_view:
+            (x0, y0), window, level = self.wl_start
+            x, y = self.GetInteractor().GetEventPosition()
+            low, high = self.wl_view.scalar_range
+            scale = max(high - low, 1.0) / 500.0
+            self.wl_view.set_window_level(max(1.0, window + (x - x0) * scale), level - (y - y0) * scale)
+            self.parent.request_render(interactive=True)
+            return
+        renderer, view = self._get_target()
+        if view:
+            x, y = self.GetInteractor().GetEventPosition()
+            self.parent.probe_at(renderer, view, x, y)
+        super().OnMouseMove()
+
+    def OnRightButtonUp(self, obj, event):
+        if self.wl_view:
+            self.wl_view = None
+            self.parent.request_render()
+            return
+        super().OnRightButtonUp()
+
 class MPRViewer:
-    def __init__(self, vtk_window, vtk_renderer_3d, ct_data, seg_data=None, initial_opacity=0.6):
+    @timed("mpr.build")
+    def __init__(self, vtk_window, vtk_renderer_3d, ct_data, seg_data=None, initial_opacity=0.6, render_callback=None, label_table=None,
+                 window_level=None, scalar_range=None, hu_rescale=None, probe_callback=None, measure_callback=None):
         self.window = vtk_window
+        self.render_callback = render_callback # Neu co: gui yeu cau ve qua RenderScheduler thay vi Render() ngay
         self.ct_data = ct_data
         self.seg_data = seg_data 
         self.current_liver_opacity = initial_opacity
         self.seg_lut = None
+        self.label_table = label_table # Dung chung voi volume 3D -> doi mau/opacity mot cho, ca hai cung cap nhat
+        self.window_level = window_level # (window, level) ban dau cho ca 3 khung, vd. tu histogram CT
+        self.scalar_range = scalar_range
+        self.hu_rescale = hu_rescale or (1.0, 0.0) # (slope, intercept) doi gia tri voxel CT sang HU
+        self.probe_callback = probe_callback # Nhan ket qua do HU/nhan duoi con tro moi lan chuot di chuyen
+        self.measure_callback = measure_callback # Nhan (cac diem, khoang cach mm hoac None) khi click do
+        self.probe = None
+        self.measure_points = [] # (renderer, diem the gioi)
+        self.measure_actor = None
+        self.measure_renderer = None
         self.ren_axial = vtk.vtkRenderer()
         self.ren_coronal = vtk.vtkRenderer()
         self.ren_sagittal = vtk.vtkRenderer()
         self.ren_3d = vtk_renderer_3d 
-        self.ct_widgets = [] 
-        self.seg_widgets = []
+        self.views = [] # FusedSliceView cho Axial, Coronal, Sagittal
+        self.prefetcher = SlicePrefetcher() # Tinh truoc lat cat ke tiep theo huong cuon
         self.renderer_map = {} 
+        self.visible = True
         self._setup_viewports()
         self._setup_planes()
-        style = MPRInteractorStyle(parent=self)
-        self.window.GetInteractor().SetInteractorStyle(style)
+        self.style = MPRInteractorStyle(parent=self)
+        self.window.GetInteractor().SetInteractorStyle(self.style)
+
+    GAP = 0.002
+    HALF = 0.5
 
     def _setup_viewports(self):
-        GAP = 0.002
-        HALF = 0.5
-        self.ren_axial.SetViewport(0.0, HALF + GAP, HALF - GAP, 1.0)
+        self.ren_axial.SetViewport(0.0, self.HALF + self.GAP, self.HALF - self.GAP, 1.0)
         self.ren_axial.SetBackground(0.1, 0.1, 0.1)
         self.window.AddRenderer(self.ren_axial)
-        self.ren_coronal.SetViewport(HALF + GAP, HALF + GAP, 1.0, 1.0)
+        self.ren_coronal.SetViewport(self.HALF + self.GAP, self.HALF + self.GAP, 1.0, 1.0)
         self.ren_coronal.SetBackground(0.1, 0.1, 0.1)
         self.window.AddRenderer(self.ren_coronal)
-        self.ren_sagittal.SetViewport(0.0, 0.0, HALF - GAP, HALF - GAP)
+        self.ren_sagittal.SetViewport(0.0, 0.0, self.HALF - self.GAP, self.HALF - self.GAP)
         self.ren_sagittal.SetBackground(0.1, 0.1, 0.1)
         self.window.AddRenderer(self.ren_sagittal)
-        self.ren_3d.SetViewport(HALF + GAP, 0.0, 1.0, HALF - GAP)
+        self.ren_3d.SetViewport(self.HALF + self.GAP, 0.0, 1.0, self.HALF - self.GAP)
+
+    # An/hien bo cuc MPR ma khong huy pipeline lat cat, camera, LUT -> bat lai gan nhu tuc thi
+    def hide(self):
+        if not self.visible: return
+        for ren in (self.ren_axial, self.ren_coronal, self.ren_sagittal):
+            self.window.RemoveRenderer(ren)
+        self.ren_3d.SetViewport(0, 0, 1, 1)
+        self.window.GetInteractor().SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
+        self.visible = False
+
+    def show(self):
+        if self.visible: return
+        for ren in (self.ren_axial, self.ren_coronal, self.ren_sagittal):
+            self.window.AddRenderer(ren)
+        self.ren_3d.SetViewport(self.HALF + self.GAP, 0.0, 1.0, self.HALF - self.GAP)
+        self.window.GetInteractor().SetInteractorStyle(self.style)
+        self.visible = True
 
     def _get_dynamic_lut(self):
         if not self.seg_data: return None
-        scalar_range = self.seg_data.GetScalarRange()
-        max_val = scalar_range[1]
-        
-        self.seg_lut = vtk.vtkLookupTable()
-        
-        if max_val <= 1.0:
-            self.seg_lut.SetNumberOfTableValues(2)
-            self.seg_lut.SetRange(0, 1)
-            self.seg_lut.Build()
-            self.seg_lut.SetTableValue(0, 0.0, 0.0, 0.0, 0.0)
-            self.seg_lut.SetTableValue(1, 1.0, 0.8, 0.0, self.current_liver_opacity)
-        else:
-            self.seg_lut.SetNumberOfTableValues(3)
-            self.seg_lut.SetRange(0, 2)
-            self.seg_lut.Build()
-            self.seg_lut.SetTableValue(0, 0.0, 0.0, 0.0, 0.0)
-            self.seg_lut.SetTableValue(1, 0.0, 1.0, 0.0, self.current_liver_opacity)
-            self.seg_lut.SetTableValue(2, 1.0, 0.0, 0.0, 0.6)
+        if self.label_table is None: # Khong co bang nhan tu backend -> tu dem nhan co trong volume
+            self.label_table = LabelTable(count_labels(self.seg_data), liver_opacity=self.current_liver_opacity)
+        self.seg_lut = self.label_table.lut
         return self.seg_lut
 
     def update_liver_opacity(self, opacity):
         self.current_liver_opacity = opacity
-        if self.seg_lut:
-            color = [0.0, 0.0, 0.0, 0.0]
-            self.seg_lut.GetTableValue(1, color)
-            self.seg_lut.SetTableValue(1, color[0], color[1], color[2], opacity)
+        if self.label_table:
+            self.label_table.set_opacity(LIVER_LABEL, opacity)
+            self.request_render(interactive=True)
+
+    def request_render(self, interactive=False):
+        if self.render_callback:
+            self.render_callback(interactive=interactive)
+        else:
             self.window.Render()
 
+    @timed("mpr.window_level")
+    def set_window_level(self, window, level):
+        # Chi doi tham so cua bo loc mau, khong quet lai voxel
+        self.window_level = (window, level)
+        for view in self.views:
+            view.set_window_level(window, level)
+        self.request_render()
+
+    def _get_probe(self):
+        if self.probe is None:
+            self.probe = VoxelProbe(self.ct_data, self.seg_data, *self.hu_rescale)
+        return self.probe
+
+    def probe_at(self, renderer, view, x, y):
+        # Tinh toan hoc + doc mang: du nhanh de goi moi su kien chuot; ben nhan tu gioi han toc do cap nhat hien thi
+        if not self.probe_callback or view.slice_index is None: return None
+        sample = self._get_probe().sample(display_to_slice(renderer, x, y, self.ct_data, view.axis, view.slice_index))
+        self.probe_callback(sample)
+        return sample
+
+    def add_measure_point(self, renderer, view, x, y):
+        if view.slice_index is None: return
+        if len(self.measure_points) >= 2:
+            self.clear_measurement()
+        point = display_to_slice(renderer, x, y, self.ct_data, view.axis, view.slice_index)
+        self.measure_points.append((renderer, point))
+        distance = None
+        if len(self.measure_points) == 2:
+            (ren_a, a), (ren_b, b) = self.measure_points
+            distance = distance_mm(a, b)
+            if ren_a is ren_b:
+                self._show_measure_line(renderer, view, a, b)
+        if self.measure_callback:
+            self.measure_callback([p for _, p in self.measure_points], distance)
+
+    def _show_measure_line(self, renderer, view, a, b):
+        # Day doan thang ve phia camera nua voxel de khong bi anh lat cat che
+        towards = renderer.GetActiveCamera().GetDirectionOfProjection()
+        shift = 0.5 * self.ct_data.GetSpacing()[view.axis]
+        line = vtk.vtkLineSource()
+        line.SetPoint1(*[a[i] - towards[i] * shift for i in range(3)])
+        line.SetPoint2(*[b[i] - towards[i] * shift for i in range(3)])
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputConnection(line.GetOutputPort())
+        self.measure_actor = vtk.vtkActor()
+        self.measure_actor.SetMapper(mapper)
+        self.measure_actor.GetProperty().SetColor(1.0, 0.85, 0.0)
+        self.measure_actor.GetProperty().SetLineWidth(2)
+        renderer.AddActor(self.measure_actor)
+        self.measure_renderer = renderer
+        self.request_render()
+
+    def clear_measurement(self):
+        if self.measure_actor:
+            self.measure_renderer.RemoveActor(self.measure_actor)
+            self.measure_actor = self.measure_renderer = None
+            self.request_render()
+        self.measure_points = []
+
     def _setup_planes(self):
-        interactor = self.window.GetInteractor()
-        if not interactor: return
-        picker = vtk.vtkCellPicker()
-        picker.SetTolerance(0.005)
-        interactor.SetPicker(picker)
         planes_config = [
-            (2, self.ren_axial,    (1, 0, 0), "Axial"),
-            (1, self.ren_coronal,  (0, 1, 0), "Coronal"),
-            (0, self.ren_sagittal, (0, 0, 1), "Sagittal")
+            (2, self.ren_axial,    "Axial"),
+            (1, self.ren_coronal,  "Coronal"),
+            (0, self.ren_sagittal, "Sagittal")
         ]
-        ct_dims = self.ct_data.GetDimensions()
         bounds = self.ct_data.GetBounds()
         center = self.ct_data.GetCenter()
         max_dim = max(bounds[1]-bounds[0], bounds[3]-bounds[2], bounds[5]-bounds[4])
         cam_distance = max_dim * 1.5
-        seg_dims = self.seg_data.GetDimensions() if self.seg_data else None
         seg_lut = self._get_dynamic_lut()
-        for axis, renderer, color, name in planes_config:
+        for axis, renderer, name in planes_config:
             try:
-                plane_ct = vtk.vtkImagePlaneWidget()
-                plane_ct.SetInteractor(interactor)
-                plane_ct.SetInputData(self.ct_data)
-                plane_ct.SetPlaneOrientation(axis)
-                plane_ct.SetSliceIndex(ct_dims[axis] // 2)
-                plane_ct.GetPlaneProperty().SetColor(color)
-                plane_ct.DisplayTextOn()
-                plane_ct.SetDefaultRenderer(renderer)
-                plane_ct.On()
-                self.ct_widgets.append(plane_ct)
-                plane_seg = None
-                
-                if self.seg_data and seg_lut:
-                    plane_seg = vtk.vtkImagePlaneWidget()
-                    plane_seg.SetInteractor(interactor)
-                    plane_seg.SetInputData(self.seg_data)
-                    plane_seg.SetPlaneOrientation(axis)
-                    safe_slice = min(plane_ct.GetSliceIndex(), seg_dims[axis] - 1)
-                    plane_seg.SetSliceIndex(safe_slice)
-                    plane_seg.SetLookupTable(seg_lut)
-                    
-                    plane_seg.SetUserControlledLookupTable(True)
-                    plane_seg.TextureVisibilityOn() 
-                    plane_seg.TextureInterpolateOff()
-                    
-                    plane_seg.GetPlaneProperty().SetOpacity(0.0) 
-                    plane_seg.GetPlaneProperty().SetColor(0.0, 0.0, 0.0)
-                    
-                    plane_seg.DisplayTextOff()
-                    plane_seg.SetDefaultRenderer(renderer)
-                    plane_seg.On() 
-                    plane_seg.InteractionOff()
-                    self.seg_widgets.append(plane_seg)
-                    
-                    def hard_sync_geometry(obj, event):
-                        if plane_seg:
-                            idx = obj.GetSliceIndex()
-                            if 0 <= idx < seg_dims[axis]:
-                                plane_seg.SetSliceIndex(idx)
-                            plane_seg.UpdatePlacement()
-                            o = plane_seg.GetOrigin()
-                            p1 = plane_seg.GetPoint1()
-                            p2 = plane_seg.GetPoint2()
-                            normal = plane_seg.GetNormal()
-                            epsilon = 0.1 
-                            new_o = (o[0] + normal[0]*epsilon, o[1] + normal[1]*epsilon, o[2] + normal[2]*epsilon)
-                            new_p1 = (p1[0] + normal[0]*epsilon, p1[1] + normal[1]*epsilon, p1[2] + normal[2]*epsilon)
-                            new_p2 = (p2[0] + normal[0]*epsilon, p2[1] + normal[1]*epsilon, p2[2] + normal[2]*epsilon)
-                            plane_seg.SetOrigin(new_o)
-                            plane_seg.SetPoint1(new_p1)
-                            plane_seg.SetPoint2(new_p2)
-                            renderer.ResetCameraClippingRange()
-                            
-                    plane_ct.AddObserver("InteractionEvent", hard_sync_geometry)
-                    hard_sync_geometry(plane_ct, None)
-                    
-                self.renderer_map[renderer] = {"ct": plane_ct, "seg": plane_seg}
+                # Mot pipeline duy nhat moi khung: CT + nhan tron san thanh 1 anh RGBA
+                view = FusedSliceView(renderer, self.ct_data, axis, self.seg_data, seg_lut, prefetcher=self.prefetcher,
+                                      window_level=self.window_level, scalar_range=self.scalar_range)
+                self.views.append(view)
+                self.renderer_map[renderer] = view
                 cam = renderer.GetActiveCamera()
                 cam.SetParallelProjection(True)
                 if axis == 2:   
@@ -208,11 +263,16 @@ class MPRViewer:
             except Exception as e:
                 print(f"Lỗi tạo khung {name}: {e}")
 
+    # Huy han - chi goi khi dong ca hoac du lieu thay doi
     def clear(self):
-        style = vtk.vtkInteractorStyleTrackballCamera()
-        self.window.GetInteractor().SetInteractorStyle(style)
-        for w in self.ct_widgets: w.Off()
-        for w in self.seg_widgets: w.Off()
-        self.ct_widgets.clear()
-        self.seg_widgets.clear()
-        self.renderer_map.clear()
\ No newline at end of file
+        self.hide()
+        self.clear_measurement()
+        if self.probe: self.probe.clear()
+        self.probe = None
+        self.prefetcher.shutdown()
+        for view in self.views:
+            view.actor.ReleaseGraphicsResources(self.window) # Texture lat cat tren GPU
+            view.remove()
+        self.views.clear()
+        self.renderer_map.clear()
+        self.ct_data = self.seg_data = None
@@ -0,0 +1,76 @@
+import math
+import numpy as np
+from backend.volume_io import voxel_array
+
+HU_MIN = -1024
+HU_MAX = 3071
+DEFAULT_MAX_SAMPLES = 8_000_000 # Volume lon hon thi lay mau thua deu theo ca 3 truc
+BODY_HU = -500 # Bo khong khi khi tinh cua so tu dong
+# (window, level) theo HU
+WINDOW_PRESETS = {
+    "abdomen": (400.0, 40.0),
+    "liver": (150.0, 60.0),
+    "bone": (1800.0, 400.0),
+}
+
+class CTHistogram:
+    # Histogram HU (moi bin 1 HU) cua CT, tinh mot lan luc tai va luu trong loaded.derived.
+    # Moi preset / cua so tu dong / ham truyen 3D deu doc tu day, khong quet lai voxel.
+    def __init__(self, loaded, max_samples=DEFAULT_MAX_SAMPLES, chunk_slices=32):
+        self.slope = loaded.slope or 1.0
+        self.intercept = loaded.intercept
+        voxels = voxel_array(loaded.image)
+        self.step = max(1, math.ceil((voxels.size / max_samples) ** (1.0 / 3.0)))
+        sample = voxels[::self.step, ::self.step, ::self.step]
+        self.counts = np.zeros(HU_MAX - HU_MIN + 1, dtype=np.int64)
+        for z0 in range(0, sample.shape[0], chunk_slices):
+            hu = np.rint(sample[z0:z0 + chunk_slices].astype(np.float32) * self.slope + self.intercept)
+            index = np.clip(hu, HU_MIN, HU_MAX).astype(np.intp).ravel() - HU_MIN
+            self.counts += np.bincount(index, minlength=len(self.counts))
+        self._cumulative = {}
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes
+
+    def percentile(self, q, low=HU_MIN):
+        # Phan vi q (0-100) cua cac voxel >= low (HU)
+        start = int(np.clip(low, HU_MIN, HU_MAX)) - HU_MIN
+        cumulative = self._cumulative.get(start)
+        if cumulative is None:
+            cumulative = self._cumulative[start] = np.cumsum(self.counts[start:])
+        if not cumulative[-1]: return float(low)
+        return float(np.searchsorted(cumulative, q / 100.0 * cumulative[-1]) + start + HU_MIN)
+
+    def mode(self, low, high):
+        start, stop = int(low) - HU_MIN, int(high) - HU_MIN + 1
+        return float(np.argmax(self.counts[start:stop]) + low)
+
+    def auto_window(self, low_q=1.0, high_q=99.0):
+        # Cua so bao tron phan lon mo trong co the (bo khong khi) -> (window, level) theo HU
+        low = self.percentile(low_q, BODY_HU)
+        high = self.percentile(high_q, BODY_HU)
+        return max(high - low, 1.0), 0.5 * (low + high)
+
+    def preset(self, name):
+        if name == "auto": return self.auto_window()
+        return WINDOW_PRESETS[name]
+
+    def to_raw(self, window, level):
+        # (window, level) HU -> don vi tho cua voxel (khi CT chua doi sang int16 HU)
+        return window / self.slope, (level - self.intercept) / self.slope
+
+    def hu_to_raw(self, hu):
+        return float((hu - self.intercept) / self.slope)
+
+    def value_range(self):
+        # (min, max) don vi tho cua cac bin co voxel (da cat ve [HU_MIN, HU_MAX])
+        nonzero = np.flatnonzero(self.counts)
+        if not nonzero.size: return self.hu_to_raw(HU_MIN), self.hu_to_raw(HU_MAX)
+        return self.hu_to_raw(nonzero[0] + HU_MIN), self.hu_to_raw(nonzero[-1] + HU_MIN)
+
+    def tissue_peak(self):
+        return self.mode(-150, 150)
+
+    def high_value(self):
+        return self.percentile(99.9, BODY_HU)
@@ -0,0 +1,120 @@
+import csv
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+DEFAULT_SAMPLES = 4096 # Moi thao tac giu toi da chung nay mau gan nhat de tinh phan vi
+DEFAULT_STATS_DIR = os.environ.get("MEDVIEW_STATS_DIR", os.path.join(os.path.expanduser("~"), ".medview", "stats"))
+
+class _OpStats:
+    def __init__(self, max_samples):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+class Instrumentation:
+    # Dem so lan + do tre (p50/p95/p99) cua tung thao tac nong (doc file, ham truyen, lat cat, Render).
+    # Tat (mac dinh) thi moi diem do chi con mot phep kiem tra `enabled`.
+    def __init__(self, enabled=False, max_samples=DEFAULT_SAMPLES):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self.ops = {}
+        self._lock = threading.Lock() # Thread doc file cung ghi vao
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def record(self, name, seconds):
+        with self._lock:
+            op = self.ops.get(name)
+            if op is None:
+                op = self.ops[name] = _OpStats(self.max_samples)
+            op.count += 1
+            op.total += seconds
+            op.max = max(op.max, seconds)
+            op.samples.append(seconds)
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def reset(self):
+        with self._lock:
+            self.ops.clear()
+
+    def snapshot(self):
+        # {ten: {count, total_ms, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}, don vi ms
+        with self._lock:
+            ops = {name: (op.count, op.total, op.max, list(op.samples)) for name, op in self.ops.items()}
+        result = {}
+        for name, (count, total, peak, samples) in sorted(ops.items()):
+            p50, p95, p99 = np.percentile(samples, (50, 95, 99)) if samples else (0.0, 0.0, 0.0)
+            result[name] = {
+                "count": count,
+                "total_ms": total * 1000.0,
+                "mean_ms": total / count * 1000.0 if count else 0.0,
+                "p50_ms": float(p50) * 1000.0,
+                "p95_ms": float(p95) * 1000.0,
+                "p99_ms": float(p99) * 1000.0,
+                "max_ms": peak * 1000.0,
+            }
+        return result
+
+    def dump(self, directory=DEFAULT_STATS_DIR, prefix="medview-stats"):
+        # Ghi ra <prefix>-<thoi gian>.json va .csv, tra ve duong dan json (None neu chua do gi)
+        stats = self.snapshot()
+        if not stats: return None
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+        with open(base + ".csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            columns = ["count", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+            writer.writerow(["op"] + columns)
+            for name, row in stats.items():
+                writer.writerow([name] + [f"{row[c]:.3f}" if c != "count" else row[c] for c in columns])
+        return base + ".json"
+
+class _Span:
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_SPAN = _NullSpan()
+
+# Mot bo do dung chung cho ca ung dung; bat san bang MEDVIEW_INSTRUMENT=1
+INSTRUMENTS = Instrumentation(enabled=os.environ.get("MEDVIEW_INSTRUMENT", "0") == "1")
+
+def timed(name):
+    # Decorator: do thoi gian ham duoi ten `name` khi INSTRUMENTS dang bat
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTS.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                INSTRUMENTS.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,136 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import LoadCancelled, voxel_array, file_identity, DEFAULT_CACHE_DIR
+
+DEFAULT_TARGET_TRIANGLES = 200000 # Moi nhan toi da chung nay tam giac sau khi giam luoi
+DEFAULT_SMOOTH_ITERATIONS = 20
+MESH_CACHE_VERSION = 1 # Tang khi doi thuat toan de bo cache cu
+
+def _label_extent(voxels, label, chunk_slices=32):
+    # Hop bao (x0, x1, y0, y1, z0, z1) cua mot nhan theo chi so mang numpy
+    nz, ny, nx = voxels.shape
+    any_z = np.zeros(nz, dtype=bool)
+    any_y = np.zeros(ny, dtype=bool)
+    any_x = np.zeros(nx, dtype=bool)
+    for z0 in range(0, nz, chunk_slices):
+        mask = voxels[z0:z0 + chunk_slices] == label
+        any_z[z0:z0 + chunk_slices] = mask.any(axis=(1, 2))
+        any_y |= mask.any(axis=(0, 2))
+        any_x |= mask.any(axis=(0, 1))
+    if not any_z.any(): return None
+    xs, ys, zs = np.flatnonzero(any_x), np.flatnonzero(any_y), np.flatnonzero(any_z)
+    return (int(xs[0]), int(xs[-1]), int(ys[0]), int(ys[-1]), int(zs[0]), int(zs[-1]))
+
+def _label_mask(image, label):
+    # Mask 0/1 cua nhan, cat theo hop bao cua nhan va them 1 voxel 0 moi phia de mat luoi kin
+    voxels = voxel_array(image)
+    box = _label_extent(voxels, label)
+    if box is None: return None
+    x0, x1, y0, y1, z0, z1 = box
+    mask = np.zeros((z1 - z0 + 3, y1 - y0 + 3, x1 - x0 + 3), dtype=np.uint8)
+    mask[1:-1, 1:-1, 1:-1] = voxels[z0:z1 + 1, y0:y1 + 1, x0:x1 + 1] == label
+    offset = image.GetExtent()[::2]
+    result = vtk.vtkImageData()
+    result.SetExtent(x0 + offset[0] - 1, x1 + offset[0] + 1, y0 + offset[1] - 1, y1 + offset[1] + 1,
+                     z0 + offset[2] - 1, z1 + offset[2] + 1)
+    result.SetSpacing(image.GetSpacing())
+    result.SetOrigin(image.GetOrigin()) # Giu origin -> luoi nam dung cho volume/CT trong toa do du lieu
+    result.GetPointData().SetScalars(numpy_support.numpy_to_vtk(mask.ravel(), deep=False))
+    return result
+
+def extract_label_mesh(image, label, target_triangles=DEFAULT_TARGET_TRIANGLES,
+                       smooth_iterations=DEFAULT_SMOOTH_ITERATIONS):
+    # Flying edges roi rac -> lam min windowed sinc -> giam luoi toi target_triangles -> phap tuyen
+    mask = _label_mask(image, label)
+    if mask is None: return None
+    surface = vtk.vtkDiscreteFlyingEdges3D()
+    surface.SetInputData(mask)
+    surface.SetValue(0, 1)
+    surface.ComputeNormalsOff()
+    surface.ComputeGradientsOff()
+    smoother = vtk.vtkWindowedSincPolyDataFilter()
+    smoother.SetInputConnection(surface.GetOutputPort())
+    smoother.SetNumberOfIterations(smooth_iterations)
+    smoother.SetPassBand(0.05)
+    smoother.NormalizeCoordinatesOn() # On dinh so hoc voi toa do mm lon
+    smoother.BoundarySmoothingOff()
+    smoother.FeatureEdgeSmoothingOff()
+    smoother.NonManifoldSmoothingOn()
+    smoother.Update()
+    output = smoother.GetOutputPort()
+    triangles = smoother.GetOutput().GetNumberOfPolys()
+    if triangles > target_triangles:
+        decimate = vtk.vtkQuadricDecimation()
+        decimate.SetInputConnection(output)
+        decimate.SetTargetReduction(1.0 - target_triangles / triangles)
+        output = decimate.GetOutputPort()
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputConnection(output)
+    normals.SplittingOff()
+    normals.ConsistencyOn()
+    normals.Update()
+    mesh = vtk.vtkPolyData()
+    mesh.ShallowCopy(normals.GetOutput())
+    return mesh
+
+def mesh_cache_dir(cache_dir, seg_path, ct_path=None, target_triangles=DEFAULT_TARGET_TRIANGLES,
+                   smooth_iterations=DEFAULT_SMOOTH_ITERATIONS):
+    # Khoa = file segmentation (+ CT vi nhan da dua ve luoi CT) + tham so trich luoi
+    key = repr((MESH_CACHE_VERSION, file_identity(seg_path), file_identity(ct_path) if ct_path else None,
+                target_triangles, smooth_iterations))
+    return os.path.join(cache_dir, "meshes", hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+def _read_mesh(path):
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(path)
+    reader.Update()
+    mesh = vtk.vtkPolyData()
+    mesh.ShallowCopy(reader.GetOutput())
+    return mesh
+
+def _write_mesh(path, mesh):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.SetFileName(tmp_path)
+    writer.SetInputData(mesh)
+    writer.SetDataModeToAppended()
+    writer.SetCompressorTypeToLZ4()
+    if writer.Write():
+        os.replace(tmp_path, path)
+
+def build_label_meshes(image, labels, seg_path=None, ct_path=None, cache_dir=DEFAULT_CACHE_DIR,
+                       target_triangles=DEFAULT_TARGET_TRIANGLES, smooth_iterations=DEFAULT_SMOOTH_ITERATIONS,
+                       threads=None, cancel_event=None):
+    # {nhan: vtkPolyData}. Doc tu cache tren dia neu co, thieu nhan nao thi trich song song tung nhan
+    directory = None
+    if cache_dir and seg_path:
+        directory = mesh_cache_dir(cache_dir, seg_path, ct_path, target_triangles, smooth_iterations)
+    meshes = {}
+    missing = []
+    for label in labels:
+        path = os.path.join(directory, f"label_{label}.vtp") if directory else None
+        if path and os.path.exists(path):
+            meshes[label] = _read_mesh(path)
+        else:
+            missing.append(label)
+
+    def extract(label):
+        if cancel_event is not None and cancel_event.is_set(): return None
+        return extract_label_mesh(image, label, target_triangles, smooth_iterations)
+
+    if missing:
+        # vtkDiscreteFlyingEdges3D tu chia luong ben trong; them mot thread moi nhan de cac nhan chay chong len nhau
+        with ThreadPoolExecutor(max_workers=threads or min(len(missing), os.cpu_count() or 1)) as pool:
+            for label, mesh in zip(missing, pool.map(extract, missing)):
+                if mesh is None: continue
+                meshes[label] = mesh
+                if directory and not (cancel_event is not None and cancel_event.is_set()):
+                    _write_mesh(os.path.join(directory, f"label_{label}.vtp"), mesh)
+    if cancel_event is not None and cancel_event.is_set():
+        raise LoadCancelled(seg_path)
+    return meshes
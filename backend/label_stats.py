@@ -0,0 +1,171 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import numpy as np
+from backend.volume_io import voxel_array
+
+DEFAULT_CHUNK_SLICES = 32
+CSV_FIELDS = ["case", "label", "count", "volume_ml", "mean_hu", "std_hu",
+              "centroid_x", "centroid_y", "centroid_z", "x0", "x1", "y0", "y1", "z0", "z1"]
+
+def _chunk_sums(seg_block, ct_block, z_offset, slope, intercept):
+    # Chi xet voxel co nhan: dem, tong toa do, tong HU, tong HU^2 va hop bao theo tung nhan
+    flat = np.flatnonzero(seg_block)
+    if not flat.size: return {}
+    labels = seg_block.ravel()[flat].astype(np.intp)
+    z, y, x = np.unravel_index(flat, seg_block.shape)
+    z = z + z_offset
+    size = int(labels.max()) + 1
+    sums = {
+        "count": np.bincount(labels, minlength=size),
+        "x": np.bincount(labels, weights=x, minlength=size),
+        "y": np.bincount(labels, weights=y, minlength=size),
+        "z": np.bincount(labels, weights=z, minlength=size),
+    }
+    if ct_block is not None:
+        hu = ct_block.ravel()[flat].astype(np.float64) * slope + intercept
+        sums["hu"] = np.bincount(labels, weights=hu, minlength=size)
+        sums["hu2"] = np.bincount(labels, weights=hu * hu, minlength=size)
+    # Hop bao cung trong luot nay: min/max theo nhan bang ufunc.at, khong quet lai voxel cho tung nhan
+    low = np.full((3, size), np.iinfo(np.intp).max, dtype=np.intp)
+    high = np.full((3, size), -1, dtype=np.intp)
+    for axis, coords in enumerate((x, y, z)):
+        np.minimum.at(low[axis], labels, coords)
+        np.maximum.at(high[axis], labels, coords)
+    boxes = {}
+    for label in np.flatnonzero(sums["count"]):
+        boxes[int(label)] = (low[0, label], high[0, label], low[1, label], high[1, label], low[2, label], high[2, label])
+    return {"sums": sums, "boxes": boxes}
+
+def _merge(total, part):
+    if not part: return total
+    if not total: return part
+    for key, values in part["sums"].items():
+        mine = total["sums"][key]
+        if len(values) > len(mine):
+            values = values.copy()
+            values[:len(mine)] += mine
+            total["sums"][key] = values
+        else:
+            mine[:len(values)] += values
+    for label, box in part["boxes"].items():
+        old = total["boxes"].get(label)
+        total["boxes"][label] = box if old is None else (
+            min(old[0], box[0]), max(old[1], box[1]), min(old[2], box[2]),
+            max(old[3], box[3]), min(old[4], box[4]), max(old[5], box[5]))
+    return total
+
+def label_statistics(seg_image, ct_loaded=None, chunk_slices=DEFAULT_CHUNK_SLICES, threads=None):
+    # Mot luot qua mang nhan (chia khoi lat cat cho nhieu thread):
+    # {nhan: count, volume_ml, bbox, centroid (chi so voxel), centroid_mm, mean_hu, std_hu}.
+    # Nhan phai nam tren luoi CT (sau align_segmentation), co the da cat gon theo extent.
+    seg = voxel_array(seg_image)
+    x0, y0, z0 = seg_image.GetExtent()[::2]
+    ct = None
+    slope, intercept = 1.0, 0.0
+    if ct_loaded is not None:
+        ct = voxel_array(ct_loaded.image)
+        slope, intercept = ct_loaded.slope or 1.0, ct_loaded.intercept
+    ny, nx = seg.shape[1:]
+
+    def work(k):
+        ct_block = None
+        if ct is not None:
+            ct_block = ct[z0 + k:z0 + k + chunk_slices, y0:y0 + ny, x0:x0 + nx]
+        return _chunk_sums(seg[k:k + chunk_slices], ct_block, k, slope, intercept)
+
+    total = None
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+        for part in pool.map(work, range(0, seg.shape[0], chunk_slices)):
+            total = _merge(total, part)
+    if not total: return {}
+    spacing = seg_image.GetSpacing()
+    origin = seg_image.GetOrigin()
+    voxel_ml = spacing[0] * spacing[1] * spacing[2] / 1000.0
+    sums = total["sums"]
+    stats = {}
+    for label in sorted(total["boxes"]):
+        if label == 0: continue
+        count = int(sums["count"][label])
+        centroid = (sums["x"][label] / count + x0, sums["y"][label] / count + y0, sums["z"][label] / count + z0)
+        box = total["boxes"][label]
+        entry = {
+            "count": count,
+            "volume_ml": count * voxel_ml,
+            "bbox": (int(box[0]) + x0, int(box[1]) + x0, int(box[2]) + y0, int(box[3]) + y0,
+                     int(box[4]) + z0, int(box[5]) + z0),
+            "centroid": tuple(float(c) for c in centroid),
+            "centroid_mm": tuple(float(origin[a] + centroid[a] * spacing[a]) for a in range(3)),
+            "mean_hu": None,
+            "std_hu": None,
+        }
+        if "hu" in sums:
+            mean = sums["hu"][label] / count
+            entry["mean_hu"] = float(mean)
+            entry["std_hu"] = float(np.sqrt(max(sums["hu2"][label] / count - mean * mean, 0.0)))
+        stats[label] = entry
+    return stats
+
+def stats_rows(name, stats):
+    rows = []
+    for label, entry in stats.items():
+        rows.append({
+            "case": name, "label": label, "count": entry["count"], "volume_ml": round(entry["volume_ml"], 3),
+            "mean_hu": None if entry["mean_hu"] is None else round(entry["mean_hu"], 2),
+            "std_hu": None if entry["std_hu"] is None else round(entry["std_hu"], 2),
+            "centroid_x": round(entry["centroid"][0], 2), "centroid_y": round(entry["centroid"][1], 2),
+            "centroid_z": round(entry["centroid"][2], 2),
+            "x0": entry["bbox"][0], "x1": entry["bbox"][1], "y0": entry["bbox"][2],
+            "y1": entry["bbox"][3], "z0": entry["bbox"][4], "z1": entry["bbox"][5],
+        })
+    return rows
+
+def case_statistics(ct_path, seg_path):
+    # Dung cho chay khong giao dien: doc, dua nhan ve luoi CT, luu gon roi thong ke
+    from backend.volume_io import load_volume
+    from backend.alignment import resample_labels
+    from backend.compact import compact_labels
+    from backend.cases import case_name
+    ct_loaded = load_volume(ct_path, cache_dir=None)
+    seg_loaded = compact_labels(resample_labels(load_volume(seg_path, cache_dir=None), ct_loaded))
+    return stats_rows(case_name(ct_path), label_statistics(seg_loaded.image, ct_loaded))
+
+def main(argv=None):
+    from backend.cases import load_pairs
+    parser = argparse.ArgumentParser(prog="python -m backend.label_stats",
+                                     description="The tich, so voxel, trong tam, HU cua tung nhan cho ca thu muc ca")
+    parser.add_argument("source", help="Thu muc chua cap CT/segmentation hoac file CSV (ct, seg)")
+    parser.add_argument("--output", help="File ket qua (.csv hoac .json), mac dinh in CSV ra man hinh")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    pairs = [(ct, seg) for ct, seg in load_pairs(args.source) if seg]
+    rows = []
+    failed = 0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(pairs) or 1)), mp_context=context) as pool:
+        futures = {pool.submit(case_statistics, ct, seg): ct for ct, seg in pairs}
+        for future in as_completed(futures):
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"LOI  {futures[future]}: {e}", file=sys.stderr)
+    rows.sort(key=lambda row: (row["case"], row["label"]))
+    if args.output and args.output.endswith(".json"):
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    else:
+        f = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        if args.output: f.close()
+    if failed: raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
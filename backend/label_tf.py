@@ -0,0 +1,130 @@
+import colorsys
+import numpy as np
+import vtk
+from backend.volume_io import voxel_array
+
+# Mac dinh cho 2 nhan cu: 1 = Gan (xanh la, opacity theo slider), 2 = Khoi U (do, luon hien ro)
+DEFAULT_LABEL_COLORS = {1: (0.0, 1.0, 0.0), 2: (1.0, 0.0, 0.0)}
+DEFAULT_LABEL_OPACITY = {2: 1.0}
+OTHER_LABEL_OPACITY = 0.6
+LIVER_LABEL = 1
+
+class LabelTransferFunction:
+    # Ham truyen mau/opacity cho volume nhan, dung mot lan cho moi segmentation.
+    # Moi nhan L co 4 diem: (L-0.45, 0) (L-0.4, a) (L+0.4, a) (L+0.45, 0) -> doi opacity
+    # cua mot nhan chi sua 2 diem tai cho, khong tao lai ham (mapper khong phai dung lai tu dau).
+    HALF_WIDTH = 0.4
+    EDGE = 0.45
+
+    def __init__(self, labels):
+        # labels: {label_id: (r, g, b, opacity)}
+        self.opacity = vtk.vtkPiecewiseFunction()
+        self.color = vtk.vtkColorTransferFunction()
+        self.labels = {}
+        self.node_index = {} # label -> chi so node dau tien cua plateau trong opacity/color
+        self.opacity.AddPoint(0.0, 0.0) # Nen luon tang hinh
+        self.color.AddRGBPoint(0.0, 0.0, 0.0, 0.0)
+        for rank, label in enumerate(sorted(labels)):
+            r, g, b, a = labels[label]
+            self.opacity.AddPoint(label - self.EDGE, 0.0)
+            self.opacity.AddPoint(label - self.HALF_WIDTH, a)
+            self.opacity.AddPoint(label + self.HALF_WIDTH, a)
+            self.opacity.AddPoint(label + self.EDGE, 0.0)
+            self.color.AddRGBPoint(label - self.HALF_WIDTH, r, g, b)
+            self.color.AddRGBPoint(label + self.HALF_WIDTH, r, g, b)
+            self.node_index[label] = (2 + 4 * rank, 1 + 2 * rank)
+            self.labels[label] = [r, g, b, a]
+
+    def set_opacity(self, label, opacity):
+        if label not in self.labels or self.labels[label][3] == opacity: return
+        self.labels[label][3] = opacity
+        first, _ = self.node_index[label]
+        for index in (first, first + 1):
+            node = [0.0] * 4
+            self.opacity.GetNodeValue(index, node)
+            node[1] = opacity
+            self.opacity.SetNodeValue(index, node)
+
+    def set_color(self, label, r, g, b):
+        if label not in self.labels: return
+        self.labels[label][:3] = [r, g, b]
+        _, first = self.node_index[label]
+        for index in (first, first + 1):
+            node = [0.0] * 6
+            self.color.GetNodeValue(index, node)
+            node[1:4] = [r, g, b]
+            self.color.SetNodeValue(index, node)
+
+    def get_opacity(self, label):
+        return self.labels[label][3] if label in self.labels else None
+
+def label_color(label):
+    if label in DEFAULT_LABEL_COLORS: return DEFAULT_LABEL_COLORS[label]
+    hue = (label * 0.618033988749895) % 1.0 # Ti le vang -> cac nhan lien ke co mau khac xa nhau
+    return colorsys.hsv_to_rgb(hue, 0.75, 1.0)
+
+def count_labels(image, chunk_slices=64):
+    # So voxel cua moi nhan (> 0) bang bincount, duyet theo khoi lat cat
+    voxels = voxel_array(image)
+    counts = np.zeros(1, dtype=np.int64)
+    for z0 in range(0, voxels.shape[0], chunk_slices):
+        block = voxels[z0:z0 + chunk_slices]
+        if block.dtype.kind == "f":
+            block = np.rint(block) # Nhan luu dang float (0.0, 1.0, 2.0...)
+        block = np.clip(block, 0, None).astype(np.int64, copy=False).ravel()
+        chunk_counts = np.bincount(block)
+        if len(chunk_counts) > len(counts):
+            chunk_counts[:len(counts)] += counts
+            counts = chunk_counts
+        else:
+            counts[:len(chunk_counts)] += chunk_counts
+    return {int(label): int(counts[label]) for label in np.flatnonzero(counts) if label > 0}
+
+class LabelTable:
+    # Mot nguon duy nhat cho mau / opacity / an-hien cua tung nhan:
+    # dieu khien ca ham truyen 3D (transfer_function) va LUT 2D (lut).
+    def __init__(self, label_ids, liver_opacity=0.6):
+        self.entries = {}
+        for label in sorted(label_ids):
+            opacity = liver_opacity if label == LIVER_LABEL else DEFAULT_LABEL_OPACITY.get(label, OTHER_LABEL_OPACITY)
+            self.entries[label] = {"color": tuple(label_color(label)), "opacity": opacity, "visible": True}
+        self.transfer_function = LabelTransferFunction(
+            {label: tuple(e["color"]) + (e["opacity"],) for label, e in self.entries.items()})
+        max_label = max(self.entries, default=1)
+        self.lut = vtk.vtkLookupTable()
+        self.lut.SetNumberOfTableValues(max_label + 1)
+        self.lut.SetTableRange(-0.5, max_label + 0.5) # Gia tri v -> o thu round(v)
+        self.lut.Build()
+        for index in range(max_label + 1):
+            self.lut.SetTableValue(index, 0.0, 0.0, 0.0, 0.0)
+        for label in self.entries:
+            self._update_lut(label)
+
+    def labels(self):
+        return list(self.entries)
+
+    def _effective_opacity(self, label):
+        entry = self.entries[label]
+        return entry["opacity"] if entry["visible"] else 0.0
+
+    def _update_lut(self, label):
+        r, g, b = self.entries[label]["color"]
+        self.lut.SetTableValue(label, r, g, b, self._effective_opacity(label))
+
+    def set_opacity(self, label, opacity):
+        if label not in self.entries: return
+        self.entries[label]["opacity"] = opacity
+        self.transfer_function.set_opacity(label, self._effective_opacity(label))
+        self._update_lut(label)
+
+    def set_visible(self, label, visible):
+        if label not in self.entries: return
+        self.entries[label]["visible"] = visible
+        self.transfer_function.set_opacity(label, self._effective_opacity(label))
+        self._update_lut(label)
+
+    def set_color(self, label, r, g, b):
+        if label not in self.entries: return
+        self.entries[label]["color"] = (r, g, b)
+        self.transfer_function.set_color(label, r, g, b)
+        self._update_lut(label)
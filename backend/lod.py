@@ -0,0 +1,152 @@
+import vtk
+
+DEFAULT_PYRAMID_LEVELS = 2
+DEFAULT_TARGET_FPS = 15.0
+
+class VolumePyramid:
+    # Cac ban thu nho 2x cua volume, tinh mot lan luc tai. levels[0] = ban goc
+    MIN_DIM = 16
+
+    def __init__(self, image, levels=DEFAULT_PYRAMID_LEVELS, labels=False):
+        self.levels = [image]
+        current = image
+        for _ in range(levels):
+            dims = current.GetDimensions()
+            factors = [2 if d >= 2 * self.MIN_DIM else 1 for d in dims]
+            if factors == [1, 1, 1]: break
+            shrink = vtk.vtkImageShrink3D()
+            shrink.SetInputData(current)
+            shrink.SetShrinkFactors(factors)
+            # Nhan phan doan khong duoc lay trung binh (1 va 2 -> 1.5 la sai nhan)
+            shrink.SetAveraging(0 if labels else 1)
+            shrink.Update()
+            current = vtk.vtkImageData()
+            current.ShallowCopy(shrink.GetOutput())
+            self.levels.append(current)
+
+    @property
+    def nbytes(self):
+        return sum(level.GetActualMemorySize() * 1024 for level in self.levels[1:])
+
+class _LODEntry:
+    def __init__(self, volume, pyramid):
+        self.volume = volume
+        self.pyramid = pyramid
+        self.mapper = vtk.vtkSmartVolumeMapper()
+        self.mapper.AutoAdjustSampleDistancesOff()
+        self.proxy = vtk.vtkVolume()
+        self.proxy.SetMapper(self.mapper)
+        self.proxy.SetProperty(volume.GetProperty()) # Dung chung property -> doi opacity/mau van dong bo
+        self.proxy.PickableOff()
+        self.level = None
+        self.active = False
+        self.volume_visible = True # An/hien cua volume goc truoc khi thay bang proxy
+
+    def show_proxy(self, renderer, level, sample_factor):
+        level = min(level, len(self.pyramid.levels) - 1)
+        if level <= 0: return
+        if level != self.level:
+            image = self.pyramid.levels[level]
+            self.mapper.SetInputData(image)
+            self.mapper.SetSampleDistance(min(image.GetSpacing()) * sample_factor)
+            self.level = level
+        self.proxy.SetUserMatrix(self.volume.GetUserMatrix())
+        source = self.volume.GetMapper() # Giu nguyen vung cat ROI cua volume goc
+        self.mapper.SetCropping(source.GetCropping())
+        self.mapper.SetCroppingRegionPlanes(source.GetCroppingRegionPlanes())
+        self.mapper.SetCroppingRegionFlags(source.GetCroppingRegionFlags())
+        if not renderer.HasViewProp(self.proxy):
+            renderer.AddViewProp(self.proxy)
+        if not self.active:
+            self.volume_visible = bool(self.volume.GetVisibility())
+        self.volume.VisibilityOff()
+        self.proxy.SetVisibility(self.volume_visible)
+        self.active = True
+
+    def restore(self, renderer):
+        if not self.active: return
+        self.proxy.VisibilityOff()
+        renderer.RemoveViewProp(self.proxy)
+        self.volume.SetVisibility(self.volume_visible)
+        self.active = False
+
+    def set_visibility(self, visible):
+        # Dang xoay: volume goc dang tat tam -> doi proxy va ghi nho gia tri de restore() tra lai
+        if self.active:
+            self.volume_visible = bool(visible)
+            self.proxy.SetVisibility(visible)
+        else:
+            self.volume.SetVisibility(visible)
+
+class InteractiveLOD:
+    # Khi interactor style dang xoay/zoom, no dat DesiredUpdateRate cua cua so len cao;
+    # luc do ve volume thu nho + buoc lay mau thua. Tha chuot -> style Render() o toc do "still"
+    # -> tra lai volume goc. Khong phu thuoc style nao dang duoc gan (trackball, MPR, ...).
+    INTERACTIVE_RATE = 1.0 # Still update rate mac dinh cua VTK la 0.0001
+
+    def __init__(self, renderer, target_fps=DEFAULT_TARGET_FPS, sample_factor=2.0):
+        self.renderer = renderer
+        self.target_fps = target_fps
+        self.sample_factor = sample_factor
+        self.enabled = True
+        self.level = 1 # Muc pyramid dung khi tuong tac, tu dieu chinh theo FPS do duoc
+        self.entries = {}
+        self.interacting = False
+        self._frame_times = []
+        self.renderer.AddObserver("StartEvent", self._on_render_start)
+        self.renderer.AddObserver("EndEvent", self._on_render_end)
+
+    def attach(self, interactor):
+        interactor.SetDesiredUpdateRate(self.target_fps)
+
+    def set_volume(self, name, volume, pyramid):
+        self.remove_volume(name)
+        if pyramid is not None and len(pyramid.levels) > 1:
+            self.entries[name] = _LODEntry(volume, pyramid)
+
+    def remove_volume(self, name):
+        entry = self.entries.pop(name, None)
+        if entry: entry.restore(self.renderer)
+
+    def set_visibility(self, volume, visible):
+        # An/hien volume goc phai di qua day: khi dang tuong tac proxy moi la thu dang duoc ve
+        for entry in self.entries.values():
+            if entry.volume is volume:
+                entry.set_visibility(visible)
+                return
+        volume.SetVisibility(visible)
+
+    def clear(self):
+        for name in list(self.entries):
+            self.remove_volume(name)
+        self.interacting = False
+
+    def _on_render_start(self, obj, event):
+        window = obj.GetRenderWindow()
+        interactive = (self.enabled and window is not None
+                       and window.GetDesiredUpdateRate() >= self.INTERACTIVE_RATE)
+        if interactive and not self.interacting and self.entries:
+            self.interacting = True
+            self._frame_times = []
+            for entry in self.entries.values():
+                if entry.volume.GetVisibility() and self.renderer.HasViewProp(entry.volume):
+                    entry.show_proxy(self.renderer, self.level, self.sample_factor)
+        elif not interactive and self.interacting:
+            self.interacting = False
+            for entry in self.entries.values():
+                entry.restore(self.renderer)
+            self._adapt_level()
+
+    def _on_render_end(self, obj, event):
+        if self.interacting:
+            self._frame_times.append(obj.GetLastRenderTimeInSeconds())
+
+    def _adapt_level(self):
+        if not self._frame_times: return
+        frame_time = sorted(self._frame_times)[len(self._frame_times) // 2]
+        budget = 1.0 / self.target_fps
+        max_level = max(len(e.pyramid.levels) - 1 for e in self.entries.values()) if self.entries else 1
+        if frame_time > budget and self.level < max_level:
+            self.level += 1
+        elif frame_time < 0.5 * budget and self.level > 1:
+            self.level -= 1
@@ -0,0 +1,147 @@
+import gc
+import os
+import weakref
+
+import ctypes
+import ctypes.util
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+SECTIONS = ("reader", "derived", "mapper", "mpr")
+
+def buffer_bytes(obj):
+    if obj is None: return 0
+    if hasattr(obj, "GetActualMemorySize"): return obj.GetActualMemorySize() * 1024
+    return int(getattr(obj, "nbytes", 0))
+
+def _buffer_key(obj):
+    # Cung mot doi tuong C++ VTK co the co nhieu vo Python -> so sanh bang dia chi (__this__)
+    return getattr(obj, "__this__", None) or id(obj)
+
+def process_rss():
+    # RSS hien tai (byte). Tren Linux doc /proc, noi khac chi co dinh RSS qua resource (0 neu khong co)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None: return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def release_free_heap():
+    # glibc giu lai trang heap da free de dung lai -> tra ve he dieu hanh de RSS phan anh dung bo nho con dung
+    name = ctypes.util.find_library("c")
+    if not name: return
+    libc = ctypes.CDLL(name)
+    if hasattr(libc, "malloc_trim"):
+        libc.malloc_trim(0)
+
+def peak_rss():
+    # Dinh RSS cua tien trinh (byte): VmHWM tren Linux, ru_maxrss o noi khac
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None: return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def _pyramid_levels(loaded):
+    pyramid = loaded.derived.get("pyramid") if loaded else None
+    return pyramid.levels[1:] if pyramid else []
+
+def case_buffers(helper, mpr_viewer=None):
+    # Liet ke bo dem cua ca dang mo: (muc, ten, doi tuong vtkImageData hoac mang numpy)
+    buffers = []
+    for name, loaded in (("ct", helper.ct_source), ("seg", helper.seg_source)):
+        if loaded is None: continue
+        buffers.append(("reader", name, loaded.image))
+        for level, image in enumerate(_pyramid_levels(loaded), 1):
+            buffers.append(("derived", f"{name}_pyramid_{level}", image))
+    for name, mapper in (("ct", helper.mapper_ct), ("seg", helper.mapper_seg)):
+        image = mapper.GetInput()
+        if image is not None:
+            buffers.append(("mapper", name, image))
+    if mpr_viewer is not None:
+        for view in mpr_viewer.views:
+            buffers.extend(("mpr", name, obj) for name, obj in view.buffers())
+    return buffers
+
+def cached_buffers(volume_cache):
+    # Cac bo dem ma VolumeCache chu dong giu lai de mo lai ca nhanh (khong tinh la ro ri)
+    buffers = []
+    for loaded in volume_cache.volumes():
+        buffers.append(loaded.image)
+        buffers.extend(_pyramid_levels(loaded))
+    return buffers
+
+def memory_report(helper, mpr_viewer=None):
+    # So byte theo tung muc; "total" dem moi bo dem mot lan (dau vao mapper thuong chinh la anh doc tu file)
+    report = {section: 0 for section in SECTIONS}
+    seen = set()
+    total = 0
+    for section, _, obj in case_buffers(helper, mpr_viewer):
+        nbytes = buffer_bytes(obj)
+        report[section] += nbytes
+        key = _buffer_key(obj)
+        if key not in seen:
+            seen.add(key)
+            total += nbytes
+    report["total"] = total
+    report["cache"] = helper.volume_cache.stats()["bytes"]
+    report["rss"] = process_rss()
+    return report
+
+def format_report(report):
+    mb = lambda n: f"{n / 2**20:.1f} MB"
+    lines = [f"{section}: {mb(report[section])}" for section in SECTIONS]
+    lines.append(f"total (khong trung): {mb(report['total'])}")
+    lines.append(f"volume cache: {mb(report['cache'])}")
+    lines.append(f"RSS: {mb(report['rss'])}")
+    return "\n".join(lines)
+
+def _owner(obj):
+    # Doi tuong thuc su giu bo nho: mang scalars cua vtkImageData (vo Python cua anh/GetOutput() chet ngay
+    # ca khi ben C++ con giu), hoac chinh mang numpy
+    if hasattr(obj, "GetPointData"): return obj.GetPointData().GetScalars()
+    return obj
+
+class ReleaseCheck:
+    # Giu tham chieu toi mang du lieu cua moi bo dem truoc khi dong ca; sau khi dong goi leaked() de xem
+    # con mang nao duoc ben khac giu ngoai nhung cai VolumeCache giu co chu dich.
+    # Mang VTK: con song neu GetReferenceCount() > 1 (1 = chinh vo Python ta dang giu).
+    # Mang numpy (lat cat trong SliceCache): weakref.
+    def __init__(self, helper, mpr_viewer=None):
+        self.rss_before = process_rss()
+        self.rss_after = None
+        self.refs = {} # khoa -> (muc, ten, so byte, mang VTK hoac weakref numpy)
+        for section, name, obj in case_buffers(helper, mpr_viewer):
+            owner = _owner(obj)
+            if owner is None: continue
+            key = _buffer_key(owner)
+            if key in self.refs: continue
+            nbytes = buffer_bytes(owner)
+            self.refs[key] = (section, name, nbytes, owner if hasattr(owner, "GetReferenceCount") else weakref.ref(owner))
+        self.tracked_bytes = sum(entry[2] for entry in self.refs.values())
+
+    def leaked(self, keep=()):
+        # Goi mot lan sau khi dong ca: tra ve [(muc, ten, so byte)], bo cac tham chieu dang giu roi do RSS
+        gc.collect()
+        kept = {_buffer_key(owner) for owner in map(_owner, keep) if owner is not None}
+        leaked = []
+        for key, (section, name, nbytes, ref) in self.refs.items():
+            if key in kept: continue
+            alive = ref.GetReferenceCount() > 1 if hasattr(ref, "GetReferenceCount") else ref() is not None
+            if alive:
+                leaked.append((section, name, nbytes))
+        self.refs = {}
+        gc.collect()
+        release_free_heap()
+        self.rss_after = process_rss()
+        return leaked
@@ -0,0 +1,64 @@
+import math
+from backend.volume_io import voxel_array
+
+def world_to_index(image, point):
+    # Toa do du lieu (mm) -> chi so voxel (i, j, k) so thuc: nghich dao cua origin + D * (ijk * spacing)
+    origin = image.GetOrigin()
+    spacing = image.GetSpacing()
+    offset = [point[a] - origin[a] for a in range(3)]
+    direction = image.GetDirectionMatrix()
+    if not direction.IsIdentity(): # D truc chuan -> nghich dao = chuyen vi
+        offset = [sum(direction.GetElement(r, c) * offset[r] for r in range(3)) for c in range(3)]
+    return tuple(offset[a] / spacing[a] for a in range(3))
+
+def index_to_world(image, index):
+    origin = image.GetOrigin()
+    spacing = image.GetSpacing()
+    scaled = [index[a] * spacing[a] for a in range(3)]
+    direction = image.GetDirectionMatrix()
+    if not direction.IsIdentity():
+        scaled = [sum(direction.GetElement(r, c) * scaled[c] for c in range(3)) for r in range(3)]
+    return tuple(origin[a] + scaled[a] for a in range(3))
+
+def display_to_slice(renderer, x, y, image, axis, index):
+    # Diem man hinh tren khung 2D -> diem the gioi nam dung tren mat lat cat `index` cua truc `axis`.
+    # Camera song song nhin doc truc nen chi can nghich dao ma tran camera, khong do hinh hoc nhu picker
+    renderer.SetDisplayPoint(x, y, 0.0)
+    renderer.DisplayToWorld()
+    wx, wy, wz, w = renderer.GetWorldPoint()
+    point = [wx / w, wy / w, wz / w] if w else [wx, wy, wz]
+    plane = index_to_world(image, [index if a == axis else 0 for a in range(3)])
+    point[axis] = plane[axis]
+    return tuple(point)
+
+def distance_mm(a, b):
+    return math.dist(a, b)
+
+class VoxelProbe:
+    # Doc HU + nhan tai mot diem the gioi bang chi so truc tiep vao mang numpy (O(1), khong copy)
+    def __init__(self, ct_image, seg_image=None, slope=1.0, intercept=0.0):
+        self.ct_image = ct_image
+        self.ct_voxels = voxel_array(ct_image)
+        self.ct_extent = ct_image.GetExtent()
+        self.seg_voxels = voxel_array(seg_image) if seg_image is not None else None
+        self.seg_extent = seg_image.GetExtent() if seg_image is not None else None # Nhan luu gon: extent rieng
+        self.slope = slope or 1.0
+        self.intercept = intercept
+
+    def sample(self, point):
+        # {point, index, hu, label} hoac None neu diem nam ngoai volume CT
+        index = tuple(int(math.floor(c + 0.5)) for c in world_to_index(self.ct_image, point))
+        e = self.ct_extent
+        if not all(e[2 * a] <= index[a] <= e[2 * a + 1] for a in range(3)): return None
+        i, j, k = index
+        value = self.ct_voxels[k - e[4], j - e[2], i - e[0]]
+        label = 0
+        if self.seg_voxels is not None:
+            s = self.seg_extent
+            if all(s[2 * a] <= index[a] <= s[2 * a + 1] for a in range(3)):
+                label = int(self.seg_voxels[k - s[4], j - s[2], i - s[0]])
+        return {"point": tuple(point), "index": index, "hu": float(value) * self.slope + self.intercept, "label": label}
+
+    def clear(self):
+        self.ct_voxels = self.seg_voxels = None
+        self.ct_image = None
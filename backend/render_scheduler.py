@@ -0,0 +1,96 @@
+import time
+from backend.instrument import INSTRUMENTS
+
+class RenderScheduler:
+    # Gom cac yeu cau Render() (slider, cuon chuot, resize...) thanh toi da 1 lan ve moi khung hinh.
+    # Frame "interactive" duoc ve truoc voi DesiredUpdateRate cao (LOD kich hoat);
+    # frame chat luong day du chi ve khi nguoi dung ngung thao tac settle_ms.
+    def __init__(self, tk_root, render_window, max_fps=30.0, settle_ms=150):
+        self.root = tk_root
+        self.window = render_window
+        self.min_interval = 1.0 / max_fps
+        # Dung cung toc do cap nhat voi interactor de LOD phan biet frame nhanh / frame tinh
+        interactor = render_window.GetInteractor()
+        self.interactive_rate = interactor.GetDesiredUpdateRate() if interactor else 15.0
+        self.still_rate = interactor.GetStillUpdateRate() if interactor else 0.0001
+        self.settle_ms = settle_ms
+        self._interactive_pending = False
+        self._final_pending = False
+        self._render_id = None
+        self._settle_id = None
+        self._last_render = 0.0
+        self.requested = 0
+        self.interactive_renders = 0
+        self.final_renders = 0
+
+    def request_render(self, interactive=False):
+        self.requested += 1
+        if interactive:
+            self._interactive_pending = True
+        else:
+            self._final_pending = True
+        self._schedule()
+
+    def _schedule(self):
+        if self._render_id is not None: return
+        wait = self.min_interval - (time.perf_counter() - self._last_render)
+        if wait <= 0:
+            self._render_id = self.root.after_idle(self._render)
+        else:
+            self._render_id = self.root.after(int(wait * 1000) + 1, self._render)
+
+    def _render(self):
+        self._render_id = None
+        if self._interactive_pending:
+            self._interactive_pending = False
+            self._final_pending = True # Sau chuoi frame nhanh phai co 1 frame day du
+            self._draw(self.interactive_rate)
+            self.interactive_renders += 1
+            if self._settle_id is not None:
+                self.root.after_cancel(self._settle_id)
+            self._settle_id = self.root.after(self.settle_ms, self._settle)
+        elif self._final_pending and self._settle_id is None:
+            self._final_pending = False
+            self._draw(self.still_rate)
+            self.final_renders += 1
+
+    def _settle(self):
+        self._settle_id = None
+        if self._final_pending or self._interactive_pending:
+            self._schedule()
+
+    def _draw(self, update_rate):
+        self.window.SetDesiredUpdateRate(update_rate)
+        name = "render.final" if update_rate == self.still_rate else "render.interactive"
+        try:
+            with INSTRUMENTS.span(name):
+                self.window.Render()
+        finally:
+            self.window.SetDesiredUpdateRate(self.still_rate)
+        self._last_render = time.perf_counter()
+
+    def flush(self):
+        # Ve ngay frame day du neu dang co yeu cau treo (vd. truoc khi chup anh)
+        self.cancel()
+        if self._final_pending or self._interactive_pending:
+            self._interactive_pending = False
+            self._final_pending = False
+            self._draw(self.still_rate)
+            self.final_renders += 1
+
+    def cancel(self):
+        for after_id in (self._render_id, self._settle_id):
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+        self._render_id = None
+        self._settle_id = None
+
+    def stats(self):
+        rendered = self.interactive_renders + self.final_renders
+        return {
+            "requested": self.requested,
+            "rendered": rendered,
+            "interactive": self.interactive_renders,
+            "final": self.final_renders,
+            "coalesced": self.requested - rendered,
+        }
@@ -0,0 +1,339 @@
+import gc
+import multiprocessing
+import queue
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import LoadedVolume, voxel_array, _matrix_from_list, _matrix_to_list
+
+DEFAULT_FRAME_SIZE = (1024, 768)
+MAX_FRAME_SIZE = (3840, 2160) # Vung nho anh dung san cho kich thuoc cua so lon nhat
+FRAME_SLOTS = 2 # Hai o anh luan phien: server ghi o nay trong khi UI doc o kia (UI tra o lai sau khi doc)
+
+class SharedVolume:
+    # Voxel cua mot LoadedVolume dat trong multiprocessing.shared_memory (chep mot lan luc tai).
+    # Tien trinh ve chi gan vao vung nho nay, khong chep lai; phia tao (UI) giu va unlink khi xong.
+    def __init__(self, loaded):
+        voxels = voxel_array(loaded.image)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(voxels.nbytes, 1))
+        np.ndarray(voxels.shape, dtype=voxels.dtype, buffer=self.shm.buf)[...] = voxels
+        image = loaded.image
+        self.descriptor = {
+            "name": self.shm.name,
+            "shape": voxels.shape,
+            "dtype": voxels.dtype.str,
+            "extent": tuple(image.GetExtent()),
+            "spacing": tuple(image.GetSpacing()),
+            "origin": tuple(image.GetOrigin()),
+            "file_path": loaded.file_path,
+            "qform": _matrix_to_list(loaded.qform),
+            "sform": _matrix_to_list(loaded.sform),
+            "slope": loaded.slope,
+            "intercept": loaded.intercept,
+        }
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def volume_geometry(loaded):
+    # Ban chi co luoi (kich thuoc, spacing, origin, qform/sform), khong voxel: du de dua nhan ve luoi CT
+    # phia UI sau khi CT da nam trong vung nho chung cua server
+    image = vtk.vtkImageData()
+    image.SetExtent(loaded.image.GetExtent())
+    image.SetSpacing(loaded.image.GetSpacing())
+    image.SetOrigin(loaded.image.GetOrigin())
+    return LoadedVolume(loaded.file_path, image, qform=loaded.qform, sform=loaded.sform,
+                        slope=loaded.slope, intercept=loaded.intercept)
+
+def attach_shared_volume(descriptor):
+    # Phia server: boc vung nho chung thanh vtkImageData khong chep. Tra ve (LoadedVolume, shm)
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    voxels = np.ndarray(descriptor["shape"], dtype=np.dtype(descriptor["dtype"]), buffer=shm.buf)
+    image = vtk.vtkImageData()
+    image.SetExtent(descriptor["extent"])
+    image.SetSpacing(descriptor["spacing"])
+    image.SetOrigin(descriptor["origin"])
+    scalars = numpy_support.numpy_to_vtk(voxels.reshape(-1), deep=False)
+    scalars.SetName("NIFTI")
+    image.GetPointData().SetScalars(scalars)
+    loaded = LoadedVolume(descriptor["file_path"], image, qform=_matrix_from_list(descriptor["qform"]),
+                          sform=_matrix_from_list(descriptor["sform"]),
+                          slope=descriptor["slope"], intercept=descriptor["intercept"])
+    return loaded, shm
+
+class _Server:
+    # Chay trong tien trinh ve: so huu vtkRenderWindow (offscreen), VTKVolumeHelper va MPRViewer
+    def __init__(self, commands, results, frame_name, size):
+        from backend.volume_renderer import VTKVolumeHelper
+        vtk.vtkObject.GlobalWarningDisplayOff()
+        self.commands = commands
+        self.results = results
+        self.frame_shm = shared_memory.SharedMemory(name=frame_name)
+        self.free_slots = list(range(FRAME_SLOTS)) # O anh UI da doc xong (hoac chua dung) -> duoc ghi de
+        self.frame_seq = 0
+        self.helper = VTKVolumeHelper(cache_dir=None)
+        self.window = vtk.vtkRenderWindow()
+        self.window.SetOffScreenRendering(1)
+        self.window.SetSize(*size)
+        self.interactor = vtk.vtkRenderWindowInteractor() # MPRViewer can interactor de gan style
+        self.interactor.SetRenderWindow(self.window)
+        self.renderer = vtk.vtkRenderer()
+        self.renderer.SetBackground(0.05, 0.05, 0.05)
+        self.window.AddRenderer(self.renderer)
+        self.mpr = None
+        self.shared = {} # "ct"/"seg" -> SharedMemory dang gan
+        self.stale = [] # shm cu chua dong duoc (VTK con giu mang)
+        self.window_level = None
+        self.dirty = True
+
+    def run(self):
+        while True:
+            batch = [self.commands.get()]
+            while True: # Gom moi lenh dang cho -> mot lan ve cho ca loat (vd. keo slider)
+                try:
+                    batch.append(self.commands.get_nowait())
+                except queue.Empty:
+                    break
+            for command in batch:
+                if command[0] == "shutdown":
+                    self._teardown()
+                    return
+                try:
+                    getattr(self, "cmd_" + command[0])(*command[1:])
+                except Exception:
+                    # Lenh tai volume loi: tra ten shm de UI van giai phong duoc vung nho da cap
+                    name = command[1]["name"] if command[0] in ("load_ct", "load_seg") else None
+                    self.results.put(("error", command[0], traceback.format_exc(), name))
+            if self.dirty:
+                self._render()
+
+    def _render(self):
+        # Ca hai o dang cho UI doc -> giu dirty, ve khi UI tra o ("frame_done") de khong ghi de anh dang chep
+        if not self.free_slots: return
+        slot = self.free_slots.pop(0)
+        self.dirty = False
+        self.window.Render()
+        grabber = vtk.vtkWindowToImageFilter()
+        grabber.SetInput(self.window)
+        grabber.ReadFrontBufferOff()
+        grabber.ShouldRerenderOff()
+        grabber.Update()
+        image = grabber.GetOutput()
+        width, height, _ = image.GetDimensions()
+        pixels = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(height, width, -1)[::-1, :, :3]
+        offset = slot * MAX_FRAME_SIZE[0] * MAX_FRAME_SIZE[1] * 3
+        target = np.ndarray((height, width, 3), dtype=np.uint8, buffer=self.frame_shm.buf, offset=offset)
+        target[...] = pixels
+        self.frame_seq += 1
+        self.results.put(("frame", self.frame_seq, slot, width, height))
+
+    def cmd_frame_done(self, slot):
+        if slot not in self.free_slots:
+            self.free_slots.append(slot)
+
+    def _close_stale(self):
+        gc.collect()
+        still = []
+        for shm in self.stale:
+            try:
+                shm.close()
+            except BufferError: # VTK/numpy van con tham chieu -> thu lai lan sau
+                still.append(shm)
+        self.stale = still
+
+    def _clear_mpr(self):
+        if self.mpr:
+            self.mpr.clear()
+            self.mpr = None
+
+    def cmd_load_ct(self, descriptor):
+        self._clear_mpr()
+        self.renderer.RemoveAllViewProps()
+        self.helper.reset()
+        self.stale += [shm for shm in self.shared.values()]
+        self.shared = {}
+        self._close_stale()
+        loaded, self.shared["ct"] = attach_shared_volume(descriptor)
+        self.helper._prepare_ct(loaded)
+        self.renderer.AddVolume(self.helper.attach_ct_volume(loaded))
+        self.renderer.ResetCamera()
+        self.results.put(("loaded", "ct", descriptor["name"]))
+        self.dirty = True
+
+    def cmd_load_seg(self, descriptor):
+        reopen = self.mpr is not None and self.mpr.visible
+        self._clear_mpr()
+        self.renderer.RemoveVolume(self.helper.volume_seg)
+        loaded, shm = attach_shared_volume(descriptor)
+        self.helper._prepare_seg(loaded)
+        self.renderer.AddVolume(self.helper.attach_segmentation_overlay(loaded))
+        if "seg" in self.shared: self.stale.append(self.shared["seg"])
+        self.shared["seg"] = shm
+        self._close_stale()
+        if reopen: self.cmd_toggle_mpr(True)
+        self.results.put(("loaded", "seg", descriptor["name"]))
+        self.dirty = True
+
+    def cmd_resize(self, width, height):
+        width, height = min(width, MAX_FRAME_SIZE[0]), min(height, MAX_FRAME_SIZE[1])
+        if (width, height) != tuple(self.window.GetSize()):
+            self.window.SetSize(width, height)
+            self.dirty = True
+
+    def cmd_set_liver_opacity(self, value):
+        self.helper.set_liver_opacity(value)
+        self.dirty = True
+
+    def cmd_set_label_visible(self, label, visible):
+        self.helper.set_label_visible(label, visible)
+        self.dirty = True
+
+    def cmd_set_visibility(self, show_ct, show_seg):
+        self.helper.set_ct_visiblility(show_ct)
+        self.helper.set_seg_visiblility(show_seg)
+        self.dirty = True
+
+    def cmd_set_opacity_factor(self, value):
+        self.helper.set_opacity_factor(value)
+        self.dirty = True
+
+    def cmd_rotate(self, dx, dy):
+        camera = self.renderer.GetActiveCamera()
+        camera.Azimuth(-dx * 0.5)
+        camera.Elevation(dy * 0.5)
+        camera.OrthogonalizeViewUp()
+        self.renderer.ResetCameraClippingRange()
+        self.dirty = True
+
+    def cmd_zoom(self, factor):
+        self.renderer.GetActiveCamera().Dolly(factor)
+        self.renderer.ResetCameraClippingRange()
+        self.dirty = True
+
+    def cmd_toggle_mpr(self, active):
+        from backend.handler import MPRViewer
+        if self.helper.get_raw_data() is None: return
+        if active:
+            if self.mpr is None:
+                self.mpr = MPRViewer(self.window, self.renderer, self.helper.get_raw_data(),
+                                     self.helper.get_segmentation_data(),
+                                     initial_opacity=self.helper.current_liver_opacity,
+                                     render_callback=self._mark_dirty, label_table=self.helper.get_label_table(),
+                                     window_level=self.window_level or self.helper.window_preset("auto"),
+                                     scalar_range=self.helper.ct_value_range())
+            self.mpr.show()
+        elif self.mpr:
+            self.mpr.hide()
+        self.dirty = True
+
+    def _mark_dirty(self, interactive=False):
+        self.dirty = True
+
+    def cmd_scroll(self, x, y, direction, step=1):
+        # (x, y) la toa do pixel tren anh (goc tren-trai) -> tim khung MPR duoi con tro
+        if not self.mpr or not self.mpr.visible: return
+        height = self.window.GetSize()[1]
+        renderer = self.interactor.FindPokedRenderer(int(x), int(height - 1 - y))
+        view = self.mpr.renderer_map.get(renderer)
+        if view and view.set_slice(view.slice_index + step * direction, step):
+            self.dirty = True
+
+    def cmd_set_slice(self, axis, index):
+        if not self.mpr: return
+        for view in self.mpr.views:
+            if view.axis == axis and view.set_slice(index):
+                self.dirty = True
+
+    def cmd_window_preset(self, name):
+        self.window_level = self.helper.window_preset(name)
+        if self.mpr and self.window_level:
+            self.mpr.set_window_level(*self.window_level)
+
+    def cmd_close_case(self):
+        self._clear_mpr()
+        self.renderer.RemoveAllViewProps()
+        self.helper.reset()
+        self.stale += list(self.shared.values())
+        self.shared = {}
+        self._close_stale()
+        self.results.put(("closed",))
+        self.dirty = True
+
+    def cmd_render(self):
+        self.dirty = True
+
+    def _teardown(self):
+        self.cmd_close_case()
+        self.frame_shm.close()
+
+def _serve(commands, results, frame_name, size):
+    _Server(commands, results, frame_name, size).run()
+
+class RenderClient:
+    # Phia UI: gui lenh nho qua hang doi, nhan anh qua vung nho chung. Khong goi VTK render nao tren thread Tk
+    def __init__(self, size=DEFAULT_FRAME_SIZE):
+        context = multiprocessing.get_context("spawn")
+        self.commands = context.Queue()
+        self.results = context.Queue()
+        slot_bytes = MAX_FRAME_SIZE[0] * MAX_FRAME_SIZE[1] * 3
+        self.frame_shm = shared_memory.SharedMemory(create=True, size=slot_bytes * FRAME_SLOTS)
+        self.process = context.Process(target=_serve, args=(self.commands, self.results, self.frame_shm.name, size),
+                                       name="medview-render", daemon=True)
+        self.process.start()
+        self.volumes = {} # ten shm -> SharedVolume, giai phong khi server bao da gan xong
+        self.errors = []
+
+    def send(self, *command):
+        self.commands.put(command)
+
+    def load_ct(self, loaded):
+        shared = SharedVolume(loaded)
+        self.volumes[shared.shm.name] = shared
+        self.send("load_ct", shared.descriptor)
+
+    def load_seg(self, loaded):
+        shared = SharedVolume(loaded)
+        self.volumes[shared.shm.name] = shared
+        self.send("load_seg", shared.descriptor)
+
+    def poll(self):
+        # Xu ly tin tu server; tra ve anh moi nhat (width, height, bytes RGB) hoac None
+        frame = None
+        while True:
+            try:
+                message = self.results.get_nowait()
+            except queue.Empty:
+                break
+            kind = message[0]
+            if kind == "frame":
+                if frame is not None: self.send("frame_done", frame[1]) # Anh cu hon, bo qua khong doc
+                frame = message[1:]
+            elif kind == "loaded":
+                # Server da gan vao vung nho -> bo ten khoi he thong (vung nho con den khi server dong)
+                shared = self.volumes.pop(message[2], None)
+                if shared: shared.release()
+            elif kind == "error":
+                # (lenh, traceback) cho UI hien; lenh tai volume loi thi server khong bao "loaded" -> giai phong o day
+                shared = self.volumes.pop(message[3], None) if message[3] else None
+                if shared: shared.release()
+                self.errors.append(message[1:3])
+        if frame is None: return None
+        _, slot, width, height = frame
+        offset = slot * MAX_FRAME_SIZE[0] * MAX_FRAME_SIZE[1] * 3
+        pixels = bytes(self.frame_shm.buf[offset:offset + width * height * 3])
+        self.send("frame_done", slot) # Chep xong moi tra o cho server ghi lai
+        return width, height, pixels
+
+    def shutdown(self, timeout=5.0):
+        self.send("shutdown")
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        for shared in self.volumes.values():
+            shared.release()
+        self.volumes.clear()
+        self.frame_shm.close()
+        self.frame_shm.unlink()
@@ -0,0 +1,59 @@
+import numpy as np
+from backend.volume_io import voxel_array
+
+AIR_HU = -200 # Duoi nguong nay _setup_transparent_ct_style cho opacity = 0
+
+def bounding_extent(image, threshold, chunk_slices=32):
+    # Hop bao (x0, x1, y0, y1, z0, z1) theo chi so cua cac voxel > threshold (tinh ca extent cua anh).
+    # Duyet theo tung khoi lat cat de mask tam khong chiem ca volume trong RAM.
+    voxels = voxel_array(image)
+    nz, ny, nx = voxels.shape
+    any_z = np.zeros(nz, dtype=bool)
+    any_y = np.zeros(ny, dtype=bool)
+    any_x = np.zeros(nx, dtype=bool)
+    for z0 in range(0, nz, chunk_slices):
+        mask = voxels[z0:z0 + chunk_slices] > threshold
+        any_z[z0:z0 + chunk_slices] = mask.any(axis=(1, 2))
+        any_y |= mask.any(axis=(0, 2))
+        any_x |= mask.any(axis=(0, 1))
+    if not any_z.any(): return None
+    xs, ys, zs = np.flatnonzero(any_x), np.flatnonzero(any_y), np.flatnonzero(any_z)
+    x, y, z = image.GetExtent()[::2] # Anh nhan da cat gon co extent khong bat dau tu 0
+    return (int(xs[0]) + x, int(xs[-1]) + x, int(ys[0]) + y, int(ys[-1]) + y, int(zs[0]) + z, int(zs[-1]) + z)
+
+def body_extent(loaded, air_hu=AIR_HU):
+    # Nguong HU doi ve don vi tho cua file (slope/intercept trong header)
+    threshold = (air_hu - loaded.intercept) / (loaded.slope or 1.0)
+    return bounding_extent(loaded.image, threshold)
+
+def label_extent(loaded):
+    return bounding_extent(loaded.image, 0)
+
+def extent_to_bounds(image, extent, margin=0.0):
+    # Chi so voxel -> toa do du lieu (dung cho SetCroppingRegionPlanes), co them le
+    origin = image.GetOrigin()
+    spacing = image.GetSpacing()
+    bounds = []
+    for axis in range(3):
+        pad = 0.5 * spacing[axis] + margin
+        bounds.append(origin[axis] + extent[2 * axis] * spacing[axis] - pad)
+        bounds.append(origin[axis] + extent[2 * axis + 1] * spacing[axis] + pad)
+    return bounds
+
+def label_centroid(image, chunk_slices=32):
+    # Trong tam (x, y, z) theo chi so voxel cua cac voxel > 0 (tinh ca extent), None neu khong co nhan
+    voxels = voxel_array(image)
+    nz, ny, nx = voxels.shape
+    sums = np.zeros(3)
+    total = 0
+    for z0 in range(0, nz, chunk_slices):
+        mask = voxels[z0:z0 + chunk_slices] > 0
+        count = int(mask.sum())
+        if not count: continue
+        total += count
+        sums[0] += mask.sum(axis=(0, 1)) @ np.arange(nx)
+        sums[1] += mask.sum(axis=(0, 2)) @ np.arange(ny)
+        sums[2] += mask.sum(axis=(1, 2)) @ np.arange(z0, z0 + mask.shape[0])
+    if not total: return None
+    offset = image.GetExtent()[::2]
+    return tuple(sums[axis] / total + offset[axis] for axis in range(3))
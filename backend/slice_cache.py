@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+DEFAULT_CACHE_SLICES = 48
+DEFAULT_PREFETCH_DEPTH = 8
+
+def extract_plane(voxels, axis, index):
+    # voxels: mang (z, y, x). Tra ve lat cat lien tuc trong bo nho, dung thu tu diem cua VTK
+    if axis == 2: plane = voxels[index]
+    elif axis == 1: plane = voxels[:, index, :]
+    else: plane = voxels[:, :, index]
+    return np.ascontiguousarray(plane).ravel()
+
+class SliceCache:
+    # LRU gioi han so lat cat: chi so lat -> (mang CT, mang nhan hoac None)
+    def __init__(self, capacity=DEFAULT_CACHE_SLICES):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock() # Thread prefetch cung ghi vao
+
+    def get(self, index):
+        with self._lock:
+            planes = self.entries.get(index)
+            if planes is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(index)
+            self.hits += 1
+            return planes
+
+    def contains(self, index):
+        with self._lock:
+            return index in self.entries
+
+    def put(self, index, planes):
+        with self._lock:
+            self.entries[index] = planes
+            self.entries.move_to_end(index)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def items(self):
+        with self._lock:
+            return list(self.entries.items())
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+class SlicePrefetcher:
+    # Mot thread nen tinh truoc cac lat cat ke tiep theo huong cuon.
+    # Yeu cau moi cua cung mot khung thay the yeu cau cu chua lam xong.
+    def __init__(self, depth=DEFAULT_PREFETCH_DEPTH):
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="medview-prefetch")
+        self._wanted = {} # view -> danh sach chi so lat can tinh
+        self._running = False
+        self._closed = False
+        self._current = None # Khung ma thread nen dang cat lat
+        self._dropped = set() # Khung da huy trong luc dang cat -> dung sau lat hien tai
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def schedule(self, view, index, direction, step=1):
+        indices = [index + direction * step * k for k in range(1, self.depth + 1)]
+        indices = [i for i in indices if 0 <= i <= view.get_max_slice()]
+        with self._lock:
+            if self._closed or not indices: return
+            self._wanted[view] = indices
+            if not self._running:
+                self._running = True
+                self.executor.submit(self._run)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._wanted or self._closed:
+                    self._running = False
+                    return
+                view, indices = self._wanted.popitem()
+                self._current = view
+            try:
+                for index in indices:
+                    with self._lock:
+                        # Nguoi dung da cuon tiep hoac khung da bi go -> bo phan con lai
+                        if view in self._wanted or self._closed or view in self._dropped: break
+                    if not view.cache.contains(index):
+                        view.cache.put(index, view.extract_planes(index))
+            finally:
+                with self._lock:
+                    self._current = None
+                    self._dropped.discard(view)
+                    self._idle.notify_all()
+
+    def cancel(self, view):
+        # Goi truoc khi khung bo volume: huy yeu cau dang cho va doi lat dang cat do xong,
+        # de thread nen khong doc volume da bo hay dua lat (tro vao volume) vao cache vua xoa
+        with self._lock:
+            self._wanted.pop(view, None)
+            if self._current is view: self._dropped.add(view)
+            while self._current is view:
+                self._idle.wait()
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            self._wanted.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
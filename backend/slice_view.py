@@ -0,0 +1,154 @@
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import voxel_array
+from backend.instrument import timed
+from backend.slice_cache import SliceCache, extract_plane, DEFAULT_CACHE_SLICES
+
+class FusedSliceView:
+    # Mot khung 2D cua MPR: lat cat CT qua window/level + lat cat nhan qua LUT,
+    # tron thanh mot anh RGBA va hien bang mot vtkImageActor (khong con cap widget CT/seg).
+    # Lat cat duoc cat bang numpy, giu trong SliceCache va tinh truoc boi SlicePrefetcher.
+    def __init__(self, renderer, ct_data, axis, seg_data=None, label_lut=None, prefetcher=None,
+                 cache_size=DEFAULT_CACHE_SLICES, window_level=None, scalar_range=None):
+        self.renderer = renderer
+        self.ct_data = ct_data
+        self.seg_data = seg_data if label_lut is not None else None
+        self.axis = axis
+        self.dims = ct_data.GetDimensions()
+        self.ct_voxels = voxel_array(ct_data)
+        self.seg_voxels = voxel_array(self.seg_data) if self.seg_data is not None else None
+        self.cache = SliceCache(cache_size)
+        self.prefetcher = prefetcher
+        self.ct_colors = vtk.vtkImageMapToWindowLevelColors()
+        self.ct_colors.SetOutputFormatToRGBA()
+        # Khoang gia tri / cua so lay tu histogram neu co (khong phai quet voxel de tim min/max)
+        low, high = scalar_range or ct_data.GetScalarRange()
+        self.scalar_range = (low, high)
+        if window_level is None:
+            window_level = (max(high - low, 1.0), 0.5 * (low + high)) # Giong mac dinh cua vtkImagePlaneWidget
+        self.set_window_level(*window_level)
+        output = self.ct_colors
+        if self.seg_data is not None:
+            self.seg_colors = vtk.vtkImageMapToColors()
+            self.seg_colors.SetLookupTable(label_lut)
+            self.seg_colors.SetOutputFormatToRGBA()
+        # Alpha cua LUT quyet dinh do dam cua nhan tren nen CT
+            self.blend = vtk.vtkImageBlend()
+            self.blend.AddInputConnection(self.ct_colors.GetOutputPort())
+            self.blend.AddInputConnection(self.seg_colors.GetOutputPort())
+            self.blend.SetOpacity(1, 1.0)
+            # Dau vao tam cho lop nhan (lat dau hop bao) de pipeline hop le ca khi lat dau tien nam ngoai hop bao
+            first = self.seg_data.GetExtent()[2 * axis]
+            self.seg_colors.SetInputData(self._wrap(self.seg_data, extract_plane(self.seg_voxels, axis, 0), first))
+            output = self.blend
+        self.actor = vtk.vtkImageActor()
+        self.actor.GetMapper().SetInputConnection(output.GetOutputPort())
+        self.actor.InterpolateOff() # Giu bien nhan sac net
+        renderer.AddViewProp(self.actor)
+        self.slice_index = None # Lat cat nguoi dung muon toi (co the chua ve)
+        self.shown_index = None # Lat cat dang hien thi
+        self.pending_index = None
+        self._observer = renderer.AddObserver("StartEvent", self._on_render_start)
+        self.set_slice(self.dims[axis] // 2)
+        self._apply_pending()
+
+    def get_max_slice(self):
+        return self.dims[self.axis] - 1
+
+    def _seg_index(self, index):
+        # Nhan luu gon chi phu hop bao cua no (extent rieng) -> lat ngoai hop bao khong co nhan
+        low, high = self.seg_data.GetExtent()[2 * self.axis:2 * self.axis + 2]
+        return index - low if low <= index <= high else None
+
+    def extract_planes(self, index):
+        # Chi dung numpy -> goi duoc tu thread prefetch
+        ct_plane = extract_plane(self.ct_voxels, self.axis, index)
+        seg_plane = None
+        if self.seg_voxels is not None:
+            seg_index = self._seg_index(index)
+            if seg_index is not None:
+                seg_plane = extract_plane(self.seg_voxels, self.axis, seg_index)
+        return ct_plane, seg_plane
+
+    def _slice_extent(self, extent, index):
+        extent = list(extent)
+        extent[2 * self.axis] = extent[2 * self.axis + 1] = index
+        return extent
+
+    def _wrap(self, source, plane, index):
+        image = vtk.vtkImageData()
+        image.SetExtent(self._slice_extent(source.GetExtent(), index))
+        image.SetSpacing(source.GetSpacing())
+        image.SetOrigin(source.GetOrigin())
+        image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(plane, deep=False))
+        return image
+
+    def set_slice(self, index, step=1):
+        # Chi ghi nhan dich den; nhieu lan cuon truoc mot lan ve chi con lat cuoi cung
+        index = max(0, min(index, self.get_max_slice()))
+        current = self.slice_index
+        if index == current: return False
+        self.direction = 0 if current is None else (1 if index > current else -1)
+        self.step = step
+        self.slice_index = index
+        self.pending_index = index if index != self.shown_index else None
+        return True
+
+    def _on_render_start(self, obj, event):
+        if self.pending_index is not None:
+            self._apply_pending()
+
+    @timed("mpr.slice_update")
+    def _apply_pending(self):
+        index = self.pending_index
+        self.pending_index = None
+        if index is None: return
+        planes = self.cache.get(index)
+        if planes is None:
+            planes = self.extract_planes(index)
+            self.cache.put(index, planes)
+        self.ct_colors.SetInputData(self._wrap(self.ct_data, planes[0], index))
+        # Chi ro huong lat cat cho actor (mac dinh no chi hien lat theo truc Z)
+        self.actor.SetDisplayExtent(self._slice_extent(self.ct_data.GetExtent(), index))
+        if self.seg_data is not None:
+            if planes[1] is None:
+                self.blend.SetOpacity(1, 0.0) # Giu dau vao cu, chi tat lop nhan
+            else:
+                self.seg_colors.SetInputData(self._wrap(self.seg_data, planes[1], index))
+                self.blend.SetOpacity(1, 1.0)
+        self.shown_index = index
+        self.renderer.ResetCameraClippingRange()
+        if self.prefetcher and self.direction:
+            self.prefetcher.schedule(self, index, self.direction, self.step)
+
+    def set_window_level(self, window, level):
+        self.window = window
+        self.level = level
+        self.ct_colors.SetWindow(window)
+        self.ct_colors.SetLevel(level)
+
+    def buffers(self):
+        # Bo dem cua khung (cho thong ke bo nho): lat cat trong SliceCache + anh ra cua cac bo loc to mau
+        items = []
+        for index, planes in self.cache.items():
+            for layer, plane in zip(("ct", "seg"), planes):
+                if plane is not None:
+                    items.append((f"axis{self.axis}_{layer}_{index}", plane))
+        filters = [("ct_colors", self.ct_colors)]
+        if self.seg_data is not None:
+            filters += [("seg_colors", self.seg_colors), ("blend", self.blend)]
+        for name, image_filter in filters:
+            items.append((f"axis{self.axis}_{name}", image_filter.GetOutput()))
+        return items
+
+    def remove(self):
+        if self.prefetcher: self.prefetcher.cancel(self)
+        self.renderer.RemoveObserver(self._observer)
+        self.renderer.RemoveViewProp(self.actor)
+        self.cache.clear()
+        # Bo tham chieu toi volume va lat cat dang hien de dong ca giai phong duoc bo nho ngay
+        self.ct_colors.RemoveAllInputs()
+        if self.seg_data is not None:
+            self.seg_colors.RemoveAllInputs()
+        self.ct_voxels = self.seg_voxels = None
+        self.ct_data = self.seg_data = None
@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_BUDGET_BYTES = int(os.environ.get("MEDVIEW_VOLUME_CACHE_MB", "2048")) * 1024 * 1024
+
+class VolumeCache:
+    # Cache LRU cac volume da giai nen, gioi han theo tong so byte.
+    # Khoa = file_identity (path, size, mtime) nen file bi sua se tu dong miss.
+    def __init__(self, max_bytes=DEFAULT_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (LoadedVolume, nbytes), cuoi = moi dung nhat
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock() # Duoc goi tu cac thread doc file
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, loaded):
+        nbytes = loaded.nbytes
+        with self._lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key)[1]
+            if nbytes > self.max_bytes: return # Qua lon, khong giu
+            self.entries[key] = (loaded, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def set_budget(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def volumes(self):
+        with self._lock:
+            return [loaded for loaded, _ in self.entries.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,288 @@
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+# Ma datatype NIfTI-1 -> kieu numpy
+NIFTI_DTYPES = {2: "u1", 4: "i2", 8: "i4", 16: "f4", 64: "f8", 256: "i1", 512: "u2", 768: "u4", 1024: "i8", 1280: "u8"}
+CACHE_MAGIC = b"MEDVIEW1"
+CACHE_SUFFIX = ".mvc"
+CACHE_ALIGN = 4096 # Khoi voxel bat dau o bien trang de mmap doc thang
+DEFAULT_CACHE_DIR = os.environ.get("MEDVIEW_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".medview", "cache"))
+DEFAULT_CACHE_BUDGET_BYTES = int(os.environ.get("MEDVIEW_DISK_CACHE_MB", "8192")) * 1024 * 1024
+
+class LoadCancelled(Exception):
+    pass
+
+class LoadedVolume:
+    # Ket qua doc file: anh VTK + thong tin header can cho cac buoc sau
+    def __init__(self, file_path, image, qform=None, sform=None, slope=1.0, intercept=0.0):
+        self.file_path = file_path
+        self.image = image # vtkImageData da giai nen
+        self.qform = qform # vtkMatrix4x4 hoac None
+        self.sform = sform
+        self.slope = slope
+        self.intercept = intercept
+        self.derived = {} # Du lieu tinh mot lan tu volume (pyramid, ...) - di kem volume trong cache
+
+    @property
+    def nbytes(self):
+        return self.image.GetActualMemorySize() * 1024 + sum(getattr(v, "nbytes", 0) for v in self.derived.values())
+
+def file_identity(file_path):
+    # (duong dan, kich thuoc, mtime) - doi mot trong ba la coi nhu file moi
+    st = os.stat(file_path)
+    return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+
+def _copy_matrix(matrix):
+    if matrix is None: return None
+    copy = vtk.vtkMatrix4x4()
+    copy.DeepCopy(matrix)
+    return copy
+
+def read_nifti(file_path, progress_callback=None, cancel_event=None):
+    # Chay duoc tren thread phu: moi lan doc dung mot reader rieng
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(file_path)
+    reader.UpdateInformation()
+    extent = reader.GetDataExtent()
+    total_slices = extent[5] - extent[4] + 1
+
+    def on_progress(obj, event):
+        if cancel_event is not None and cancel_event.is_set():
+            obj.AbortExecuteOn() # Bao reader dung lai som
+        if progress_callback:
+            progress_callback(int(obj.GetProgress() * total_slices), total_slices)
+
+    reader.AddObserver("ProgressEvent", on_progress)
+    reader.Update()
+    if cancel_event is not None and cancel_event.is_set():
+        raise LoadCancelled(file_path)
+    image = vtk.vtkImageData()
+    image.ShallowCopy(reader.GetOutput()) # Tach anh khoi reader de reader co the giai phong
+    return LoadedVolume(file_path, image,
+                        qform=_copy_matrix(reader.GetQFormMatrix()),
+                        sform=_copy_matrix(reader.GetSFormMatrix()),
+                        slope=reader.GetRescaleSlope(),
+                        intercept=reader.GetRescaleIntercept())
+
+def voxel_array(image):
+    # Mang numpy (z, y, x) tro thang vao bo nho cua vtkImageData, khong copy
+    dims = image.GetDimensions()
+    flat = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+    if flat.ndim > 1: flat = flat[:, 0]
+    return flat.reshape(dims[2], dims[1], dims[0])
+
+def _matrix_from_list(values):
+    if values is None: return None
+    matrix = vtk.vtkMatrix4x4()
+    matrix.DeepCopy(values)
+    return matrix
+
+def _matrix_to_list(matrix):
+    if matrix is None: return None
+    return [matrix.GetElement(i, j) for i in range(4) for j in range(4)]
+
+def _wrap_array(flat, dims, spacing, origin=(0.0, 0.0, 0.0)):
+    # Boc mang numpy thanh vtkImageData, khong copy (VTK giu tham chieu toi mang)
+    image = vtk.vtkImageData()
+    image.SetDimensions(dims)
+    image.SetSpacing(spacing)
+    image.SetOrigin(origin)
+    scalars = numpy_support.numpy_to_vtk(flat, deep=False)
+    scalars.SetName("NIFTI")
+    image.GetPointData().SetScalars(scalars)
+    return image
+
+def _read_nifti1_header(file_path):
+    with open(file_path, "rb") as f:
+        raw = f.read(348)
+    if len(raw) < 348: return None
+    for order in ("<", ">"):
+        if struct.unpack(order + "i", raw[:4])[0] == 348: break
+    else:
+        return None # NIfTI-2 hoac khong phai NIfTI
+    if raw[344:347] != b"n+1": return None # Chi ho tro file don .nii
+    return {
+        "order": order,
+        "dim": struct.unpack(order + "8h", raw[40:56]),
+        "datatype": struct.unpack(order + "h", raw[70:72])[0],
+        "pixdim": struct.unpack(order + "8f", raw[76:108]),
+        "vox_offset": struct.unpack(order + "f", raw[108:112])[0],
+        "slope": struct.unpack(order + "f", raw[112:116])[0],
+        "intercept": struct.unpack(order + "f", raw[116:120])[0],
+        "qform_code": struct.unpack(order + "h", raw[252:254])[0],
+        "sform_code": struct.unpack(order + "h", raw[254:256])[0],
+        "quatern": struct.unpack(order + "6f", raw[256:280]),
+        "srow": struct.unpack(order + "12f", raw[280:328]),
+    }
+
+def _header_matrices(header, spacing):
+    # Cung quy uoc voi vtkNIFTIImageReader: ma tran ap len toa do (i*dx, j*dy, k*dz)
+    qform = None
+    if header["qform_code"] > 0:
+        b, c, d, qx, qy, qz = header["quatern"]
+        a = math.sqrt(max(0.0, 1.0 - b*b - c*c - d*d))
+        qform = _matrix_from_list([
+            a*a + b*b - c*c - d*d, 2*(b*c - a*d), 2*(b*d + a*c), qx,
+            2*(b*c + a*d), a*a + c*c - b*b - d*d, 2*(c*d - a*b), qy,
+            2*(b*d - a*c), 2*(c*d + a*b), a*a + d*d - c*c - b*b, qz,
+            0.0, 0.0, 0.0, 1.0])
+    sform = None
+    if header["sform_code"] > 0:
+        srow = header["srow"]
+        values = []
+        for row in range(3):
+            values += [srow[4*row + col] / spacing[col] for col in range(3)] + [srow[4*row + 3]]
+        sform = _matrix_from_list(values + [0.0, 0.0, 0.0, 1.0])
+    return qform, sform
+
+def map_nifti(file_path):
+    # Memory-map truc tiep file .nii khong nen. Tra ve None neu file can giai ma (gz, big-endian, qfac=-1...)
+    if file_path.lower().endswith(".gz"): return None
+    header = _read_nifti1_header(file_path)
+    if header is None: return None
+    dim = header["dim"]
+    dtype_code = NIFTI_DTYPES.get(header["datatype"])
+    if dtype_code is None or not 3 <= dim[0] <= 7 or any(n > 1 for n in dim[4:dim[0] + 1]):
+        return None
+    dtype = np.dtype(header["order"] + dtype_code)
+    native = "<" if sys.byteorder == "little" else ">"
+    if dtype.itemsize > 1 and header["order"] != native: return None
+    if header["pixdim"][0] < 0: return None # VTK dao thu tu lat cat khi qfac=-1 -> de reader lo
+    offset = int(header["vox_offset"])
+    if offset % dtype.itemsize: return None
+    dims = tuple(int(n) for n in dim[1:4])
+    spacing = tuple(abs(v) or 1.0 for v in header["pixdim"][1:4])
+    flat = np.memmap(file_path, dtype=dtype.newbyteorder("="), mode="c", offset=offset, shape=(dims[0] * dims[1] * dims[2],))
+    qform, sform = _header_matrices(header, spacing)
+    return LoadedVolume(file_path, _wrap_array(flat, dims, spacing), qform=qform, sform=sform,
+                        slope=header["slope"] or 1.0, intercept=header["intercept"])
+
+def cache_path_for(cache_dir, file_path):
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, digest + CACHE_SUFFIX)
+
+def _data_offset(header_length):
+    size = len(CACHE_MAGIC) + 8 + header_length
+    return (size + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+
+def write_cache(cache_path, identity, loaded):
+    # Format: MAGIC | do dai header (uint64) | header JSON | padding | khoi voxel tho
+    image = loaded.image
+    scalars = image.GetPointData().GetScalars()
+    voxels = numpy_support.vtk_to_numpy(scalars)
+    header = {
+        "source": identity[0], "size": identity[1], "mtime_ns": identity[2],
+        "dims": list(image.GetDimensions()),
+        "spacing": list(image.GetSpacing()),
+        "origin": list(image.GetOrigin()),
+        "dtype": voxels.dtype.str,
+        "components": scalars.GetNumberOfComponents(),
+        "qform": _matrix_to_list(loaded.qform),
+        "sform": _matrix_to_list(loaded.sform),
+        "slope": loaded.slope,
+        "intercept": loaded.intercept,
+    }
+    blob = json.dumps(header).encode("utf-8")
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(struct.pack("<Q", len(blob)))
+        f.write(blob)
+        f.write(b"\0" * (_data_offset(len(blob)) - f.tell()))
+        voxels.tofile(f)
+    os.replace(tmp_path, cache_path) # Ghi xong moi doi ten de khong bao gio doc phai file do dang
+
+def read_cache(cache_path, identity):
+    try:
+        with open(cache_path, "rb") as f:
+            if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC: return None
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length).decode("utf-8"))
+        if (header["source"], header["size"], header["mtime_ns"]) != tuple(identity):
+            return None # File goc da thay doi -> cache het han
+        dims = tuple(header["dims"])
+        components = header["components"]
+        count = dims[0] * dims[1] * dims[2] * components
+        flat = np.memmap(cache_path, dtype=np.dtype(header["dtype"]), mode="c", offset=_data_offset(length), shape=(count,))
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    if components > 1:
+        flat = flat.reshape(-1, components)
+    image = _wrap_array(flat, dims, header["spacing"], header["origin"])
+    return LoadedVolume(identity[0], image,
+                        qform=_matrix_from_list(header["qform"]),
+                        sform=_matrix_from_list(header["sform"]),
+                        slope=header["slope"], intercept=header["intercept"])
+
+def prune_cache(cache_dir, budget_bytes, keep=None):
+    # Xoa file cache dung lau nhat (mtime cu nhat) den khi tong dung luong <= budget_bytes; tra ve so byte da xoa
+    entries = []
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.endswith(CACHE_SUFFIX): continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime_ns, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= budget_bytes: break
+        if path == keep: continue
+        try:
+            os.remove(path) # Ban dang mmap van doc duoc (Linux); tren Windows file dang mo se bao loi -> bo qua
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
+
+def _touch(path):
+    # Danh dau vua dung de prune_cache giu lai (LRU theo mtime)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def load_volume(file_path, progress_callback=None, cancel_event=None, cache_dir=DEFAULT_CACHE_DIR,
+                cache_budget=DEFAULT_CACHE_BUDGET_BYTES, status_callback=None):
+    # Thu tu: mmap file .nii -> mmap file cache -> giai nen bang VTK (roi ghi cache cho lan sau).
+    # status_callback(message): bao loi khong chan viec doc (vd. khong ghi duoc cache), goi tu thread dang doc
+    loaded = map_nifti(file_path)
+    if loaded is None and cache_dir:
+        identity = file_identity(file_path)
+        cache_path = cache_path_for(cache_dir, file_path)
+        loaded = read_cache(cache_path, identity)
+        if loaded is None:
+            loaded = read_nifti(file_path, progress_callback=progress_callback, cancel_event=cancel_event)
+            try:
+                write_cache(cache_path, identity, loaded)
+            except OSError as e:
+                message = f"Khong ghi duoc cache {cache_path}: {e}"
+                if status_callback: status_callback(message)
+                else: print(message)
+            else:
+                prune_cache(cache_dir, cache_budget, keep=cache_path)
+            loaded.file_path = file_path
+            return loaded
+        _touch(cache_path)
+        loaded.file_path = file_path
+    if loaded is None:
+        return read_nifti(file_path, progress_callback=progress_callback, cancel_event=cancel_event)
+    if progress_callback:
+        slices = loaded.image.GetDimensions()[2]
+        progress_callback(slices, slices)
+    return loaded
@@ -1,42 +1,149 @@
+import os
 import vtk
+from backend.volume_io import load_volume, file_identity, DEFAULT_CACHE_DIR
+from backend.volume_cache import VolumeCache
+from backend.lod import VolumePyramid, DEFAULT_PYRAMID_LEVELS
+from backend.label_tf import LabelTable, count_labels, LIVER_LABEL
+from backend.alignment import resample_labels
+from backend.roi import body_extent, label_extent, extent_to_bounds
+from backend.instrument import timed
+from backend.label_mesh import build_label_meshes
+from backend.label_stats import label_statistics
+from backend.histogram import CTHistogram
+from backend.compact import compact_labels, compact_hu, compaction_saved_bytes
+
+CT_INT16 = os.environ.get("MEDVIEW_CT_INT16", "0") == "1"
 
 class VTKVolumeHelper:
-    def __init__(self):
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, volume_cache=None, lod_levels=DEFAULT_PYRAMID_LEVELS,
+                 ct_int16=CT_INT16):
+        self.cache_dir = cache_dir # Thu muc cache voxel tho cho file .nii.gz (None = tat)
+        self.lod_levels = lod_levels # So muc pyramid thu nho dung khi xoay 3D
+        self.lod = None # InteractiveLOD cua cua so (neu co): an/hien volume phai qua no de proxy cung an
+        self.status_callback = None # Nhan thong bao loi khong chan viec doc (vd. ghi cache tren dia), goi tu thread doc
+        self.roi_enabled = False # Cat vung ve theo hop bao co the (bo qua khong khi)
+        self.roi_use_labels = False # Cat theo hop bao nhan gan/u thay vi co the
+        self.roi_margin_mm = 10.0
+        self.ct_int16 = ct_int16 # Luu CT dang int16 theo HU (ap slope/intercept mot lan) thay vi kieu trong file
+        # Cache trong RAM giu lai qua reset() de mo lai ca cu khong phai giai nen
+        self.volume_cache = volume_cache if volume_cache is not None else VolumeCache()
     # Khoi tao cac dau doc cho volume
-        self.reader_ct = vtk.vtkNIFTIImageReader() # Dau doc file .nii/.nii.gz
         self.mapper_ct = vtk.vtkSmartVolumeMapper() # Bo chuyen doi de tao hinh khoi
         self.volume_ct = vtk.vtkVolume() # Khung chua ket qua
         self.property_ct = vtk.vtkVolumeProperty() # Chua cac thuoc tinh nhu: Mau sac, do trong suot, anh sang,...
     # Khoi tao cac dau doc cho segmentaion
-        self.reader_seg = vtk.vtkNIFTIImageReader()
         self.mapper_seg = vtk.vtkSmartVolumeMapper()
         self.volume_seg = vtk.vtkVolume()
         self.property_seg = vtk.vtkVolumeProperty()
+        self.ct_source = None # LoadedVolume cua CT (anh + header)
+        self.seg_source = None
         self.raw_ct_data = None # Bien tam de luu du lieu tho
+        self.raw_seg_data = None
+        self.label_table = None # Mau/opacity/an-hien tung nhan, tao mot lan moi khi tai segmentation
         self.current_liver_opacity = 0.6 # Luu tru gia tri opacity hien tai cua gan
+        self.mesh_actors = {} # Che do be mat: nhan -> vtkActor (thay cho volume_seg trong khung 3D)
+        self.seg_visible = True
+
+    # Doc file (co the chay tren thread phu), khong dung toi mapper/renderer
+    @timed("volume.read")
+    def read_volume(self, file_path, progress_callback=None, cancel_event=None, prepare=None, cache=True,
+                    convert=None):
+        key = file_identity(file_path)
+        if convert: key = (convert.__name__,) + key # Ban da doi kieu cache rieng voi ban goc
+        loaded = self.volume_cache.get(key)
+        if loaded is not None:
+            if progress_callback:
+                slices = loaded.image.GetDimensions()[2]
+                progress_callback(slices, slices)
+        else:
+            loaded = load_volume(file_path, progress_callback=progress_callback, cancel_event=cancel_event,
+                                 cache_dir=self.cache_dir, status_callback=self.status_callback)
+            if convert: loaded = convert(loaded)
+        if prepare: prepare(loaded) # Tinh du lieu phu (chi lam mot lan, luu trong loaded.derived)
+        if cache: self.volume_cache.put(key, loaded)
+        return loaded
+
+    @timed("ct.read")
+    def read_ct_volume(self, file_path, progress_callback=None, cancel_event=None):
+        return self.read_volume(file_path, progress_callback, cancel_event, prepare=self._prepare_ct,
+                                convert=compact_hu if self.ct_int16 else None)
+
+    @timed("seg.read")
+    def read_segmentation(self, file_path, progress_callback=None, cancel_event=None):
+        # Chi doc file; pyramid/ROI/dem nhan tinh sau khi da dua ve luoi CT (align_segmentation).
+        # Ban tho khong giu trong cache RAM: chi ban gon (uint8, cat theo hop bao) duoc giu lai
+        return self.read_volume(file_path, progress_callback, cancel_event, cache=False)
+
+    @timed("seg.align")
+    def align_segmentation(self, seg_loaded, ct_loaded=None, cancel_event=None):
+        # Dua nhan ve luoi CT theo qform/sform mot lan roi luu gon, ket qua cache theo cap (CT, seg)
+        ct_loaded = ct_loaded or self.ct_source
+        if ct_loaded is None:
+            aligned = compact_labels(seg_loaded)
+            self._prepare_seg(aligned)
+            return aligned
+        key = ("aligned", file_identity(ct_loaded.file_path), file_identity(seg_loaded.file_path))
+        aligned = self.volume_cache.get(key)
+        if aligned is None:
+            aligned = compact_labels(resample_labels(seg_loaded, ct_loaded, cancel_event=cancel_event))
+        self._prepare_seg(aligned)
+        self.volume_cache.put(key, aligned)
+        return aligned
 
+    def _prepare_ct(self, loaded):
+        if "pyramid" not in loaded.derived and self.lod_levels > 0:
+            loaded.derived["pyramid"] = VolumePyramid(loaded.image, self.lod_levels)
+        if "roi_extent" not in loaded.derived:
+            loaded.derived["roi_extent"] = body_extent(loaded)
+        if "histogram" not in loaded.derived:
+            loaded.derived["histogram"] = CTHistogram(loaded)
+
+    def _prepare_seg(self, loaded):
+        if "pyramid" not in loaded.derived and self.lod_levels > 0:
+            loaded.derived["pyramid"] = VolumePyramid(loaded.image, self.lod_levels, labels=True)
+        if "roi_extent" not in loaded.derived:
+            loaded.derived["roi_extent"] = label_extent(loaded)
+        if "label_counts" not in loaded.derived:
+            loaded.derived["label_counts"] = count_labels(loaded.image)
+
+    @timed("ct.load")
     def load_ct_volume(self, file_path):
         print(f"Loading Base CT: {file_path}")
-        self.reader_ct.SetFileName(file_path)
-        self.reader_ct.Update() # Ra lenh cho VTK doc file .nii vao RAM
-        self.raw_ct_data = self.reader_ct.GetOutput() # Luu ban goc du lieu de hien thi 2D
-        self.mapper_ct.SetInputConnection(self.reader_ct.GetOutputPort()) # Chuyen giao du lieu tu Reader -> Mapper
+        return self.attach_ct_volume(self.read_ct_volume(file_path))
+
+    # Gan du lieu da doc vao mapper - phai goi tren thread giao dien
+    @timed("ct.attach")
+    def attach_ct_volume(self, loaded):
+        self.ct_source = loaded
+        self.raw_ct_data = loaded.image # Luu ban goc du lieu de hien thi 2D
+        self.mapper_ct.SetInputData(self.raw_ct_data) # Chuyen giao du lieu -> Mapper
         self._setup_transparent_ct_style() # Ham cai dat giao dien hien thi Mau sac/Do trong
+        self._apply_roi()
     # Gan Mapper va Property vao Volume
         self.volume_ct.SetMapper(self.mapper_ct)
         self.volume_ct.SetProperty(self.property_ct)
         return self.volume_ct
 
+    @timed("seg.load")
     def load_segmentation_overlay(self, file_path):
         print(f"Loading Overlay: {file_path}")
-        self.reader_seg.SetFileName(file_path)
-        self.reader_seg.Update()
-        self.mapper_seg.SetInputConnection(self.reader_seg.GetOutputPort())
+        return self.attach_segmentation_overlay(self.align_segmentation(self.read_segmentation(file_path)))
+
+    @timed("seg.attach")
+    def attach_segmentation_overlay(self, loaded):
+        self.seg_source = loaded
+        self.raw_seg_data = loaded.image
+        info = loaded.derived.get("compaction")
+        if info:
+            print(f"Overlay compact ({info['dtype']}): {info['before'] / 2**20:.1f} MB -> {info['after'] / 2**20:.1f} MB")
+        self.mapper_seg.SetInputData(self.raw_seg_data)
         self._setup_segmentation_style()        
+        self._apply_roi()
         self.volume_seg.SetMapper(self.mapper_seg)
         self.volume_seg.SetProperty(self.property_seg)
         return self.volume_seg
 
+    @timed("ct.style")
     def _setup_transparent_ct_style(self):
         self.property_ct.ShadeOn() # Bat do bong
         self.property_ct.SetAmbient(0.1) # Anh sang nen
@@ -44,86 +151,244 @@ class VTKVolumeHelper:
         self.property_ct.SetSpecular(0.2) # Do bong loang
         self.property_ct.SetInterpolationTypeToLinear() # Lam min tranh bi vo pixel
     # Cau hinh do trong suot theo thang do Hounsfield-HU
+    # Cac moc HU duoc dich theo dinh mo mem va gia tri cao nhat trong histogram cua ca, roi doi ve don vi tho
+        hist = self.get_ct_histogram()
+        shift = 0.0
+        top = 3000.0
+        to_raw = lambda hu: hu
+        if hist is not None:
+            shift = min(max(hist.tissue_peak() - 40.0, -60.0), 60.0) # Pha tiem thuoc lam mo mem sang/toi hon
+            top = max(hist.high_value(), 500.0)
+            to_raw = hist.hu_to_raw
         opacity = vtk.vtkPiecewiseFunction()
-        opacity.AddPoint(-3024, 0.0) # Gia tri san -> Tang hinh
-        opacity.AddPoint(-200, 0.0) # Khong khi/mo -> Tang hinh 
-        opacity.AddPoint(-100, 0.005) # Mo mem -> Hien thi mo
-        opacity.AddPoint(40, 0.01) # Co/mau -> Hien ro hon
-        opacity.AddPoint(400, 0.1) # Xuong -> Hien ro rang
-        opacity.AddPoint(3000, 0.1) # May moc -> Hien ro rang
+        opacity.AddPoint(to_raw(-3024), 0.0) # Gia tri san -> Tang hinh
+        opacity.AddPoint(to_raw(-200 + shift), 0.0) # Khong khi/mo -> Tang hinh 
+        opacity.AddPoint(to_raw(-100 + shift), 0.005) # Mo mem -> Hien thi mo
+        opacity.AddPoint(to_raw(40 + shift), 0.01) # Co/mau -> Hien ro hon
+        opacity.AddPoint(to_raw(400), 0.1) # Xuong -> Hien ro rang
+        opacity.AddPoint(to_raw(top), 0.1) # May moc -> Hien ro rang
         self.property_ct.SetScalarOpacity(opacity)
     # Cau hinh mau sac cho tung khoang gia tri HU
         color = vtk.vtkColorTransferFunction()
-        color.AddRGBPoint(-1000, 0.0, 0.0, 0.0) # Khong khi -> Mau den
-        color.AddRGBPoint(-200,  0.8, 0.5, 0.4) # Mo mem -> Mau da nguoi
-        color.AddRGBPoint(0,     0.9, 0.6, 0.5) # Mau/dich -> Mau do nhat
-        color.AddRGBPoint(400,   1.0, 1.0, 0.9) # Xuong -> Mau trang nga
+        color.AddRGBPoint(to_raw(-1000), 0.0, 0.0, 0.0) # Khong khi -> Mau den
+        color.AddRGBPoint(to_raw(-200 + shift),  0.8, 0.5, 0.4) # Mo mem -> Mau da nguoi
+        color.AddRGBPoint(to_raw(0 + shift),     0.9, 0.6, 0.5) # Mau/dich -> Mau do nhat
+        color.AddRGBPoint(to_raw(400),   1.0, 1.0, 0.9) # Xuong -> Mau trang nga
         self.property_ct.SetColor(color)
 
+    @timed("seg.style")
     def _setup_segmentation_style(self):
         self.property_seg.ShadeOn() 
         self.property_seg.SetInterpolationTypeToLinear()
         self.property_seg.SetAmbient(0.3) 
         self.property_seg.SetDiffuse(1.0) 
         self.property_seg.SetSpecular(0.2) 
-        self.set_liver_opacity(self.current_liver_opacity)
-    # Set-up bang mau cho nhan (Gan va U)
-        color = vtk.vtkColorTransferFunction()
-        color.AddRGBPoint(0.0, 0.0, 0.0, 0.0)
-    # Dat gia tri tu 0.5 -> 1.4 de bao quanh 1.0 sau khi noi suy 
-        color.AddRGBPoint(0.5, 0.0, 1.0, 0.0)
-        color.AddRGBPoint(1.4, 0.0, 1.0, 0.0)
-    # Tuong tu voi khoi U, gia tri tu 1.6 -> 2.5
-        color.AddRGBPoint(1.6, 1.0, 0.0, 0.0)
-        color.AddRGBPoint(2.5, 1.0, 0.0, 0.0) 
-        self.property_seg.SetColor(color)
+    # Bang nhan dung tu cac nhan thuc su co trong file (1 = Gan, 2 = Khoi U, con lai tu sinh mau)
+        labels = self.seg_source.derived.get("label_counts") if self.seg_source else None
+        if labels is None:
+            labels = count_labels(self.raw_seg_data)
+        self.label_table = LabelTable(labels, liver_opacity=self.current_liver_opacity)
+        if len(labels) > 2: # Noi suy tuyen tinh giua nhan 1 va 3 se sinh ra mau nhan 2 gia o bien
+            self.property_seg.SetInterpolationTypeToNearest()
+        self.property_seg.SetScalarOpacity(self.label_table.transfer_function.opacity)
+        self.property_seg.SetColor(self.label_table.transfer_function.color)
 
     def set_liver_opacity(self, opacity_value):
         self.current_liver_opacity = opacity_value
-    # Vung nen luon luon tang hinh
-        opacity = vtk.vtkPiecewiseFunction()
-        opacity.AddPoint(0.0, 0.0)
-        opacity.AddPoint(0.4, 0.0) 
-    # Label 1: Gan (Range 0.5 -> 1.4)
-        opacity.AddPoint(0.5, opacity_value) 
-        opacity.AddPoint(1.4, opacity_value)
-    # Vung chuyen tiep giua gan va u
-        opacity.AddPoint(1.45, 0.0) 
-        opacity.AddPoint(1.55, 0.0)
-    # Label 2: Khoi U (Range 1.6 -> 2.5) -> Luon hien thi
-        opacity.AddPoint(1.6, 1.0)
-        opacity.AddPoint(2.5, 1.0)
-        self.property_seg.SetScalarOpacity(opacity)
+        self.set_label_opacity(LIVER_LABEL, opacity_value)
+
+    # Cac thay doi theo nhan chi sua o cua nhan do trong ham truyen 3D va LUT 2D
+    @timed("label.opacity")
+    def set_label_opacity(self, label, opacity):
+        if self.label_table:
+            self.label_table.set_opacity(label, opacity)
+            self._sync_mesh_actor(label)
+
+    @timed("label.visible")
+    def set_label_visible(self, label, visible):
+        if self.label_table:
+            self.label_table.set_visible(label, visible)
+            self._sync_mesh_actor(label)
+
+    @timed("label.color")
+    def set_label_color(self, label, r, g, b):
+        if self.label_table:
+            self.label_table.set_color(label, r, g, b)
+            self._sync_mesh_actor(label)
+
+    # Che do be mat: moi nhan mot luoi tam giac (trich mot lan, cache tren dia) thay cho ray-cast volume nhan
+    @timed("seg.mesh_build")
+    def build_label_meshes(self, seg_loaded=None, ct_loaded=None, cancel_event=None):
+        # Khong dung toi renderer -> goi duoc tu thread phu
+        seg_loaded = seg_loaded or self.seg_source
+        ct_loaded = ct_loaded or self.ct_source
+        if seg_loaded is None: return {}
+        labels = seg_loaded.derived.get("label_counts") or count_labels(seg_loaded.image)
+        return build_label_meshes(seg_loaded.image, sorted(labels), seg_path=seg_loaded.file_path,
+                                  ct_path=ct_loaded.file_path if ct_loaded else None,
+                                  cache_dir=self.cache_dir, cancel_event=cancel_event)
+
+    @timed("seg.mesh_attach")
+    def attach_label_meshes(self, meshes):
+        self.detach_label_meshes()
+        for label, mesh in meshes.items():
+            mapper = vtk.vtkPolyDataMapper()
+            mapper.SetInputData(mesh)
+            mapper.ScalarVisibilityOff()
+            actor = vtk.vtkActor()
+            actor.SetMapper(mapper)
+            actor.GetProperty().SetSpecular(0.2)
+            self.mesh_actors[label] = actor
+            self._sync_mesh_actor(label)
+        return list(self.mesh_actors.values())
+
+    def detach_label_meshes(self):
+        actors = list(self.mesh_actors.values())
+        self.mesh_actors = {}
+        return actors
+
+    def detach_segmentation_overlay(self):
+        # Bo overlay dang gan (vd. ca moi khong co nhan): khong con nhan, bang nhan, thong ke hay mesh nao
+        # cua ca truoc. Tra ve cac actor mesh de ben goi go khoi renderer
+        actors = self.detach_label_meshes()
+        self.mapper_seg.RemoveAllInputs()
+        self.seg_source = None
+        self.raw_seg_data = None
+        self.label_table = None
+        self._apply_roi()
+        return actors
+
+    def _sync_mesh_actor(self, label):
+        actor = self.mesh_actors.get(label)
+        if actor is None or not self.label_table or label not in self.label_table.entries: return
+        entry = self.label_table.entries[label]
+        opacity = entry["opacity"] if entry["visible"] else 0.0
+        actor.GetProperty().SetColor(entry["color"])
+        actor.GetProperty().SetOpacity(opacity)
+        actor.SetVisibility(self.seg_visible and opacity > 0.0)
+
+    def get_label_table(self):
+        return self.label_table
+
+    def get_ct_saved_bytes(self):
+        return compaction_saved_bytes(self.ct_source)
+
+    def get_seg_saved_bytes(self):
+        # So byte tiet kiem nho luu nhan gon so voi ban tren luoi CT day du
+        return compaction_saved_bytes(self.seg_source)
+
+    @timed("seg.stats")
+    def compute_label_stats(self, seg_loaded=None, ct_loaded=None):
+        # Thong ke tung nhan (the tich, trong tam, HU...), mot luot qua mang nhan.
+        # Luu trong derived cua ban nhan da dua ve luoi CT -> cache theo cap (CT, seg) cung voi no
+        seg_loaded = seg_loaded or self.seg_source
+        ct_loaded = ct_loaded or self.ct_source
+        if seg_loaded is None: return {}
+        if "label_stats" not in seg_loaded.derived:
+            seg_loaded.derived["label_stats"] = label_statistics(seg_loaded.image, ct_loaded)
+        return seg_loaded.derived["label_stats"]
+
+    def get_label_stats(self):
+        return self.seg_source.derived.get("label_stats", {}) if self.seg_source else {}
+
+    def get_label_counts(self):
+        return self.seg_source.derived.get("label_counts", {}) if self.seg_source else {}
 
     def get_raw_data(self): # Ham tra ve du lieu tho tu file CT de hien thi 3 lat cat 2D
         return self.raw_ct_data
     
     def get_segmentation_data(self):
-        if self.reader_seg.GetFileName():
-            return self.reader_seg.GetOutput()
+        return self.raw_seg_data
+
+    def set_roi_cropping(self, enabled, use_labels=None):
+        self.roi_enabled = enabled
+        if use_labels is not None:
+            self.roi_use_labels = use_labels
+        self._apply_roi()
+
+    def get_roi_bounds(self):
+        # Uu tien hop bao nhan (+ le) neu duoc chon va da tai segmentation, khong thi dung hop bao co the
+        if self.roi_use_labels and self.seg_source and self.seg_source.derived.get("roi_extent"):
+            return extent_to_bounds(self.raw_seg_data, self.seg_source.derived["roi_extent"], self.roi_margin_mm)
+        if self.ct_source and self.ct_source.derived.get("roi_extent"):
+            return extent_to_bounds(self.raw_ct_data, self.ct_source.derived["roi_extent"])
         return None
+
+    @timed("roi.apply")
+    def _apply_roi(self):
+        bounds = self.get_roi_bounds() if self.roi_enabled else None
+        for mapper in (self.mapper_ct, self.mapper_seg):
+            if bounds:
+                mapper.SetCroppingRegionPlanes(bounds)
+                mapper.SetCroppingRegionFlagsToSubVolume()
+                mapper.CroppingOn()
+            else:
+                mapper.CroppingOff()
+
+    def get_ct_histogram(self):
+        return self.ct_source.derived.get("histogram") if self.ct_source else None
+
+    def window_preset(self, name="auto"):
+        # (window, level) cho MPR theo don vi voxel cua CT dang mo, chi doc histogram da tinh san
+        hist = self.get_ct_histogram()
+        if hist is None: return None
+        return hist.to_raw(*hist.preset(name))
+
+    def ct_value_range(self):
+        hist = self.get_ct_histogram()
+        return hist.value_range() if hist is not None else None
+
+    def ct_rescale(self):
+        # (slope, intercept) doi gia tri voxel CT dang mo sang HU (ban int16 HU: (1, 0))
+        if self.ct_source is None: return None
+        return self.ct_source.slope or 1.0, self.ct_source.intercept
+
+    def get_ct_pyramid(self):
+        return self.ct_source.derived.get("pyramid") if self.ct_source else None
+
+    def get_seg_pyramid(self):
+        return self.seg_source.derived.get("pyramid") if self.seg_source else None
         
+    @timed("ct.opacity_factor")
     def set_opacity_factor(self, value):
         if value <= 0: value = 0.01
         self.property_ct.SetScalarOpacityUnitDistance(1.0 / value)
 
+    def _set_volume_visibility(self, volume, is_visible):
+        if self.lod is not None: self.lod.set_visibility(volume, is_visible)
+        else: volume.SetVisibility(is_visible)
+
     def set_ct_visiblility(self, is_visible):
         if self.volume_ct:
-            self.volume_ct.SetVisibility(is_visible)
+            self._set_volume_visibility(self.volume_ct, is_visible)
 
     def set_seg_visiblility(self, is_visible):
+        self.seg_visible = is_visible
         if self.volume_seg:
-            self.volume_seg.SetVisibility(is_visible)
+            self._set_volume_visibility(self.volume_seg, is_visible)
+        for label in self.mesh_actors:
+            self._sync_mesh_actor(label)
 
-    def reset(self):
-        self.reader_ct = vtk.vtkNIFTIImageReader()
+    def reset(self, window=None):
+        # Go dau vao khoi mapper cu truoc khi thay: neu con ai giu volume/mapper cu thi voxel van duoc giai phong.
+        # Co window: tra ca ban sao texture 3D cua volume (mapper giu den khi bi huy hoac duoc bao giai phong)
+        if window is not None:
+            for prop in [self.volume_ct, self.volume_seg] + list(self.mesh_actors.values()):
+                prop.ReleaseGraphicsResources(window)
+        for mapper in (self.mapper_ct, self.mapper_seg):
+            mapper.RemoveAllInputs()
         self.mapper_ct = vtk.vtkSmartVolumeMapper()
         self.volume_ct = vtk.vtkVolume()
         self.property_ct = vtk.vtkVolumeProperty()
-        self.reader_seg = vtk.vtkNIFTIImageReader()
         self.mapper_seg = vtk.vtkSmartVolumeMapper()
         self.volume_seg = vtk.vtkVolume()
         self.property_seg = vtk.vtkVolumeProperty()    
+        self.ct_source = None
+        self.seg_source = None
         self.raw_ct_data = None
+        self.raw_seg_data = None
+        self.label_table = None
         self.current_liver_opacity = 0.6
+        self.mesh_actors = {}
+        self.seg_visible = True
         print("Backend đã được Reset sạch sẽ.")
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backend.cases import load_pairs, case_name
+from backend.volume_io import LoadCancelled
+
+DEFAULT_PREFETCH = 2 # So ca ke tiep giai nen san
+DEFAULT_PRELOAD_BUDGET_BYTES = int(os.environ.get("MEDVIEW_PRELOAD_MB", "1536")) * 1024 * 1024
+
+class Worklist:
+    # Phien doc nhieu ca lien tiep: giu ca hien tai + `prefetch` ca ke tiep da giai nen, dua nhan ve luoi CT
+    # va tinh san du lieu phu (histogram, pyramid, dem nhan) tren thread nen, trong gioi han budget_bytes.
+    # Ca chuan bi xong nam trong VolumeCache cua helper nen attach_* khi chuyen ca khong phai doc lai file.
+    def __init__(self, pairs, helper, prefetch=DEFAULT_PREFETCH, budget_bytes=DEFAULT_PRELOAD_BUDGET_BYTES,
+                 workers=1):
+        self.pairs = list(pairs)
+        self.helper = helper
+        self.prefetch = prefetch
+        self.budget_bytes = budget_bytes
+        self.index = -1
+        # Mac dinh 1 thread: chuan bi dung thu tu, khong tranh CPU voi ca dang xem
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medview-preload")
+        self.jobs = {} # chi so ca -> (future, cancel_event)
+        self.ready = {} # chi so ca -> (ct, seg) da chuan bi, giu tham chieu de cache khong day ra
+        self._lock = threading.RLock() # _schedule duoc goi ca tu thread giao dien lan thread nen
+
+    @classmethod
+    def from_source(cls, source, helper, **kwargs):
+        # Thu muc hoac CSV (ct, seg) nhu backend.cases.load_pairs
+        return cls(load_pairs(source), helper, **kwargs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def name(self, index=None):
+        index = self.index if index is None else index
+        return case_name(self.pairs[index][0]) if 0 <= index < len(self.pairs) else ""
+
+    def _prepare(self, index, cancel_event, progress_callback=None):
+        ct_path, seg_path = self.pairs[index]
+        ct = self.helper.read_ct_volume(ct_path, progress_callback=progress_callback, cancel_event=cancel_event)
+        seg = None
+        if seg_path:
+            seg = self.helper.read_segmentation(seg_path, cancel_event=cancel_event)
+            seg = self.helper.align_segmentation(seg, ct, cancel_event=cancel_event)
+        if cancel_event.is_set(): raise LoadCancelled(ct_path)
+        with self._lock:
+            self.ready[index] = (ct, seg)
+        return ct, seg
+
+    @staticmethod
+    def _case_bytes(case):
+        return sum(loaded.nbytes for loaded in case if loaded is not None)
+
+    def ready_bytes(self):
+        with self._lock:
+            return sum(self._case_bytes(case) for case in self.ready.values())
+
+    def _estimate_bytes(self):
+        # Ca chua giai nen: uoc luong bang trung binh cac ca da chuan bi (cung bo du lieu nen kich thuoc gan nhau)
+        with self._lock:
+            sizes = [self._case_bytes(case) for case in self.ready.values()]
+        return sum(sizes) / len(sizes) if sizes else 0
+
+    def _schedule(self):
+        # Bo ca ngoai cua so [index, index + prefetch], dat lich chuan bi cac ca ke tiep con vua budget
+        with self._lock:
+            window = range(self.index, min(self.index + self.prefetch, len(self.pairs) - 1) + 1)
+            for index in [i for i in self.ready if i not in window]:
+                del self.ready[index]
+            for index in [i for i in self.jobs if i not in window]:
+                future, cancel_event = self.jobs.pop(index)
+                cancel_event.set()
+                future.cancel()
+            # Ca dang chuan bi cung tinh vao budget; chua co ca nao xong thi chua biet kich thuoc -> chi lam ca hien tai
+            estimate = self._estimate_bytes()
+            pending = sum(1 for i in self.jobs if i not in self.ready)
+            planned = self.ready_bytes() + pending * estimate
+            for index in window:
+                job = self.jobs.get(index)
+                if job and not (job[0].done() and (job[0].cancelled() or job[0].exception())): continue
+                if index != self.index:
+                    if not estimate or planned + estimate > self.budget_bytes:
+                        break # Het budget: ca sau se duoc chuan bi khi chuyen toi
+                    planned += estimate
+                cancel_event = threading.Event()
+                future = self.executor.submit(self._prepare, index, cancel_event)
+                self.jobs[index] = (future, cancel_event)
+                future.add_done_callback(self._on_prepared)
+
+    def _on_prepared(self, future):
+        if future.cancelled() or future.exception(): return
+        self._schedule()
+
+    def load_case(self, index, progress_callback=None, cancel_event=None):
+        # Dung lam load_fn cua AsyncVolumeLoader: tra ve (ct, seg) cua ca, cho ca dang chuan bi neu can
+        with self._lock:
+            self.index = index
+            self._schedule() # Ca loi/bi huy truoc do duoc dat lich lai
+            future, _ = self.jobs[index]
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise LoadCancelled(self.pairs[index][0])
+            if future.done(): break
+            time.sleep(0.02)
+        if future.cancelled(): raise LoadCancelled(self.pairs[index][0])
+        return future.result()
+
+    def is_ready(self, index):
+        with self._lock:
+            return index in self.ready
+
+    def has_next(self):
+        return self.index + 1 < len(self.pairs)
+
+    def has_previous(self):
+        return self.index > 0
+
+    def shutdown(self):
+        with self._lock:
+            self.index = len(self.pairs) # Khong dat lich them
+        for future, cancel_event in self.jobs.values():
+            cancel_event.set()
+            future.cancel()
+        self.jobs.clear()
+        with self._lock:
+            self.ready.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
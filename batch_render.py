@@ -0,0 +1,130 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import vtk
+from backend.cases import load_pairs, case_name
+
+DEFAULT_SIZE = 512 # Canh cua moi anh PNG
+DEFAULT_WINDOW = 400.0 # Cua so bung (HU) cho anh 2D
+DEFAULT_LEVEL = 40.0
+SNAPSHOTS = ("3d", "axial", "coronal", "sagittal")
+
+def snapshot_paths(out_dir, name):
+    case_dir = os.path.join(out_dir, name)
+    return {view: os.path.join(case_dir, f"{view}.png") for view in SNAPSHOTS + ("montage",)}
+
+def is_up_to_date(paths, ct_path, seg_path):
+    # Du anh va anh moi hon ca CT lan segmentation -> bo qua
+    if not all(os.path.exists(p) for p in paths.values()): return False
+    newest_input = max(os.path.getmtime(p) for p in (ct_path, seg_path) if p)
+    return min(os.path.getmtime(p) for p in paths.values()) >= newest_input
+
+def _write_png(window, path, extent=None):
+    grabber = vtk.vtkWindowToImageFilter()
+    grabber.SetInput(window)
+    grabber.ReadFrontBufferOff()
+    grabber.Update()
+    source = grabber
+    if extent is not None: # Cat mot khung (viewport) ra khoi anh ca cua so
+        voi = vtk.vtkExtractVOI()
+        voi.SetInputConnection(grabber.GetOutputPort())
+        voi.SetVOI(extent[0], extent[1], extent[2], extent[3], 0, 0)
+        source = voi
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(path)
+    writer.SetInputConnection(source.GetOutputPort())
+    writer.Write()
+
+def render_case(ct_path, seg_path, out_dir, size=DEFAULT_SIZE, at="centroid",
+                window_width=DEFAULT_WINDOW, window_level=DEFAULT_LEVEL):
+    # Chay trong tien trinh con: dung lai VTKVolumeHelper (style 3D) va MPRViewer (bo cuc 4 khung), khong can Tk
+    from backend.volume_renderer import VTKVolumeHelper
+    from backend.handler import MPRViewer
+    from backend.roi import label_centroid
+    vtk.vtkObject.GlobalWarningDisplayOff()
+    start = time.perf_counter()
+    name = case_name(ct_path)
+    paths = snapshot_paths(out_dir, name)
+    os.makedirs(os.path.dirname(paths["3d"]), exist_ok=True)
+    helper = VTKVolumeHelper(cache_dir=None) # Moi ca doc mot lan, khong lam day cache tren dia
+    volume_ct = helper.load_ct_volume(ct_path)
+    volume_seg = helper.load_segmentation_overlay(seg_path) if seg_path else None
+
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(2 * size, 2 * size)
+    interactor = vtk.vtkRenderWindowInteractor() # MPRViewer gan interactor style vao cua so
+    interactor.SetRenderWindow(window)
+    renderer = vtk.vtkRenderer()
+    renderer.SetBackground(0.05, 0.05, 0.05)
+    window.AddRenderer(renderer)
+    renderer.AddVolume(volume_ct)
+    if volume_seg: renderer.AddVolume(volume_seg)
+    # Nhin tu phia truoc benh nhan, dau huong len tren
+    camera = renderer.GetActiveCamera()
+    center = helper.get_raw_data().GetCenter()
+    camera.SetFocalPoint(center)
+    camera.SetPosition(center[0], center[1] - 1.0, center[2])
+    camera.SetViewUp(0, 0, 1)
+    renderer.ResetCamera()
+    window.SetSize(size, size)
+    window.Render()
+    _write_png(window, paths["3d"])
+
+    window.SetSize(2 * size, 2 * size)
+    # --window/--level tinh bang HU; bang mau MPR lam viec tren don vi tho cua voxel (slope/intercept trong header)
+    window_level = helper.get_ct_histogram().to_raw(window_width, window_level)
+    mpr = MPRViewer(window, renderer, helper.get_raw_data(), helper.get_segmentation_data(),
+                    label_table=helper.get_label_table(), window_level=window_level,
+                    scalar_range=helper.ct_value_range())
+    target = None
+    if at == "centroid" and helper.get_segmentation_data() is not None:
+        target = label_centroid(helper.get_segmentation_data())
+    for view in mpr.views:
+        index = round(target[view.axis]) if target else view.get_max_slice() // 2
+        view.set_slice(index)
+    window.Render()
+    _write_png(window, paths["montage"])
+    # Bo cuc MPRViewer: axial tren-trai, coronal tren-phai, sagittal duoi-trai, 3D duoi-phai (goc anh o duoi-trai)
+    quadrants = {"axial": (0, size), "coronal": (size, size), "sagittal": (0, 0)}
+    for view, (x0, y0) in quadrants.items():
+        _write_png(window, paths[view], (x0, x0 + size - 1, y0, y0 + size - 1))
+    mpr.clear()
+    return name, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Render anh xem truoc (3D + 3 lat MPR) cho ca thu muc ca benh")
+    parser.add_argument("source", help="Thu muc chua cap CT/segmentation hoac file CSV (ct, seg)")
+    parser.add_argument("output", help="Thu muc ghi PNG (moi ca mot thu muc con)")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--at", choices=("centroid", "center"), default="centroid",
+                        help="Lat cat qua trong tam nhan hoac qua tam volume")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW)
+    parser.add_argument("--level", type=float, default=DEFAULT_LEVEL)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="Render lai ca ca da co anh moi")
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.source)
+    todo = [(ct, seg) for ct, seg in pairs
+            if args.force or not is_up_to_date(snapshot_paths(args.output, case_name(ct)), ct, seg)]
+    print(f"{len(pairs)} ca, {len(pairs) - len(todo)} da co anh, {len(todo)} can render")
+    if not todo: return
+    failed = 0
+    context = multiprocessing.get_context("spawn") # Moi tien trinh mot context OpenGL rieng
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(todo))), mp_context=context) as pool:
+        futures = {pool.submit(render_case, ct, seg, args.output, args.size, args.at, args.window, args.level): ct
+                   for ct, seg in todo}
+        for future in as_completed(futures):
+            try:
+                name, seconds = future.result()
+                print(f"OK   {name} ({seconds:.1f} s)")
+            except Exception as e:
+                failed += 1
+                print(f"LOI  {case_name(futures[future])}: {e}")
+    if failed: raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
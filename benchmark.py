@@ -0,0 +1,281 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.label_tf import LabelTransferFunction
+from backend.memory import peak_rss
+
+vtk.vtkObject.GlobalWarningDisplayOff()
+
+def _rebuild_liver_opacity(property_seg, opacity_value):
+    # Cach cu cua set_liver_opacity: tao ham moi 8 diem moi lan keo slider
+    opacity = vtk.vtkPiecewiseFunction()
+    opacity.AddPoint(0.0, 0.0)
+    opacity.AddPoint(0.4, 0.0)
+    opacity.AddPoint(0.5, opacity_value)
+    opacity.AddPoint(1.4, opacity_value)
+    opacity.AddPoint(1.45, 0.0)
+    opacity.AddPoint(1.55, 0.0)
+    opacity.AddPoint(1.6, 1.0)
+    opacity.AddPoint(2.5, 1.0)
+    property_seg.SetScalarOpacity(opacity)
+
+def _label_scene(size):
+    # Volume nhan gia lap (nen 0, khoi gan 1, khoi u 2) trong cua so offscreen
+    source = vtk.vtkImageData()
+    source.SetDimensions(size, size, size)
+    source.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
+    scalars = source.GetPointData().GetScalars()
+    scalars.Fill(0)
+    for k in range(size // 4, 3 * size // 4):
+        for j in range(size // 4, 3 * size // 4):
+            base = (k * size + j) * size
+            for i in range(size // 4, 3 * size // 4):
+                scalars.SetValue(base + i, 2 if i > size // 2 and j > size // 2 else 1)
+    mapper = vtk.vtkSmartVolumeMapper()
+    mapper.SetInputData(source)
+    prop = vtk.vtkVolumeProperty()
+    volume = vtk.vtkVolume()
+    volume.SetMapper(mapper)
+    volume.SetProperty(prop)
+    renderer = vtk.vtkRenderer()
+    renderer.AddVolume(volume)
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(256, 256)
+    window.AddRenderer(renderer)
+    renderer.ResetCamera()
+    return prop, window
+
+def bench_transfer_function(updates=500, render=False, size=64):
+    prop, window = _label_scene(size)
+    values = [(i % 100) / 100.0 for i in range(updates)]
+    results = {}
+
+    _rebuild_liver_opacity(prop, 0.6)
+    if render: window.Render()
+    start = time.perf_counter()
+    for value in values:
+        _rebuild_liver_opacity(prop, value)
+        if render: window.Render()
+    results["rebuild"] = (time.perf_counter() - start) / updates
+
+    label_tf = LabelTransferFunction({1: (0.0, 1.0, 0.0, 0.6), 2: (1.0, 0.0, 0.0, 1.0)})
+    prop.SetScalarOpacity(label_tf.opacity)
+    prop.SetColor(label_tf.color)
+    if render: window.Render()
+    start = time.perf_counter()
+    for value in values:
+        label_tf.set_opacity(1, value + 1e-6) # Tranh bo qua khi gia tri khong doi
+        if render: window.Render()
+    results["in_place"] = (time.perf_counter() - start) / updates
+    return results
+
+DEFAULT_SIZES = "128,256,512x512x800"
+DEFAULT_SCROLL_STEPS = 200
+DEFAULT_THRESHOLD = 0.10 # Cham hon baseline qua 10% -> bao la hoi quy
+SYNTHETIC_SPACING = (0.8, 0.8, 1.0)
+
+def parse_size(text):
+    # "128" -> 128^3, "512x512x800" -> (nx, ny, nz)
+    parts = [int(p) for p in text.lower().split("x")]
+    return tuple(parts * 3) if len(parts) == 1 else tuple(parts)
+
+def size_name(size):
+    return "x".join(str(n) for n in size)
+
+def _write_nifti(path, voxels):
+    image = vtk.vtkImageData()
+    nz, ny, nx = voxels.shape
+    image.SetDimensions(nx, ny, nz)
+    image.SetSpacing(SYNTHETIC_SPACING)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=False))
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(image)
+    writer.SetFileName(path)
+    writer.Write()
+
+def synthetic_case(data_dir, size):
+    # CT gia lap (khong khi, than, gan, cot song) + nhan (1 = gan, 2 = u), tao tung lat de khong ton RAM
+    nx, ny, nz = size
+    name = size_name(size)
+    ct_path = os.path.join(data_dir, f"synthetic_{name}_ct.nii")
+    seg_path = os.path.join(data_dir, f"synthetic_{name}_seg.nii")
+    if os.path.exists(ct_path) and os.path.exists(seg_path):
+        return ct_path, seg_path
+    ct = np.empty((nz, ny, nx), dtype=np.int16)
+    seg = np.zeros((nz, ny, nx), dtype=np.uint8)
+    y, x = np.mgrid[-1:1:ny * 1j, -1:1:nx * 1j]
+    rng = np.random.default_rng(0)
+    for k in range(nz):
+        z = 2.0 * k / max(nz - 1, 1) - 1.0
+        body = (x / 0.85) ** 2 + (y / 0.65) ** 2 <= 1.0
+        liver = ((x + 0.3) / 0.35) ** 2 + ((y + 0.1) / 0.3) ** 2 + (z / 0.6) ** 2 <= 1.0
+        tumour = (x + 0.35) ** 2 + (y + 0.1) ** 2 + z ** 2 <= 0.1 ** 2
+        spine = x ** 2 + (y - 0.45) ** 2 <= 0.08 ** 2
+        plane = np.full((ny, nx), -1000.0)
+        plane[body] = 40.0
+        plane[liver] = 60.0
+        plane[tumour] = 90.0
+        plane[spine] = 700.0
+        plane[body] += rng.normal(0.0, 10.0, int(body.sum()))
+        ct[k] = plane
+        seg[k][liver] = 1
+        seg[k][tumour] = 2
+    _write_nifti(ct_path, ct)
+    _write_nifti(seg_path, seg)
+    return ct_path, seg_path
+
+def _percentile_ms(values, q):
+    return float(np.percentile(values, q)) * 1000.0 if values else 0.0
+
+def run_case(ct_path, seg_path, scroll_steps=DEFAULT_SCROLL_STEPS, window_size=(1024, 768)):
+    # Chay trong tien trinh rieng (dinh RSS tinh cho tung kich thuoc), khong can Tk
+    from backend.volume_renderer import VTKVolumeHelper
+    from backend.handler import MPRViewer
+    vtk.vtkObject.GlobalWarningDisplayOff()
+    helper = VTKVolumeHelper(cache_dir=None) # Do thoi gian doc that, khong dung cache tren dia
+    results = {}
+    start = time.perf_counter()
+    volume_ct = helper.load_ct_volume(ct_path)
+    results["load_ct_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    volume_seg = helper.load_segmentation_overlay(seg_path)
+    results["load_seg_s"] = time.perf_counter() - start
+
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(*window_size)
+    renderer = vtk.vtkRenderer()
+    window.AddRenderer(renderer)
+    interactor = vtk.vtkRenderWindowInteractor()
+    interactor.SetRenderWindow(window)
+    renderer.AddVolume(volume_ct)
+    renderer.AddVolume(volume_seg)
+    renderer.ResetCamera()
+    start = time.perf_counter()
+    window.Render()
+    results["first_render_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mpr = MPRViewer(window, renderer, helper.get_raw_data(), helper.get_segmentation_data(),
+                    label_table=helper.get_label_table())
+    window.Render()
+    results["mpr_build_s"] = time.perf_counter() - start
+
+    # Cuon chuot qua _update_slice tren khung axial (doi chieu khi cham lat dau/cuoi)
+    view = mpr.views[0]
+    direction = 1
+    latencies = []
+    for _ in range(scroll_steps):
+        if not 0 <= view.slice_index + direction <= view.get_max_slice():
+            direction = -direction
+        start = time.perf_counter()
+        mpr.style._update_slice(view.renderer, view, direction)
+        latencies.append(time.perf_counter() - start)
+    results["scroll_mean_ms"] = float(np.mean(latencies)) * 1000.0 if latencies else 0.0
+    results["scroll_p50_ms"] = _percentile_ms(latencies, 50)
+    results["scroll_p95_ms"] = _percentile_ms(latencies, 95)
+    results["scroll_max_ms"] = max(latencies) * 1000.0 if latencies else 0.0
+    mpr.clear()
+    results["peak_rss_mb"] = peak_rss() / 2**20
+    return results
+
+def run_suite(sizes, data_dir, scroll_steps=DEFAULT_SCROLL_STEPS):
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "vtk": vtk.vtkVersion.GetVTKVersion(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "scroll_steps": scroll_steps,
+        },
+        "cases": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        name = size_name(size)
+        print(f"[{name}] tao du lieu...", flush=True)
+        ct_path, seg_path = synthetic_case(data_dir, size)
+        # Moi kich thuoc mot tien trinh moi: dinh RSS va cache khong lan sang nhau
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results = pool.submit(run_case, ct_path, seg_path, scroll_steps).result()
+        report["cases"][name] = results
+        print(f"[{name}] " + ", ".join(f"{k}={v:.3f}" for k, v in results.items()), flush=True)
+    return report
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # Moi chi so deu "nho hon la tot hon". Tra ve danh sach (case, chi so, baseline, hien tai, ti le)
+    regressions = []
+    print(f"{'case':16s} {'metric':16s} {'baseline':>12s} {'current':>12s} {'change':>9s}")
+    for name, results in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            print(f"{name:16s} (khong co trong baseline)")
+            continue
+        for metric, value in results.items():
+            if metric not in base: continue
+            ratio = value / base[metric] - 1.0 if base[metric] else 0.0
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions.append((name, metric, base[metric], value, ratio))
+            print(f"{name:16s} {metric:16s} {base[metric]:12.3f} {value:12.3f} {ratio * 100:+8.1f}%{flag}")
+    return regressions
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="MedView micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    tf = sub.add_parser("tf", help="Do thoi gian cap nhat opacity nhan: dung lai ham vs sua tai cho")
+    tf.add_argument("--updates", type=int, default=500)
+    tf.add_argument("--render", action="store_true", help="Render offscreen sau moi lan cap nhat")
+    tf.add_argument("--size", type=int, default=64)
+    suite = sub.add_parser("suite", help="Do thoi gian tai, render dau tien, dung MPR va cuon lat cat (offscreen)")
+    suite.add_argument("--sizes", default=DEFAULT_SIZES, help="Danh sach kich thuoc, vd 128,256,512x512x800")
+    suite.add_argument("--scroll-steps", type=int, default=DEFAULT_SCROLL_STEPS)
+    suite.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "medview-bench"),
+                       help="Noi luu NIfTI gia lap (dung lai giua cac lan chay)")
+    suite.add_argument("--output", help="Ghi ket qua JSON ra file")
+    suite.add_argument("--baseline", help="So sanh voi file JSON da luu")
+    suite.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare = sub.add_parser("compare", help="So sanh hai file ket qua JSON")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    if args.command == "tf":
+        results = bench_transfer_function(args.updates, args.render, args.size)
+        for name, seconds in results.items():
+            print(f"{name:10s} {seconds * 1e6:10.1f} us/update")
+        print(f"speed-up   {results['rebuild'] / results['in_place']:10.1f}x")
+    elif args.command == "suite":
+        os.makedirs(args.data_dir, exist_ok=True)
+        sizes = [parse_size(text) for text in args.sizes.split(",") if text.strip()]
+        report = run_suite(sizes, args.data_dir, args.scroll_steps)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        if args.baseline:
+            if compare_reports(_load_json(args.baseline), report, args.threshold):
+                sys.exit(1)
+    elif args.command == "compare":
+        if compare_reports(_load_json(args.baseline), _load_json(args.current), args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Cho phep tests/ import backend va cac script o thu muc goc khi chay "pytest"
@@ -1,9 +1,15 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, colorchooser
 import vtk
 import os
 from backend.volume_renderer import VTKVolumeHelper 
 from backend.handler import MPRViewer 
+from backend.async_loader import AsyncVolumeLoader
+from backend.lod import InteractiveLOD
+from backend.render_scheduler import RenderScheduler
+from backend.instrument import INSTRUMENTS
+from backend.memory import ReleaseCheck, cached_buffers, memory_report, format_report
+from backend.worklist import Worklist
 
 vtk.vtkObject.GlobalWarningDisplayOff() # Tat cac cua so canh bao
 
@@ -15,12 +21,30 @@ class MedViewApp(tk.Tk):
         self.configure(bg="#1e1e1e")
         self.iconbitmap(default=None)
         self.backend = VTKVolumeHelper()
+        # Doc file tren thread phu de UI khong bi dung; canh bao tu thread doc (vd. cache day dia) hien o thanh trang thai
+        self.loader = AsyncVolumeLoader(self, on_status=lambda message: self.lbl_status.config(text=message))
+        self.backend.status_callback = self.loader.post_status
+        self.ct_job = None
+        self.seg_job = None
+        self.mesh_job = None # Trich luoi be mat cho nhan (che do mesh)
+        self.stats_job = None # Thong ke the tich/HU tung nhan
+        self.pending_seg = None # Overlay doc xong truoc CT -> cho CT roi moi gan
+        self.worklist = None # Phien doc nhieu ca: chuan bi san cac ca ke tiep tren thread nen
         self.mpr_viewer = None 
         self.is_mpr_active = False
+        self.window_preset_name = "auto" # Cua so MPR: auto / abdomen / liver / bone (tu histogram CT)
         self.paned_window = tk.PanedWindow(self, orient=tk.HORIZONTAL, bg="#1e1e1e", sashwidth=4, sashrelief=tk.RAISED)
         self.paned_window.pack(fill=tk.BOTH, expand=True)
         self.show_ct = tk.BooleanVar(value=True)
         self.show_seg = tk.BooleanVar(value=True)
+        self.crop_roi = tk.BooleanVar(value=False)
+        self.crop_to_labels = tk.BooleanVar(value=False)
+        self.ct_int16 = tk.BooleanVar(value=self.backend.ct_int16)
+        self.seg_mesh = tk.BooleanVar(value=False)
+        self.instrument_on = tk.BooleanVar(value=INSTRUMENTS.enabled)
+        self._stats_after_id = None
+        self._probe_after_id = None # Cap nhat o doc HU toi da PROBE_INTERVAL_MS mot lan
+        self._probe_sample = None
     # Khung trai
         self.frame_left = tk.Frame(self.paned_window, bg="#2d2d2d", width=300)
         self.paned_window.add(self.frame_left, minsize=250)
@@ -28,6 +52,7 @@ class MedViewApp(tk.Tk):
         self.frame_right = tk.Frame(self.paned_window, bg="black")
         self.paned_window.add(self.frame_right, stretch="always")
         self._create_control_panel()
+        if INSTRUMENTS.enabled: self._refresh_stats()
         self._init_vtk_embedded()
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
@@ -67,6 +92,25 @@ class MedViewApp(tk.Tk):
                                       state="disabled",
                                       command=self.action_toggle_layer_visibility)
         self.chk_seg.pack(side=tk.RIGHT, padx=(5, 0))
+        # Worklist: thu muc hoac CSV cap CT/segmentation, cac ca ke tiep duoc giai nen san
+        frame_worklist = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_worklist.pack(fill=tk.X, padx=pad_x, pady=(5, 0))
+        tk.Button(frame_worklist, text="Worklist (thư mục)", bg="#444", fg="white", relief="flat",
+                  command=lambda: self.action_open_worklist(csv_file=False)).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Button(frame_worklist, text="CSV", bg="#444", fg="white", relief="flat",
+                  command=lambda: self.action_open_worklist(csv_file=True)).pack(side=tk.LEFT, padx=(5, 0))
+        frame_nav = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_nav.pack(fill=tk.X, padx=pad_x, pady=(2, 0))
+        self.btn_prev_case = tk.Button(frame_nav, text="◀", bg="#444", fg="white", relief="flat", width=3,
+                                       state="disabled", command=lambda: self.action_goto_case(-1))
+        self.btn_prev_case.pack(side=tk.LEFT)
+        self.btn_next_case = tk.Button(frame_nav, text="▶", bg="#444", fg="white", relief="flat", width=3,
+                                       state="disabled", command=lambda: self.action_goto_case(1))
+        self.btn_next_case.pack(side=tk.RIGHT)
+        self.lbl_case = tk.Label(frame_nav, text="", fg="#ccc", bg="#2d2d2d", font=("Arial", 8))
+        self.lbl_case.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.bind("<Next>", lambda e: self.action_goto_case(1)) # PageDown / PageUp
+        self.bind("<Prior>", lambda e: self.action_goto_case(-1))
         tk.Frame(self.frame_left, bg="#444", height=1).pack(fill=tk.X, padx=pad_x, pady=15)
         # NHÓM HIỂN THỊ (VISUALIZATION)
         lbl_grp2 = tk.Label(self.frame_left, text="CHẾ ĐỘ XEM & HIỆU CHỈNH", fg="#888", bg="#2d2d2d", font=("Arial", 9, "bold"))
@@ -92,6 +136,72 @@ class MedViewApp(tk.Tk):
                                command=self.action_change_liver_opacity)
         self.slider_liver.set(0.6)
         self.slider_liver.pack(fill=tk.X, padx=pad_x, pady=5)
+        # Danh sach nhan co trong segmentation (an/hien, doi mau tung nhan)
+        frame_labels = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_labels.pack(fill=tk.X, padx=pad_x, pady=5)
+        scroll_labels = tk.Scrollbar(frame_labels, orient=tk.VERTICAL)
+        self.list_labels = tk.Listbox(frame_labels, height=5, bg="#1e1e1e", fg="white", 
+                                      selectbackground="#007ACC", highlightthickness=0, relief="flat",
+                                      exportselection=False, yscrollcommand=scroll_labels.set)
+        scroll_labels.config(command=self.list_labels.yview)
+        scroll_labels.pack(side=tk.RIGHT, fill=tk.Y)
+        self.list_labels.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.list_labels.bind("<<ListboxSelect>>", lambda e: self._show_label_details())
+        self.lbl_label_info = tk.Label(self.frame_left, text="", fg="#aaa", bg="#2d2d2d", 
+                                       font=("Arial", 8), justify=tk.LEFT, anchor="w")
+        self.lbl_label_info.pack(fill=tk.X, padx=pad_x)
+        # Gia tri duoi con tro tren khung 2D (HU, nhan, voxel) + khoang cach giua 2 diem click
+        self.lbl_probe = tk.Label(self.frame_left, text="", fg="#4CAF50", bg="#2d2d2d", 
+                                  font=("Courier", 8), justify=tk.LEFT, anchor="w")
+        self.lbl_probe.pack(fill=tk.X, padx=pad_x)
+        self.lbl_measure = tk.Label(self.frame_left, text="", fg="#FFD700", bg="#2d2d2d", 
+                                    font=("Courier", 8), justify=tk.LEFT, anchor="w")
+        self.lbl_measure.pack(fill=tk.X, padx=pad_x)
+        frame_label_btns = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_label_btns.pack(fill=tk.X, padx=pad_x)
+        tk.Button(frame_label_btns, text="Ẩn/Hiện nhãn", bg="#444", fg="white", relief="flat",
+                  command=self.action_toggle_label).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Button(frame_label_btns, text="Đổi màu", bg="#444", fg="white", relief="flat",
+                  command=self.action_recolor_label).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        # Cat vung ROI (bo qua khong khi) de do toc do ve
+        tk.Checkbutton(self.frame_left, text="Cắt vùng ROI (bỏ không khí)", 
+                       bg="#2d2d2d", fg="white", selectcolor="#444", activebackground="#2d2d2d",
+                       variable=self.crop_roi,
+                       command=self.action_toggle_roi).pack(anchor="w", padx=pad_x)
+        tk.Checkbutton(self.frame_left, text="ROI theo vùng Gan/U", 
+                       bg="#2d2d2d", fg="white", selectcolor="#444", activebackground="#2d2d2d",
+                       variable=self.crop_to_labels,
+                       command=self.action_toggle_roi).pack(anchor="w", padx=pad_x)
+        # Cua so MPR dung san (tinh tu histogram CT luc tai, doi cua so khong quet lai voxel)
+        frame_presets = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_presets.pack(fill=tk.X, padx=pad_x, pady=(5, 0))
+        for name, text in (("auto", "Auto"), ("abdomen", "Bụng"), ("liver", "Gan"), ("bone", "Xương")):
+            tk.Button(frame_presets, text=text, bg="#444", fg="white", relief="flat",
+                      command=lambda n=name: self.action_window_preset(n)).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
+        # Nhan hien bang luoi be mat thay vi ray-cast volume nhan trong khung 3D
+        tk.Checkbutton(self.frame_left, text="Nhãn dạng bề mặt (mesh)", 
+                       bg="#2d2d2d", fg="white", selectcolor="#444", activebackground="#2d2d2d",
+                       variable=self.seg_mesh,
+                       command=self.action_toggle_seg_mesh).pack(anchor="w", padx=pad_x)
+        # Luu CT dang int16 (HU) - ap dung tu lan tai CT ke tiep
+        tk.Checkbutton(self.frame_left, text="Lưu CT dạng int16 (HU)", 
+                       bg="#2d2d2d", fg="white", selectcolor="#444", activebackground="#2d2d2d",
+                       variable=self.ct_int16,
+                       command=self.action_toggle_ct_int16).pack(anchor="w", padx=pad_x)
+        tk.Button(self.frame_left, text="Bộ nhớ ca hiện tại", bg="#444", fg="white", relief="flat",
+                  command=self.action_show_memory).pack(fill=tk.X, padx=pad_x, pady=(5, 0))
+        # Bang thong ke do tre tung thao tac (bat/tat luc dang chay)
+        frame_stats = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_stats.pack(fill=tk.X, padx=pad_x, pady=(5, 0))
+        tk.Checkbutton(frame_stats, text="Đo hiệu năng", 
+                       bg="#2d2d2d", fg="white", selectcolor="#444", activebackground="#2d2d2d",
+                       variable=self.instrument_on,
+                       command=self.action_toggle_instrument).pack(side=tk.LEFT)
+        tk.Button(frame_stats, text="Xuất", bg="#444", fg="white", relief="flat",
+                  command=self.action_dump_stats).pack(side=tk.RIGHT)
+        self.lbl_stats = tk.Label(self.frame_left, text="", fg="#aaa", bg="#2d2d2d", 
+                                  font=("Courier", 8), justify=tk.LEFT, anchor="w")
+        self.lbl_stats.pack(fill=tk.X, padx=pad_x)
         tk.Frame(self.frame_left, bg="#444", height=1).pack(fill=tk.X, padx=pad_x, pady=15)
         # VÙNG ĐIỀU KHIỂN (CONTROL)
         self.btn_close = tk.Button(self.frame_left, text="ĐÓNG CA VÀ RESET", 
@@ -101,6 +211,11 @@ class MedViewApp(tk.Tk):
         self.btn_close.pack(side=tk.BOTTOM, fill=tk.X, padx=pad_x, pady=20)
         self.lbl_status = tk.Label(self.frame_left, text="System Ready", fg="#666", bg="#2d2d2d", wraplength=200)
         self.lbl_status.pack(side=tk.BOTTOM, pady=5)
+        self.btn_cancel_load = tk.Button(self.frame_left, text="Hủy tải", 
+                             bg="#444", fg="white", font=("Arial", 9), relief="flat",
+                             state="disabled",
+                             command=self.action_cancel_load)
+        self.btn_cancel_load.pack(side=tk.BOTTOM, fill=tk.X, padx=pad_x)
 
     # Nhung cua so cua VTK vao trong TKinter
     def _init_vtk_embedded(self):
@@ -114,118 +229,537 @@ class MedViewApp(tk.Tk):
         window_id = self.frame_right.winfo_id()
         handle_str = "_{:x}_p_void".format(window_id)
         self.vtk_window.SetParentId(handle_str) 
-        self.vtk_window.Render()
+        with INSTRUMENTS.span("render.initial"):
+            self.vtk_window.Render()
         self.vtk_interactor.Initialize()
+        # Ve volume do phan giai thap trong luc xoay khung 3D
+        self.lod = InteractiveLOD(self.vtk_renderer)
+        self.lod.attach(self.vtk_interactor)
+        self.backend.lod = self.lod
+        # Moi yeu cau ve di qua scheduler: gop lai, toi da 1 lan ve / khung hinh
+        self.render_scheduler = RenderScheduler(self, self.vtk_window)
         self.frame_right.bind("<Configure>", self._on_resize)
 
     def _on_resize(self, event):
         if self.vtk_window:
             self.vtk_window.SetSize(event.width, event.height)
-            self.vtk_window.Render()
+            self.render_scheduler.request_render(interactive=True)
 
     def action_load_ct(self):
         file_path = filedialog.askopenfilename(title="Mở file Volume", filetypes=[("NIfTI", "*.nii;*.nii.gz")])
         if not file_path: return
+        if self.ct_job: self.ct_job.cancel()
         self.lbl_status.config(text="Loading CT...")
-        self.update()
+        self.ct_job = self.loader.submit("CT", self.backend.read_ct_volume, file_path,
+                                         on_done=self._on_ct_loaded,
+                                         on_progress=self._on_load_progress,
+                                         on_error=self._on_load_error,
+                                         on_cancel=self._on_load_cancelled)
+        # Cho phep tai overlay song song trong luc CT dang giai nen
+        self.btn_overlay.config(state="normal", bg="#E65100")
+        self.btn_cancel_load.config(state="normal")
+
+    def _on_ct_loaded(self, job, loaded):
+        if job is not self.ct_job: return # Ket qua cu da bi thay the
+        self.ct_job = None
+        self._update_cancel_button()
         try:
-            vol_ct = self.backend.load_ct_volume(file_path)
+            reopen_mpr = self._discard_mpr()
+            vol_ct = self.backend.attach_ct_volume(loaded)
+            self.backend.detach_label_meshes() # Cac actor cung bi go khoi renderer ngay duoi
+            self.lod.clear()
             self.vtk_renderer.RemoveAllViewProps()
             self.vtk_renderer.AddVolume(vol_ct)
+            self.lod.set_volume("ct", vol_ct, self.backend.get_ct_pyramid())
             self.vtk_renderer.ResetCamera()
-            self.btn_overlay.config(state="normal", bg="#E65100")
             self.btn_mpr.config(state="normal", bg="#388E3C")
             self.btn_close.config(state="normal")
-            self.lbl_status.config(text=f"Loaded: {os.path.basename(file_path)}")
-            self.vtk_window.Render()
+            self.lbl_status.config(text=f"Loaded: {os.path.basename(loaded.file_path)}")
+            self.render_scheduler.request_render()
             self.vtk_interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
             self.show_ct.set(True)
             self.show_seg.set(True)
+            if self.pending_seg is not None:
+                pending, self.pending_seg = self.pending_seg, None
+                self._align_overlay(pending)
+            if reopen_mpr:
+                self.action_toggle_mpr()
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
     def action_load_overlay(self):
         file_path = filedialog.askopenfilename(title="Open Segmentation", filetypes=[("NIfTI", "*.nii;*.nii.gz")])
         if not file_path: return
+        if self.seg_job: self.seg_job.cancel()
+        self.seg_job = self.loader.submit("Overlay", self.backend.read_segmentation, file_path,
+                                          on_done=self._on_seg_loaded,
+                                          on_progress=self._on_load_progress,
+                                          on_error=self._on_load_error,
+                                          on_cancel=self._on_load_cancelled)
+        self.btn_cancel_load.config(state="normal")
+
+    def _on_seg_loaded(self, job, loaded):
+        if job is not self.seg_job: return
+        self.seg_job = None
+        self._update_cancel_button()
+        if self.ct_job or not self.backend.get_raw_data():
+            self.pending_seg = loaded
+            self.lbl_status.config(text=f"Overlay ready, waiting for CT: {os.path.basename(loaded.file_path)}")
+            return
+        self._align_overlay(loaded)
+
+    def _align_overlay(self, loaded):
+        # Dua nhan ve luoi CT tren thread phu (lan dau voi moi cap CT/seg), xong moi gan vao mapper
+        ct_source = self.backend.ct_source
+        self.lbl_status.config(text="Aligning overlay to CT...")
+        self.seg_job = self.loader.submit("Align", 
+                                          lambda path, progress_callback=None, cancel_event=None:
+                                              self.backend.align_segmentation(loaded, ct_source, cancel_event=cancel_event),
+                                          loaded.file_path,
+                                          on_done=self._on_seg_aligned,
+                                          on_error=self._on_load_error,
+                                          on_cancel=self._on_load_cancelled)
+        self._update_cancel_button()
+
+    def _on_seg_aligned(self, job, aligned):
+        if job is not self.seg_job: return
+        self.seg_job = None
+        self._update_cancel_button()
+        self._attach_overlay(aligned)
+
+    def _attach_overlay(self, loaded):
         try:
-            vol_seg = self.backend.load_segmentation_overlay(file_path)
+            reopen_mpr = self._discard_mpr()
+            self._remove_label_meshes()
+            vol_seg = self.backend.attach_segmentation_overlay(loaded)
             self.vtk_renderer.AddVolume(vol_seg)
+            self.lod.set_volume("seg", vol_seg, self.backend.get_seg_pyramid())
             self.vtk_renderer.ResetCamera()
-            self.lbl_status.config(text=f"Overlay: {os.path.basename(file_path)}")
+            saved = self.backend.get_seg_saved_bytes()
+            self.lbl_status.config(text=f"Overlay: {os.path.basename(loaded.file_path)} (tiết kiệm {saved / 2**20:.0f} MB)")
             self.slider_liver.set(0.6)
             self.show_seg.set(True)
             self.chk_seg.config(state="normal")
-            self.vtk_window.Render()
+            self._refresh_label_list()
+            self._compute_label_stats()
+            self.render_scheduler.request_render()
+            if self.seg_mesh.get():
+                self._build_label_meshes()
+            if reopen_mpr:
+                self.action_toggle_mpr()
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+    def action_window_preset(self, name):
+        self.window_preset_name = name
+        window_level = self.backend.window_preset(name)
+        if window_level and self.mpr_viewer:
+            self.mpr_viewer.set_window_level(*window_level)
+            self.lbl_status.config(text=f"W/L {name}: {window_level[0]:.0f} / {window_level[1]:.0f}")
+
+    def action_toggle_seg_mesh(self):
+        if not self.backend.seg_source: return
+        if self.seg_mesh.get():
+            self._build_label_meshes()
+        else:
+            if self.mesh_job: self.mesh_job.cancel()
+            self.mesh_job = None
+            self._remove_label_meshes()
+            self._update_cancel_button()
+            self.render_scheduler.request_render()
+
+    def _build_label_meshes(self):
+        # Trich luoi tren thread phu (lan sau doc tu cache tren dia), xong moi thay volume nhan bang luoi
+        if self.mesh_job: self.mesh_job.cancel()
+        seg_source, ct_source = self.backend.seg_source, self.backend.ct_source
+        self.lbl_status.config(text="Building label meshes...")
+        self.mesh_job = self.loader.submit("Mesh", 
+                                           lambda path, progress_callback=None, cancel_event=None:
+                                               self.backend.build_label_meshes(seg_source, ct_source, cancel_event=cancel_event),
+                                           seg_source.file_path,
+                                           on_done=self._on_meshes_built,
+                                           on_error=self._on_load_error,
+                                           on_cancel=self._on_load_cancelled)
+        self._update_cancel_button()
+
+    def _on_meshes_built(self, job, meshes):
+        if job is not self.mesh_job: return
+        self.mesh_job = None
+        self._update_cancel_button()
+        if not self.seg_mesh.get() or not self.backend.seg_source: return
+        for actor in self.backend.attach_label_meshes(meshes):
+            self.vtk_renderer.AddActor(actor)
+        # Volume nhan khong con can trong khung 3D (MPR van dung LUT 2D)
+        self.lod.remove_volume("seg")
+        self.vtk_renderer.RemoveVolume(self.backend.volume_seg)
+        triangles = sum(mesh.GetNumberOfPolys() for mesh in meshes.values())
+        self.lbl_status.config(text=f"Mesh: {len(meshes)} nhãn, {triangles:,} tam giác")
+        self.render_scheduler.request_render()
+
+    def _remove_label_meshes(self):
+        actors = self.backend.detach_label_meshes()
+        for actor in actors:
+            self.vtk_renderer.RemoveActor(actor)
+        if actors and self.backend.seg_source:
+            vol_seg = self.backend.volume_seg
+            self.vtk_renderer.AddVolume(vol_seg)
+            self.lod.set_volume("seg", vol_seg, self.backend.get_seg_pyramid())
+
+    def action_open_worklist(self, csv_file=False):
+        if csv_file:
+            source = filedialog.askopenfilename(title="Worklist CSV (ct, seg)", filetypes=[("CSV", "*.csv")])
+        else:
+            source = filedialog.askdirectory(title="Thư mục ca (CT + segmentation)")
+        if not source: return
+        worklist = Worklist.from_source(source, self.backend)
+        if not len(worklist):
+            messagebox.showwarning("Worklist", "Không tìm thấy file NIfTI nào.")
+            return
+        if self.worklist: self.worklist.shutdown()
+        self.worklist = worklist
+        self._load_worklist_case(0)
+
+    def action_goto_case(self, step):
+        if not self.worklist: return
+        index = self.worklist.index + step
+        if 0 <= index < len(self.worklist):
+            self._load_worklist_case(index)
+
+    def _load_worklist_case(self, index):
+        for job in (self.ct_job, self.seg_job, self.mesh_job, self.stats_job):
+            if job: job.cancel()
+        self.seg_job = self.mesh_job = self.stats_job = None
+        self.pending_seg = None
+        worklist = self.worklist
+        ready = worklist.is_ready(index)
+        self.lbl_status.config(text=f"Loading case {worklist.name(index)}..." if not ready else "Swapping case...")
+        self.lbl_case.config(text=f"{index + 1}/{len(worklist)} {worklist.name(index)}")
+        self.ct_job = self.loader.submit("Case", lambda path, progress_callback=None, cancel_event=None:
+                                             worklist.load_case(index, cancel_event=cancel_event),
+                                         worklist.pairs[index][0],
+                                         on_done=self._on_case_loaded,
+                                         on_error=self._on_load_error,
+                                         on_cancel=self._on_load_cancelled)
+        self.btn_prev_case.config(state="normal" if index > 0 else "disabled")
+        self.btn_next_case.config(state="normal" if index + 1 < len(worklist) else "disabled")
+        self._update_cancel_button()
+
+    def _on_case_loaded(self, job, case):
+        # CT + nhan da giai nen/dua ve luoi CT tren thread nen -> chi con gan vao mapper
+        if job is not self.ct_job: return
+        ct, seg = case
+        with INSTRUMENTS.span("worklist.swap"):
+            reopen_mpr = self._discard_mpr() # Dong MPR mot lan cho ca CT lan overlay
+            self._on_ct_loaded(job, ct)
+            if seg is not None:
+                self.btn_overlay.config(state="normal", bg="#E65100")
+                self._attach_overlay(seg)
+            else:
+                self._detach_overlay() # Ca chi co CT: khong duoc giu nhan cua ca truoc
+            if reopen_mpr:
+                self.action_toggle_mpr()
+        self.lbl_status.config(text=f"Case {self.worklist.index + 1}/{len(self.worklist)}: {self.worklist.name()}")
+
+    def _detach_overlay(self):
+        for job in (self.seg_job, self.mesh_job, self.stats_job):
+            if job: job.cancel()
+        self.seg_job = self.mesh_job = self.stats_job = None
+        self.pending_seg = None
+        for actor in self.backend.detach_segmentation_overlay():
+            self.vtk_renderer.RemoveActor(actor)
+        self.vtk_renderer.RemoveVolume(self.backend.volume_seg)
+        self.lod.remove_volume("seg")
+        self.show_seg.set(False)
+        self.chk_seg.config(state="disabled")
+        self._refresh_label_list() # Bang nhan da bo -> danh sach, thong tin nhan ve rong
+        self._update_cancel_button()
+        self.render_scheduler.request_render()
+
+    def _on_load_progress(self, job, done, total):
+        self.lbl_status.config(text=f"Loading {job.name}: {done}/{total} slices")
+
+    def _on_load_error(self, job, error):
+        if job is self.ct_job: self.ct_job = None
+        if job is self.seg_job: self.seg_job = None
+        if job is self.mesh_job: self.mesh_job = None
+        if job is self.stats_job: self.stats_job = None
+        self._update_cancel_button()
+        self.lbl_status.config(text="System Ready")
+        messagebox.showerror("Error", str(error))
+
+    def _on_load_cancelled(self, job):
+        if job is self.ct_job: self.ct_job = None
+        if job is self.seg_job: self.seg_job = None
+        if job is self.mesh_job: self.mesh_job = None
+        self._update_cancel_button()
+        if not self.backend.get_raw_data() and not self.ct_job:
+            self.btn_overlay.config(state="disabled", bg="#444")
+        self.lbl_status.config(text=f"Đã hủy tải {job.name}")
+
+    def action_cancel_load(self):
+        for job in (self.ct_job, self.seg_job, self.mesh_job):
+            if job: job.cancel()
+        self.lbl_status.config(text="Cancelling...")
+
+    def _update_cancel_button(self):
+        state = "normal" if (self.ct_job or self.seg_job or self.mesh_job) else "disabled"
+        self.btn_cancel_load.config(state=state)
+
     def action_change_opacity(self, val):
         self.backend.set_opacity_factor(float(val))
-        self.vtk_window.Render()
+        self.render_scheduler.request_render(interactive=True)
 
     def action_change_liver_opacity(self, val):
         value = float(val)
         self.backend.set_liver_opacity(value)
         if self.is_mpr_active and self.mpr_viewer:
             self.mpr_viewer.update_liver_opacity(value)           
-        self.vtk_window.Render()
+        self.render_scheduler.request_render(interactive=True)
 
     def action_toggle_layer_visibility(self):
         var_show_ct = self.show_ct.get()
         var_show_seg = self.show_seg.get()
         self.backend.set_ct_visiblility(var_show_ct)
         self.backend.set_seg_visiblility(var_show_seg)
-        self.vtk_window.Render()
+        self.render_scheduler.request_render()
+
+    def _compute_label_stats(self):
+        # Mot luot thong ke tren thread phu; lan sau cung cap (CT, seg) lay lai tu cache
+        seg_source, ct_source = self.backend.seg_source, self.backend.ct_source
+        self.stats_job = self.loader.submit("Stats", 
+                                            lambda path, progress_callback=None, cancel_event=None:
+                                                self.backend.compute_label_stats(seg_source, ct_source),
+                                            seg_source.file_path,
+                                            on_done=self._on_label_stats,
+                                            on_error=self._on_load_error)
+
+    def _on_label_stats(self, job, stats):
+        if job is not self.stats_job: return
+        self.stats_job = None
+        self._refresh_label_list()
+
+    def _refresh_label_list(self):
+        selection = self.list_labels.curselection()
+        self.list_labels.delete(0, tk.END)
+        self.lbl_label_info.config(text="")
+        table = self.backend.get_label_table()
+        if not table: return
+        counts = self.backend.get_label_counts()
+        stats = self.backend.get_label_stats()
+        for label in table.labels():
+            mark = "●" if table.entries[label]["visible"] else "○"
+            entry = stats.get(label)
+            if entry:
+                text = f"{mark} Nhãn {label}  {entry['volume_ml']:.1f} mL"
+                if entry["mean_hu"] is not None:
+                    text += f"  HU {entry['mean_hu']:.0f}±{entry['std_hu']:.0f}"
+            else:
+                text = f"{mark} Nhãn {label}  ({counts.get(label, 0)} voxel)"
+            self.list_labels.insert(tk.END, text)
+        if selection and selection[0] < self.list_labels.size():
+            self.list_labels.selection_set(selection[0])
+            self._show_label_details()
+
+    def _show_label_details(self):
+        label = self._selected_label()
+        entry = self.backend.get_label_stats().get(label) if label is not None else None
+        if not entry:
+            self.lbl_label_info.config(text="")
+            return
+        x, y, z = entry["centroid"]
+        x0, x1, y0, y1, z0, z1 = entry["bbox"]
+        self.lbl_label_info.config(text=f"{entry['count']:,} voxel, tâm ({x:.0f}, {y:.0f}, {z:.0f})\n"
+                                        f"hộp [{x0}-{x1}, {y0}-{y1}, {z0}-{z1}]")
+
+    def _selected_label(self):
+        table = self.backend.get_label_table()
+        selection = self.list_labels.curselection()
+        if not table or not selection: return None
+        return table.labels()[selection[0]]
+
+    def action_toggle_label(self):
+        label = self._selected_label()
+        if label is None: return
+        index = self.list_labels.curselection()[0]
+        visible = not self.backend.get_label_table().entries[label]["visible"]
+        self.backend.set_label_visible(label, visible)
+        self._refresh_label_list()
+        self.list_labels.selection_set(index)
+        self.render_scheduler.request_render()
+
+    def action_recolor_label(self):
+        label = self._selected_label()
+        if label is None: return
+        r, g, b = self.backend.get_label_table().entries[label]["color"]
+        initial = "#{:02x}{:02x}{:02x}".format(int(r * 255), int(g * 255), int(b * 255))
+        rgb, _ = colorchooser.askcolor(color=initial, title=f"Màu nhãn {label}")
+        if not rgb: return
+        self.backend.set_label_color(label, rgb[0] / 255.0, rgb[1] / 255.0, rgb[2] / 255.0)
+        self.render_scheduler.request_render()
+
+    def action_toggle_roi(self):
+        self.backend.set_roi_cropping(self.crop_roi.get(), use_labels=self.crop_to_labels.get())
+        self.render_scheduler.cancel()
+        with INSTRUMENTS.span("render.roi"):
+            self.vtk_window.Render() # Ve ngay de do thoi gian ve
+        mode = "ROI" if self.crop_roi.get() else "Full"
+        self.lbl_status.config(text=f"{mode}: render {self.vtk_renderer.GetLastRenderTimeInSeconds() * 1000:.0f} ms")
 
     def action_toggle_mpr(self):
         try:
             if self.is_mpr_active:
                 if self.mpr_viewer:
-                    self.mpr_viewer.clear()
-                    self.vtk_window.RemoveRenderer(self.mpr_viewer.ren_axial)
-                    self.vtk_window.RemoveRenderer(self.mpr_viewer.ren_coronal)
-                    self.vtk_window.RemoveRenderer(self.mpr_viewer.ren_sagittal)
-                    self.mpr_viewer = None
-                self.vtk_renderer.SetViewport(0, 0, 1, 1)
+                    self.mpr_viewer.hide() # Giu lai lat cat/camera/LUT cho lan bat sau
                 self.btn_mpr.config(text="3. Xem dạng MPR (2D/3D)", bg="#444")
                 self.is_mpr_active = False
-                self.vtk_window.Render()
-                self.vtk_interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
+                self.render_scheduler.request_render()
             else:
                 raw_ct = self.backend.get_raw_data()
                 raw_seg = self.backend.get_segmentation_data()
                 if not raw_ct:
                     messagebox.showwarning("Warning", "Please load CT data first.")
                     return
-                current_liver_opacity = self.slider_liver.get()
-                self.mpr_viewer = MPRViewer(self.vtk_window, self.vtk_renderer, raw_ct, raw_seg, initial_opacity=current_liver_opacity)
+                if self.mpr_viewer:
+                    self.mpr_viewer.show()
+                else: # Chi dung MPR mot lan cho moi ca
+                    current_liver_opacity = self.slider_liver.get()
+                    self.mpr_viewer = MPRViewer(self.vtk_window, self.vtk_renderer, raw_ct, raw_seg, initial_opacity=current_liver_opacity,
+                                                render_callback=self.render_scheduler.request_render,
+                                                label_table=self.backend.get_label_table(),
+                                                window_level=self.backend.window_preset(self.window_preset_name),
+                                                scalar_range=self.backend.ct_value_range(),
+                                                hu_rescale=self.backend.ct_rescale(),
+                                                probe_callback=self._on_probe,
+                                                measure_callback=self._on_measure)
                 self.btn_mpr.config(text="Return to 3D Only", bg="#E65100")
                 self.is_mpr_active = True
-                self.vtk_window.Render()
+                self.render_scheduler.request_render()
         except Exception as e:
             import traceback
             print(traceback.format_exc())
             messagebox.showerror("MPR Error", str(e))
 
+    PROBE_INTERVAL_MS = 30
+
+    def _on_probe(self, sample):
+        # Goi moi su kien chuot; chi ghi mau moi nhat, nhan duoc cap nhat theo nhip -> luon hien mau cuoi
+        self._probe_sample = sample
+        if self._probe_after_id is None:
+            self._probe_after_id = self.after(self.PROBE_INTERVAL_MS, self._show_probe)
+
+    def _show_probe(self):
+        self._probe_after_id = None
+        sample = self._probe_sample
+        if sample is None:
+            self.lbl_probe.config(text="")
+            return
+        i, j, k = sample["index"]
+        self.lbl_probe.config(text=f"HU {sample['hu']:7.1f}  nhãn {sample['label']}\nvoxel ({i}, {j}, {k})")
+
+    def _on_measure(self, points, distance):
+        if distance is None:
+            x, y, z = points[-1]
+            self.lbl_measure.config(text=f"Điểm 1: ({x:.1f}, {y:.1f}, {z:.1f}) mm")
+        else:
+            self.lbl_measure.config(text=f"Khoảng cách: {distance:.1f} mm")
+
+    def _discard_mpr(self):
+        # Du lieu doi (CT/overlay moi) -> bo MPR cu. Tra ve True neu dang mo de mo lai
+        was_active = self.is_mpr_active
+        if was_active:
+            self.action_toggle_mpr()
+        if self._probe_after_id is not None:
+            self.after_cancel(self._probe_after_id)
+            self._probe_after_id = None
+        self.lbl_probe.config(text="")
+        self.lbl_measure.config(text="")
+        if self.mpr_viewer:
+            self.mpr_viewer.clear()
+            self.mpr_viewer = None
+        return was_active
+
+    def action_toggle_ct_int16(self):
+        self.backend.ct_int16 = self.ct_int16.get()
+
+    def action_show_memory(self):
+        report = memory_report(self.backend, self.mpr_viewer)
+        print(format_report(report))
+        messagebox.showinfo("Bộ nhớ", format_report(report))
+
+    def action_toggle_instrument(self):
+        INSTRUMENTS.set_enabled(self.instrument_on.get())
+        if self._stats_after_id is not None:
+            self.after_cancel(self._stats_after_id)
+        self._refresh_stats()
+
+    def _refresh_stats(self):
+        # Cap nhat bang moi giay khi dang do; tat thi dung vong after
+        self._stats_after_id = None
+        stats = INSTRUMENTS.snapshot()
+        top = sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:8]
+        lines = [f"{'op':18s}{'n':>5s}{'p50':>7s}{'p95':>7s}{'p99':>7s}"]
+        lines += [f"{name[:18]:18s}{row['count']:5d}{row['p50_ms']:7.1f}{row['p95_ms']:7.1f}{row['p99_ms']:7.1f}"
+                  for name, row in top]
+        self.lbl_stats.config(text="\n".join(lines) if top else "")
+        if INSTRUMENTS.enabled:
+            self._stats_after_id = self.after(1000, self._refresh_stats)
+
+    def action_dump_stats(self):
+        path = INSTRUMENTS.dump()
+        self.lbl_status.config(text=f"Stats: {path}" if path else "Chưa có số liệu đo")
+
     def action_close_case(self):
         if not messagebox.askyesno("Confirm", "Close current case and reset all data?"):
             return
         try:
-            if self.is_mpr_active:
-                self.action_toggle_mpr()
+            # Kiem tra giai phong (gc + malloc_trim) ton thoi gian -> chi chay khi dang bat do hieu nang
+            release = ReleaseCheck(self.backend, self.mpr_viewer) if INSTRUMENTS.enabled else None
+            self.loader.cancel_all()
+            self.ct_job = None
+            self.seg_job = None
+            self.mesh_job = None
+            self.stats_job = None
+            self.pending_seg = None
+            if self.worklist:
+                self.worklist.shutdown()
+                self.worklist = None
+                self.lbl_case.config(text="")
+                self.btn_prev_case.config(state="disabled")
+                self.btn_next_case.config(state="disabled")
+            self._update_cancel_button()
+            self._discard_mpr()
+            self.lod.clear()
             self.vtk_renderer.RemoveAllViewProps()
-            self.vtk_window.Render()
-            self.backend.reset()
+            self.render_scheduler.request_render()
+            self.backend.reset(self.vtk_window)
             self.btn_overlay.config(state="disabled", bg="#444")
             self.btn_mpr.config(state="disabled", bg="#444", text="3. Toggle MPR (2D/3D)")
             self.btn_close.config(state="disabled")
             self.slider.set(1.0)
             self.slider_liver.set(0.6)
-            self.lbl_status.config(text="System Ready")
+            self.list_labels.delete(0, tk.END)
+            if release is not None: self._report_release(release)
+            else: self.lbl_status.config(text="System Ready")
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+    def _report_release(self, release):
+        # Sau khi dong ca: moi bo dem cua ca phai da duoc giai phong (tru phan VolumeCache giu de mo lai)
+        leaked = release.leaked(keep=cached_buffers(self.backend.volume_cache))
+        for section, name, nbytes in leaked:
+            print(f"Chua giai phong: {section}/{name} ({nbytes / 2**20:.1f} MB)")
+        print(f"Dong ca: {release.tracked_bytes / 2**20:.1f} MB bo dem, "
+              f"RSS {release.rss_before / 2**20:.0f} -> {release.rss_after / 2**20:.0f} MB")
+        self.lbl_status.config(text="System Ready" if not leaked else f"System Ready ({len(leaked)} bộ đệm chưa giải phóng)")
+
     def on_close(self):
+        if self._stats_after_id is not None:
+            self.after_cancel(self._stats_after_id)
+        path = INSTRUMENTS.dump() # Ghi JSON/CSV neu da do duoc gi
+        if path: print(f"Instrumentation: {path}")
+        if self.worklist: self.worklist.shutdown()
+        self.loader.shutdown()
+        self.render_scheduler.cancel()
         self.vtk_interactor.TerminateApp()
         self.destroy()
 
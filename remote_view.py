@@ -0,0 +1,194 @@
+import tkinter as tk
+from tkinter import filedialog, messagebox
+import functools
+import os
+from backend.volume_io import load_volume
+from backend.alignment import resample_labels
+from backend.compact import compact_labels
+from backend.async_loader import AsyncVolumeLoader
+from backend.render_server import RenderClient, volume_geometry
+
+FRAME_POLL_MS = 15 # Chu ky lay anh moi tu tien trinh ve
+
+class RemoteViewApp(tk.Tk):
+    # Giao dien Tk mong: moi VTK Render()/Update() nam trong tien trinh ve rieng (backend/render_server.py).
+    # UI chi doc file, gui lenh nho qua hang doi va hien anh tra ve -> keo slider/resize khong bi dung khi dang ve
+    def __init__(self):
+        super().__init__()
+        self.title("MedView Pro - Render Server")
+        self.geometry("1280x720")
+        self.configure(bg="#1e1e1e")
+        self.client = RenderClient()
+        self.loader = AsyncVolumeLoader(self, on_status=lambda message: self.lbl_status.config(text=message))
+        self.ct_job = None
+        self.seg_job = None
+        self.ct_geometry = None # Luoi CT (khong voxel) de dua nhan ve luoi CT phia UI
+        self.is_mpr_active = False
+        self.drag_start = None
+        self.photo = None
+        self.frame_left = tk.Frame(self, bg="#2d2d2d", width=260)
+        self.frame_left.pack(side=tk.LEFT, fill=tk.Y)
+        self.view = tk.Label(self, bg="black", bd=0)
+        self.view.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        self._create_control_panel()
+        self.view.bind("<Configure>", self._on_resize)
+        self.view.bind("<ButtonPress-1>", self._on_drag_start)
+        self.view.bind("<B1-Motion>", self._on_drag)
+        self.view.bind("<MouseWheel>", lambda e: self._on_wheel(e, 1 if e.delta > 0 else -1))
+        self.view.bind("<Button-4>", lambda e: self._on_wheel(e, 1))
+        self.view.bind("<Button-5>", lambda e: self._on_wheel(e, -1))
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(FRAME_POLL_MS, self._poll_frames)
+
+    def _create_control_panel(self):
+        pad_x = 15
+        tk.Label(self.frame_left, text="LIVERLIZED", fg="#4CAF50", bg="#2d2d2d",
+                 font=("Segoe UI", 16, "bold")).pack(pady=(20, 30))
+        tk.Button(self.frame_left, text="1. Tải CT Volume", bg="#007ACC", fg="white", font=("Arial", 10),
+                  height=2, relief="flat", command=self.action_load_ct).pack(fill=tk.X, padx=pad_x, pady=5)
+        self.btn_overlay = tk.Button(self.frame_left, text="2. Tải Segmentation", bg="#444", fg="white",
+                                     font=("Arial", 10), height=2, relief="flat", state="disabled",
+                                     command=self.action_load_overlay)
+        self.btn_overlay.pack(fill=tk.X, padx=pad_x, pady=5)
+        self.btn_mpr = tk.Button(self.frame_left, text="3. Xem dạng MPR (2D/3D)", bg="#444", fg="white",
+                                 font=("Arial", 10), height=2, relief="flat", state="disabled",
+                                 command=self.action_toggle_mpr)
+        self.btn_mpr.pack(fill=tk.X, padx=pad_x, pady=5)
+        tk.Label(self.frame_left, text="Độ trong suốt CT:", fg="#ccc", bg="#2d2d2d").pack(anchor="w", padx=pad_x, pady=(10, 0))
+        self.slider = tk.Scale(self.frame_left, from_=0.1, to=5.0, resolution=0.1, orient=tk.HORIZONTAL,
+                               bg="#2d2d2d", fg="white", troughcolor="#444", highlightthickness=0,
+                               command=lambda v: self.client.send("set_opacity_factor", float(v)))
+        self.slider.set(1.0)
+        self.slider.pack(fill=tk.X, padx=pad_x, pady=5)
+        tk.Label(self.frame_left, text="Độ đậm Gan (Overlay):", fg="#ccc", bg="#2d2d2d").pack(anchor="w", padx=pad_x, pady=(10, 0))
+        self.slider_liver = tk.Scale(self.frame_left, from_=0.0, to=1.0, resolution=0.01, orient=tk.HORIZONTAL,
+                                     bg="#2d2d2d", fg="#4CAF50", troughcolor="#444", highlightthickness=0,
+                                     command=lambda v: self.client.send("set_liver_opacity", float(v)))
+        self.slider_liver.set(0.6)
+        self.slider_liver.pack(fill=tk.X, padx=pad_x, pady=5)
+        frame_presets = tk.Frame(self.frame_left, bg="#2d2d2d")
+        frame_presets.pack(fill=tk.X, padx=pad_x, pady=(5, 0))
+        for name, text in (("auto", "Auto"), ("abdomen", "Bụng"), ("liver", "Gan"), ("bone", "Xương")):
+            tk.Button(frame_presets, text=text, bg="#444", fg="white", relief="flat",
+                      command=lambda n=name: self.client.send("window_preset", n)).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
+        self.btn_close = tk.Button(self.frame_left, text="ĐÓNG CA VÀ RESET", bg="#D32F2F", fg="white",
+                                   font=("Arial", 10), height=2, relief="flat", state="disabled",
+                                   command=self.action_close_case)
+        self.btn_close.pack(side=tk.BOTTOM, fill=tk.X, padx=pad_x, pady=20)
+        self.lbl_status = tk.Label(self.frame_left, text="System Ready", fg="#666", bg="#2d2d2d", wraplength=200)
+        self.lbl_status.pack(side=tk.BOTTOM, pady=5)
+
+    def _poll_frames(self):
+        frame = self.client.poll()
+        if frame is not None:
+            width, height, pixels = frame
+            # PPM nhi phan: Tk doc thang, khong can PIL
+            self.photo = tk.PhotoImage(data=b"P6 %d %d 255\n" % (width, height) + pixels, format="PPM")
+            self.view.config(image=self.photo)
+        if self.client.errors:
+            errors, self.client.errors = self.client.errors, []
+            self._on_server_error(errors)
+        self.after(FRAME_POLL_MS, self._poll_frames)
+
+    def _on_server_error(self, errors):
+        # Loi trong tien trinh ve: hien dong cuoi cua traceback, ban day du trong hop chi tiet
+        if any(command == "load_ct" for command, _ in errors):
+            self.action_close_case() # Server khong co CT -> tra giao dien ve trang thai chua mo ca
+        command, details = errors[-1]
+        summary = details.strip().splitlines()[-1] if details.strip() else command
+        self.lbl_status.config(text=f"Render server error ({command}): {summary}")
+        messagebox.showerror("Render server error", f"{command}: {summary}", detail=details)
+
+    def _on_resize(self, event):
+        self.client.send("resize", event.width, event.height)
+
+    def _on_drag_start(self, event):
+        self.drag_start = (event.x, event.y)
+
+    def _on_drag(self, event):
+        if self.drag_start is None: return
+        x0, y0 = self.drag_start
+        self.drag_start = (event.x, event.y)
+        self.client.send("rotate", event.x - x0, event.y - y0)
+
+    def _on_wheel(self, event, direction):
+        if self.is_mpr_active:
+            step = 10 if event.state & 0x1 else 1 # Shift: 10 lat
+            self.client.send("scroll", event.x, event.y, direction, step)
+        else:
+            self.client.send("zoom", 1.1 if direction > 0 else 1 / 1.1)
+
+    def action_load_ct(self):
+        file_path = filedialog.askopenfilename(title="Mở file Volume", filetypes=[("NIfTI", "*.nii;*.nii.gz")])
+        if not file_path: return
+        if self.ct_job: self.ct_job.cancel()
+        self.lbl_status.config(text="Loading CT...")
+        self.ct_job = self.loader.submit("CT", functools.partial(load_volume, status_callback=self.loader.post_status),
+                                         file_path, on_done=self._on_ct_loaded,
+                                         on_progress=self._on_load_progress, on_error=self._on_load_error)
+
+    def _on_ct_loaded(self, job, loaded):
+        if job is not self.ct_job: return
+        self.ct_job = None
+        self.client.load_ct(loaded) # Chep voxel vao vung nho chung mot lan; ban trong UI bo ngay sau do
+        self.ct_geometry = volume_geometry(loaded)
+        self.is_mpr_active = False
+        self.btn_overlay.config(state="normal", bg="#E65100")
+        self.btn_mpr.config(state="normal", bg="#388E3C", text="3. Xem dạng MPR (2D/3D)")
+        self.btn_close.config(state="normal")
+        self.lbl_status.config(text=f"Loaded: {os.path.basename(loaded.file_path)}")
+
+    def action_load_overlay(self):
+        file_path = filedialog.askopenfilename(title="Open Segmentation", filetypes=[("NIfTI", "*.nii;*.nii.gz")])
+        if not file_path or self.ct_geometry is None: return
+        if self.seg_job: self.seg_job.cancel()
+        ct_geometry = self.ct_geometry
+
+        def read_aligned(path, progress_callback=None, cancel_event=None):
+            loaded = load_volume(path, progress_callback=progress_callback, cancel_event=cancel_event,
+                                 status_callback=self.loader.post_status)
+            return compact_labels(resample_labels(loaded, ct_geometry, cancel_event=cancel_event))
+
+        self.seg_job = self.loader.submit("Overlay", read_aligned, file_path, on_done=self._on_seg_loaded,
+                                          on_progress=self._on_load_progress, on_error=self._on_load_error)
+
+    def _on_seg_loaded(self, job, loaded):
+        if job is not self.seg_job: return
+        self.seg_job = None
+        self.client.load_seg(loaded)
+        self.client.send("set_liver_opacity", self.slider_liver.get())
+        self.lbl_status.config(text=f"Overlay: {os.path.basename(loaded.file_path)}")
+
+    def action_toggle_mpr(self):
+        self.is_mpr_active = not self.is_mpr_active
+        self.client.send("toggle_mpr", self.is_mpr_active)
+        self.btn_mpr.config(text="Về chế độ 3D" if self.is_mpr_active else "3. Xem dạng MPR (2D/3D)")
+
+    def action_close_case(self):
+        self.loader.cancel_all()
+        self.ct_job = self.seg_job = None
+        self.ct_geometry = None
+        self.is_mpr_active = False
+        self.client.send("close_case")
+        self.btn_overlay.config(state="disabled", bg="#444")
+        self.btn_mpr.config(state="disabled", bg="#444", text="3. Xem dạng MPR (2D/3D)")
+        self.btn_close.config(state="disabled")
+        self.lbl_status.config(text="System Ready")
+
+    def _on_load_progress(self, job, done, total):
+        self.lbl_status.config(text=f"Loading {job.name}: {done}/{total} slices")
+
+    def _on_load_error(self, job, error):
+        if job is self.ct_job: self.ct_job = None
+        if job is self.seg_job: self.seg_job = None
+        self.lbl_status.config(text="System Ready")
+        messagebox.showerror("Error", str(error))
+
+    def on_close(self):
+        self.loader.shutdown()
+        self.client.shutdown()
+        self.destroy()
+
+if __name__ == "__main__":
+    app = RemoteViewApp()
+    app.mainloop()
@@ -0,0 +1,64 @@
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import LoadedVolume, voxel_array
+from backend.alignment import resample_labels
+
+CT_SHAPE = (6, 20, 20) # (z, y, x)
+
+def matrix(array):
+    m = vtk.vtkMatrix4x4()
+    m.DeepCopy(tuple(np.asarray(array, dtype=float).ravel()))
+    return m
+
+def volume(voxels, qform=None, sform=None):
+    image = vtk.vtkImageData()
+    nz, ny, nx = voxels.shape
+    image.SetDimensions(nx, ny, nz)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=True))
+    return LoadedVolume("seg.nii", image, qform=qform, sform=sform)
+
+def translation(x, y, z):
+    m = np.eye(4)
+    m[:3, 3] = (x, y, z)
+    return m
+
+def labelled(shape, voxels):
+    # voxels: {(i, j, k): nhan}
+    array = np.zeros(shape, dtype=np.uint8)
+    for (i, j, k), label in voxels.items():
+        array[k, j, i] = label
+    return array
+
+def positions(loaded):
+    array = voxel_array(loaded.image)
+    return {(int(i), int(j), int(k)): int(array[k, j, i]) for k, j, i in zip(*np.nonzero(array))}
+
+def test_matching_grid_is_returned_unchanged():
+    ct = volume(np.zeros(CT_SHAPE, dtype=np.int16), qform=matrix(translation(5, 5, 5)))
+    seg = volume(labelled(CT_SHAPE, {(3, 4, 2): 1}), qform=matrix(translation(5, 5, 5)))
+    assert resample_labels(seg, ct) is seg
+
+def test_sform_shift_moves_labels():
+    ct = volume(np.zeros(CT_SHAPE, dtype=np.int16))
+    # seg voxel (i, j, k) nam o the gioi (i + 3, j - 2, k + 1); qform sai bi bo qua vi sform duoc uu tien
+    seg = volume(labelled(CT_SHAPE, {(5, 6, 2): 1, (0, 2, 0): 2, (19, 19, 5): 2}),
+                 qform=matrix(translation(50, 50, 50)), sform=matrix(translation(3, -2, 1)))
+    out = resample_labels(seg, ct)
+    # (19, 19, 5) roi ra ngoai luoi CT
+    assert positions(out) == {(8, 4, 3): 1, (3, 0, 1): 2}
+    assert out.image.GetDimensions() == (20, 20, 6)
+
+def test_qform_shift_on_a_smaller_grid():
+    ct = volume(np.zeros(CT_SHAPE, dtype=np.int16))
+    seg = volume(labelled((3, 8, 10), {(0, 0, 0): 1, (9, 7, 2): 2}), qform=matrix(translation(4, 6, 1)))
+    out = resample_labels(seg, ct)
+    assert positions(out) == {(4, 6, 1): 1, (13, 13, 3): 2}
+
+def test_rotation_by_90_degrees_about_z():
+    ct = volume(np.zeros(CT_SHAPE, dtype=np.int16))
+    # seg (i, j, k) -> the gioi (19 - j, i, k): xoay 90 do quanh truc z
+    rotation = np.array([[0, -1, 0, 19], [1, 0, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]])
+    seg = volume(labelled(CT_SHAPE, {(2, 5, 1): 1, (7, 0, 4): 2, (7, 1, 4): 2}), sform=matrix(rotation))
+    out = resample_labels(seg, ct, threads=2)
+    assert positions(out) == {(14, 2, 1): 1, (19, 7, 4): 2, (18, 7, 4): 2}
@@ -0,0 +1,40 @@
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from batch_render import render_case, DEFAULT_WINDOW, DEFAULT_LEVEL
+
+SIZE = (64, 64, 32)
+SLOPE, INTERCEPT = 0.5, -1024.0 # Voxel luu dang uint16 tho: HU = 0.5 * raw - 1024
+TISSUE_HU = 60.0
+
+def write_nifti(path, voxels, slope=1.0, intercept=0.0):
+    image = vtk.vtkImageData()
+    nz, ny, nx = voxels.shape
+    image.SetDimensions(nx, ny, nz)
+    image.SetSpacing(1.0, 1.0, 2.0)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=False))
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(image)
+    writer.SetRescaleSlope(slope)
+    writer.SetRescaleIntercept(intercept)
+    writer.SetFileName(path)
+    writer.Write()
+
+def read_png(path):
+    reader = vtk.vtkPNGReader()
+    reader.SetFileName(path)
+    reader.Update()
+    image = reader.GetOutput()
+    return numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(-1, image.GetNumberOfScalarComponents())
+
+def test_window_level_is_applied_in_hu_on_scaled_ct(tmp_path):
+    # Ca khoi mo deu TISSUE_HU: lat cat MPR phai co muc xam dung theo cua so HU, khong theo gia tri tho
+    nx, ny, nz = SIZE
+    raw = np.full((nz, ny, nx), (TISSUE_HU - INTERCEPT) / SLOPE, dtype=np.uint16)
+    ct_path = str(tmp_path / "scaled_ct.nii")
+    write_nifti(ct_path, raw, SLOPE, INTERCEPT)
+    name, _ = render_case(ct_path, None, str(tmp_path / "out"), size=128, at="center")
+    pixels = read_png(str(tmp_path / "out" / name / "axial.png"))[:, 0]
+    expected = 255.0 * (TISSUE_HU - (DEFAULT_LEVEL - 0.5 * DEFAULT_WINDOW)) / DEFAULT_WINDOW
+    # Lat cat chiem khoang nua khung (phan con lai la nen)
+    assert np.mean(np.abs(pixels.astype(float) - expected) <= 3) > 0.3
@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import load_volume, cache_path_for, prune_cache, voxel_array
+
+SHAPE = (16, 32, 32) # (z, y, x) int16 -> 32 KB voxel moi file cache
+
+def write_nifti_gz(path, value):
+    # File nen: khong mmap duoc nen load_volume phai di qua cache tren dia
+    voxels = np.full(SHAPE, value, dtype=np.int16)
+    image = vtk.vtkImageData()
+    image.SetDimensions(SHAPE[2], SHAPE[1], SHAPE[0])
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=False))
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(image)
+    writer.SetFileName(path)
+    writer.Write()
+    return path
+
+def set_age(path, seconds_ago):
+    stamp = os.path.getmtime(path) - seconds_ago
+    os.utime(path, (stamp, stamp))
+
+def test_cache_is_pruned_least_recently_used_first(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    paths = [write_nifti_gz(str(tmp_path / f"case{i}.nii.gz"), i) for i in range(3)]
+    load_volume(paths[0], cache_dir=cache_dir)
+    load_volume(paths[1], cache_dir=cache_dir)
+    entry_size = os.path.getsize(cache_path_for(cache_dir, paths[0]))
+    caches = [cache_path_for(cache_dir, p) for p in paths]
+    set_age(caches[0], 200)
+    set_age(caches[1], 100)
+    # Doc lai ca 0 tu cache -> thanh moi dung nhat, ca 1 moi la ca cu nhat
+    assert int(voxel_array(load_volume(paths[0], cache_dir=cache_dir).image)[0, 0, 0]) == 0
+    load_volume(paths[2], cache_dir=cache_dir, cache_budget=2 * entry_size)
+    assert os.path.exists(caches[0])
+    assert not os.path.exists(caches[1])
+    assert os.path.exists(caches[2]) # Ban vua ghi khong bao gio bi xoa
+
+def test_prune_keeps_total_within_budget(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    for i in range(4):
+        load_volume(write_nifti_gz(str(tmp_path / f"case{i}.nii.gz"), i), cache_dir=cache_dir)
+    sizes = [os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)]
+    freed = prune_cache(cache_dir, sum(sizes) // 2)
+    assert freed >= sum(sizes) - sum(sizes) // 2
+    assert sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)) <= sum(sizes) // 2
+
+def test_write_failure_is_reported_and_volume_still_loads(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("") # Thu muc cache la mot file -> khong tao duoc
+    messages = []
+    loaded = load_volume(write_nifti_gz(str(tmp_path / "case.nii.gz"), 7),
+                         cache_dir=str(blocker / "cache"), status_callback=messages.append)
+    assert int(voxel_array(loaded.image)[0, 0, 0]) == 7
+    assert len(messages) == 1 and "cache" in messages[0]
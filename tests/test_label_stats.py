@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import vtk
+from vtk.util import numpy_support
+from backend.volume_io import LoadedVolume
+from backend.label_stats import label_statistics
+
+SPACING = (0.5, 0.5, 2.0)
+ORIGIN = (10.0, 20.0, 30.0)
+SEG_OFFSET = (2, 1, 3) # Nhan da cat gon: extent bat dau tu (x, y, z) nay tren luoi CT
+SEG_SHAPE = (10, 6, 8) # (z, y, x)
+
+def image(voxels, offset=(0, 0, 0)):
+    result = vtk.vtkImageData()
+    nz, ny, nx = voxels.shape
+    result.SetExtent(offset[0], offset[0] + nx - 1, offset[1], offset[1] + ny - 1, offset[2], offset[2] + nz - 1)
+    result.SetSpacing(SPACING)
+    result.SetOrigin(ORIGIN)
+    result.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=True))
+    return result
+
+@pytest.fixture
+def case():
+    seg = np.zeros(SEG_SHAPE, dtype=np.uint8)
+    seg[0:6, 0:2, 1:3] = 1 # Khoi 2x2x6 cat qua nhieu khoi lat
+    for x, y, z in ((0, 0, 0), (4, 3, 8), (6, 2, 4)):
+        seg[z, y, x] = 2
+    seg[9, 5, 7] = 3
+    # CT day du (14 lat, 8 x 12), gia tri tho = chi so z tuyet doi; HU = 2 * tho - 100
+    ct = np.broadcast_to(np.arange(14, dtype=np.int16)[:, None, None], (14, 8, 12)).copy()
+    ct_loaded = LoadedVolume("ct.nii", image(ct), slope=2.0, intercept=-100.0)
+    return image(seg, SEG_OFFSET), ct_loaded
+
+@pytest.mark.parametrize("chunk_slices", [1, 4, 32])
+def test_statistics_of_hand_built_labels(case, chunk_slices):
+    seg_image, ct_loaded = case
+    stats = label_statistics(seg_image, ct_loaded, chunk_slices=chunk_slices, threads=2)
+    assert sorted(stats) == [1, 2, 3]
+    voxel_ml = SPACING[0] * SPACING[1] * SPACING[2] / 1000.0
+    ox, oy, oz = SEG_OFFSET
+
+    liver = stats[1]
+    assert liver["count"] == 24
+    assert liver["volume_ml"] == pytest.approx(24 * voxel_ml)
+    assert liver["bbox"] == (1 + ox, 2 + ox, 0 + oy, 1 + oy, 0 + oz, 5 + oz)
+    assert liver["centroid"] == pytest.approx((1.5 + ox, 0.5 + oy, 2.5 + oz))
+    assert liver["centroid_mm"] == pytest.approx(tuple(ORIGIN[a] + liver["centroid"][a] * SPACING[a] for a in range(3)))
+    hu = 2.0 * (np.arange(6) + oz) - 100.0 # 4 voxel moi lat
+    assert liver["mean_hu"] == pytest.approx(hu.mean())
+    assert liver["std_hu"] == pytest.approx(hu.std())
+
+    scattered = stats[2]
+    assert scattered["count"] == 3
+    assert scattered["bbox"] == (0 + ox, 6 + ox, 0 + oy, 3 + oy, 0 + oz, 8 + oz)
+    assert scattered["centroid"] == pytest.approx((10 / 3 + ox, 5 / 3 + oy, 4 + oz))
+
+    single = stats[3]
+    assert single["count"] == 1
+    assert single["bbox"] == (7 + ox, 7 + ox, 5 + oy, 5 + oy, 9 + oz, 9 + oz)
+    assert single["mean_hu"] == pytest.approx(2.0 * (9 + oz) - 100.0)
+    assert single["std_hu"] == pytest.approx(0.0)
+
+def test_statistics_without_ct(case):
+    seg_image, _ = case
+    stats = label_statistics(seg_image, chunk_slices=3)
+    assert stats[1]["count"] == 24 and stats[1]["mean_hu"] is None and stats[1]["std_hu"] is None
+
+def test_empty_segmentation():
+    assert label_statistics(image(np.zeros((4, 4, 4), dtype=np.uint8))) == {}
@@ -0,0 +1,49 @@
+import pytest
+import vtk
+from backend.lod import InteractiveLOD, VolumePyramid
+
+@pytest.fixture
+def scene():
+    vtk.vtkObject.GlobalWarningDisplayOff()
+    source = vtk.vtkRTAnalyticSource()
+    source.SetWholeExtent(0, 63, 0, 63, 0, 63)
+    source.Update()
+    image = source.GetOutput()
+    mapper = vtk.vtkSmartVolumeMapper()
+    mapper.SetInputData(image)
+    volume = vtk.vtkVolume()
+    volume.SetMapper(mapper)
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(64, 64)
+    renderer = vtk.vtkRenderer()
+    render_window.AddRenderer(renderer)
+    renderer.AddVolume(volume)
+    lod = InteractiveLOD(renderer)
+    lod.set_volume("ct", volume, VolumePyramid(image, 1))
+    yield render_window, lod, volume
+    render_window.Finalize()
+
+def render(render_window, interactive):
+    # Interactor style dat update rate cao khi dang xoay, tra ve "still" khi tha chuot
+    render_window.SetDesiredUpdateRate(15.0 if interactive else 0.0001)
+    render_window.Render()
+
+def test_hidden_volume_stays_hidden_after_interaction(scene):
+    render_window, lod, volume = scene
+    volume.VisibilityOff()
+    render(render_window, True)
+    render(render_window, False)
+    assert not volume.GetVisibility()
+
+def test_visibility_change_during_interaction_reaches_proxy(scene):
+    render_window, lod, volume = scene
+    render(render_window, True)
+    entry = lod.entries["ct"]
+    assert entry.active and entry.proxy.GetVisibility() and not volume.GetVisibility()
+    lod.set_visibility(volume, False)
+    assert not entry.proxy.GetVisibility()
+    render(render_window, False)
+    assert not volume.GetVisibility()
+    lod.set_visibility(volume, True)
+    assert volume.GetVisibility()
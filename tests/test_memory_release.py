@@ -0,0 +1,123 @@
+import os
+import numpy as np
+import pytest
+import vtk
+from vtk.util import numpy_support
+from backend.volume_cache import VolumeCache
+from backend.volume_renderer import VTKVolumeHelper
+from backend.handler import MPRViewer
+from backend.memory import ReleaseCheck, cached_buffers
+
+SIZE = (256, 256, 160) # CT int16 ~20 MB
+
+def write_nifti(path, voxels):
+    image = vtk.vtkImageData()
+    nz, ny, nx = voxels.shape
+    image.SetDimensions(nx, ny, nz)
+    image.SetSpacing(0.8, 0.8, 1.5)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=False))
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(image)
+    writer.SetFileName(path)
+    writer.Write()
+
+@pytest.fixture(scope="module")
+def case_files(tmp_path_factory):
+    # CT gia lap: than mem + khoi gan (nhan 1) + u (nhan 2)
+    folder = str(tmp_path_factory.mktemp("case"))
+    nx, ny, nz = SIZE
+    z, y, x = np.ogrid[-1:1:nz * 1j, -1:1:ny * 1j, -1:1:nx * 1j]
+    liver = ((x + 0.3) / 0.35) ** 2 + ((y + 0.1) / 0.3) ** 2 + (z / 0.6) ** 2 <= 1.0
+    tumour = (x + 0.35) ** 2 + (y + 0.1) ** 2 + z ** 2 <= 0.1 ** 2
+    body = (x / 0.85) ** 2 + (y / 0.65) ** 2 <= 1.0
+    ct = np.repeat(np.where(body, 40, -1000).astype(np.int16), nz, axis=0)
+    ct[liver] = 60
+    ct[tumour] = 90
+    seg = np.zeros((nz, ny, nx), dtype=np.uint8)
+    seg[liver] = 1
+    seg[tumour] = 2
+    ct_path, seg_path = os.path.join(folder, "ct.nii"), os.path.join(folder, "seg.nii")
+    write_nifti(ct_path, ct)
+    write_nifti(seg_path, seg)
+    return ct_path, seg_path
+
+@pytest.fixture
+def window():
+    vtk.vtkObject.GlobalWarningDisplayOff()
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(400, 300)
+    interactor = vtk.vtkRenderWindowInteractor() # MPRViewer gan interactor style
+    interactor.SetRenderWindow(render_window)
+    renderer = vtk.vtkRenderer()
+    render_window.AddRenderer(renderer)
+    render_window.Render()
+    yield render_window, renderer
+    render_window.Finalize()
+
+def open_case(helper, render_window, renderer, case_files):
+    # Giong luong cua MedViewApp: doc CT + overlay, gan vao mapper, bat MPR, ve
+    ct_path, seg_path = case_files
+    ct = helper.read_ct_volume(ct_path)
+    renderer.AddVolume(helper.attach_ct_volume(ct))
+    seg = helper.align_segmentation(helper.read_segmentation(seg_path), ct)
+    renderer.AddVolume(helper.attach_segmentation_overlay(seg))
+    del ct, seg
+    mpr = MPRViewer(render_window, renderer, helper.get_raw_data(), helper.get_segmentation_data(),
+                    label_table=helper.get_label_table())
+    for view in mpr.views:
+        view.set_slice(view.slice_index + 3)
+    render_window.Render()
+    return mpr
+
+def close_case(helper, render_window, renderer, mpr):
+    # Giong action_close_case
+    mpr.clear()
+    renderer.RemoveAllViewProps()
+    helper.reset(render_window)
+
+def test_close_releases_everything_without_cache(window, case_files):
+    render_window, renderer = window
+    helper = VTKVolumeHelper(cache_dir=None, volume_cache=VolumeCache(max_bytes=0))
+    mpr = open_case(helper, render_window, renderer, case_files)
+    release = ReleaseCheck(helper, mpr)
+    # Moi muc deu co bo dem duoc theo doi; CT int16 dem mot lan du xuat hien o reader lan mapper
+    tracked = {(section, name) for section, name, _, _ in release.refs.values()}
+    assert {("reader", "ct"), ("reader", "seg"), ("mpr", "axis2_ct_colors")} <= tracked
+    nx, ny, nz = SIZE
+    assert nx * ny * nz * 2 < release.tracked_bytes < nx * ny * nz * 8
+    owners = [ref for _, _, _, ref in release.refs.values() if hasattr(ref, "GetReferenceCount")]
+    assert all(owner.GetReferenceCount() > 1 for owner in owners) # Dang mo: ca con dung
+    close_case(helper, render_window, renderer, mpr)
+    del mpr
+    assert release.leaked() == []
+    assert release.refs == {} # leaked() tra lai tham chieu dang giu
+    # Sau khi dong chi con danh sach nay giu mang: khong ai khac tro vao
+    assert all(owner.GetReferenceCount() == 1 for owner in owners)
+
+def test_cached_volumes_are_not_reported(window, case_files):
+    render_window, renderer = window
+    helper = VTKVolumeHelper(cache_dir=None)
+    mpr = open_case(helper, render_window, renderer, case_files)
+    release = ReleaseCheck(helper, mpr)
+    close_case(helper, render_window, renderer, mpr)
+    del mpr
+    keep = cached_buffers(helper.volume_cache)
+    assert keep # CT + nhan da dua ve luoi CT con trong cache
+    assert release.leaked(keep=keep) == []
+
+def test_retained_buffer_is_reported(window, case_files):
+    render_window, renderer = window
+    helper = VTKVolumeHelper(cache_dir=None, volume_cache=VolumeCache(max_bytes=0))
+    mpr = open_case(helper, render_window, renderer, case_files)
+    release = ReleaseCheck(helper, mpr)
+    output = mpr.views[0].ct_colors.GetOutput() # Anh RGBA cua bo loc - vo Python chet nhung bo loc con song
+    colors = mpr.views[0].ct_colors
+    renderer.RemoveAllViewProps()
+    helper.reset(render_window)
+    del output
+    leaked = {(section, name) for section, name, _ in release.leaked()}
+    assert ("mpr", "axis2_ct_colors") in leaked
+    assert ("reader", "ct") in leaked # MPR chua clear() -> lat cat van tro vao volume CT
+    mpr.clear()
+    del colors
@@ -0,0 +1,36 @@
+import time
+import numpy as np
+import pytest
+import vtk
+from multiprocessing import shared_memory
+from vtk.util import numpy_support
+from backend.volume_io import LoadedVolume
+from backend.render_server import RenderClient, SharedVolume
+
+@pytest.fixture
+def client():
+    client = RenderClient(size=(64, 64))
+    yield client
+    client.shutdown()
+
+def small_volume():
+    image = vtk.vtkImageData()
+    image.SetDimensions(8, 8, 4)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(np.zeros(8 * 8 * 4, dtype=np.int16), deep=True))
+    return LoadedVolume("ct.nii", image)
+
+def test_failed_load_releases_shared_volume(client):
+    shared = SharedVolume(small_volume())
+    shared.descriptor["shape"] = (64, 64, 64) # Lon hon vung nho that -> server gan that bai
+    name = shared.shm.name
+    client.volumes[name] = shared
+    client.send("load_ct", shared.descriptor)
+    deadline = time.monotonic() + 60.0
+    while not client.errors and time.monotonic() < deadline:
+        client.poll()
+        time.sleep(0.05)
+    assert [command for command, _ in client.errors] == ["load_ct"]
+    assert "Traceback" in client.errors[0][1]
+    assert name not in client.volumes
+    with pytest.raises(FileNotFoundError): # Da unlink: khong con trong he thong
+        shared_memory.SharedMemory(name=name)
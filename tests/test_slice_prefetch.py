@@ -0,0 +1,60 @@
+import threading
+import time
+import numpy as np
+from backend.slice_cache import SliceCache, SlicePrefetcher, extract_plane
+
+class SlowView:
+    # Gia lap FusedSliceView: lat dau tien bi giu lai cho den khi test cho phep cat xong
+    def __init__(self):
+        self.voxels = np.zeros((20, 4, 4), dtype=np.int16)
+        self.cache = SliceCache()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+        self.errors = []
+
+    def get_max_slice(self):
+        return self.voxels.shape[0] - 1
+
+    def extract_planes(self, index):
+        self.calls.append(index)
+        self.started.set()
+        self.release.wait(5.0)
+        try:
+            return extract_plane(self.voxels, 2, index), None
+        except Exception as e:
+            self.errors.append(e)
+            raise
+
+def test_cancel_waits_for_the_slice_in_flight_and_drops_the_rest():
+    prefetcher = SlicePrefetcher(depth=8)
+    view = SlowView()
+    prefetcher.schedule(view, 0, 1)
+    assert view.started.wait(5.0)
+    done = threading.Event()
+
+    def remove():
+        prefetcher.cancel(view)
+        # Giong FusedSliceView.remove(): bo volume va xoa cache ngay sau cancel()
+        view.voxels = None
+        view.cache.clear()
+        done.set()
+
+    remover = threading.Thread(target=remove)
+    remover.start()
+    time.sleep(0.1)
+    assert not done.is_set() # Lat dang cat van doc volume -> chua duoc bo
+    view.release.set()
+    remover.join(5.0)
+    assert done.is_set()
+    time.sleep(0.1)
+    assert view.calls == [1] # Cac lat con lai khong duoc cat
+    assert view.errors == []
+    assert not view.cache.items()
+    prefetcher.shutdown()
+
+def test_cancel_of_idle_view_returns_immediately():
+    prefetcher = SlicePrefetcher()
+    view = SlowView()
+    prefetcher.cancel(view)
+    prefetcher.shutdown()